@@ -0,0 +1,32 @@
+#Precompiles the packaged Jinja2 templates into the build when DC_PRECOMPILE_TEMPLATES is set:
+#
+#   DC_PRECOMPILE_TEMPLATES=1 pip install .
+#
+#The rest of the configuration is in pyproject.toml
+
+import os
+import importlib.util
+
+from setuptools import setup
+from setuptools.command.build_py import build_py
+
+
+class build_py_precompile_templates(build_py):
+
+    def run(self):
+        super().run()
+
+        if os.environ.get("DC_PRECOMPILE_TEMPLATES","0") in ["","0"]:
+            return
+
+        #load the module on its own, the package imports dependencies that aren't needed to build
+        spec = importlib.util.spec_from_file_location("dctemplates",os.path.join("src","mdedevicecontrol","dctemplates.py"))
+        dctemplates = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(dctemplates)
+
+        package_path = os.path.join(self.build_lib,"mdedevicecontrol")
+        dctemplates.Templates.precompile(os.path.join(package_path,"templates"),
+                                         os.path.join(package_path,"templates_compiled"))
+
+
+setup(cmdclass={"build_py": build_py_precompile_templates})
@@ -2,7 +2,7 @@
 
 
 
-__all__ = ['convert_dc_policy','dcdoc','dcgraph','dcintune']
+__all__ = ['convert_dc_policy','dcanalysis','dcbatch','dcdoc','dcengine','dcgraph','dcintune','dcreplay']
 
 
 
@@ -15,6 +15,7 @@ import copy
 import os
 import urllib.parse
 import pathlib
+import sys
 import xml.etree.ElementTree as ET
 from json import JSONEncoder
 import uuid
@@ -22,7 +23,6 @@ import pandas
 
 import logging
 
-import jinja2
 logger = logging.getLogger(__name__)
 
 class Util:
@@ -41,11 +41,92 @@ class Util:
             out = str(out).replace("\"","&quot;")
             return out
 
+    #Strings that are repeated across groups and rules (e.g. descriptor values, match types and
+    #masks) are interned so they are only stored once
+    def intern(text):
+        if isinstance(text, str):
+            return sys.intern(text)
+        return text
+
     # from  https://stackoverflow.com/questions/2556108/rreplace-how-to-replace-the-last-occurrence-of-an-expression-in-a-string
     def rreplace(s, old, new, occurrence):
         li = s.rsplit(old, occurrence)
         return new.join(li)
 
+class Shared:
+
+    #Group types, group properties, enforcements, notification options and entry types are
+    #shared by all of the groups and rules.  They are pickled by the name of the class
+    #attribute that holds them, so they are still shared after being unpickled (e.g.
+    #when an inventory is loaded by several processes).
+
+    names = None
+
+    def get_name(obj):
+        if Shared.names is None:
+            names = {}
+            for value in list(globals().values()):
+                if isinstance(value, type) and value.__module__ == __name__:
+                    for attribute, shared in vars(value).items():
+                        if isinstance(shared, Shared) and id(shared) not in names:
+                            names[id(shared)] = value.__qualname__+"."+attribute
+            Shared.names = names
+
+        return Shared.names.get(id(obj))
+
+    def __reduce_ex__(self, protocol):
+        name = Shared.get_name(self)
+        if name is None:
+            return super().__reduce_ex__(protocol)
+        return name
+
+class Source:
+
+    #The source (xml element or json) of a group or rule.  The xml is pickled as text, which
+    #is smaller and faster to unpickle than the element tree, and is only parsed again when
+    #the root is used.
+
+    @property
+    def root(self):
+        if isinstance(self._root, bytes):
+            self._root = ET.fromstring(self._root)
+        return self._root
+
+    @root.setter
+    def root(self, root):
+        self._root = root
+
+    #Groups and rules use __slots__ to keep large inventories small, so the state is
+    #collected from the slots of the class and its bases (and the __dict__, if any).
+
+    __slots__ = ("_root",)
+
+    def get_slots(cls):
+        slots = []
+        for base in cls.__mro__:
+            for slot in base.__dict__.get("__slots__",()):
+                if slot != "__dict__" and slot not in slots:
+                    slots.append(slot)
+        return slots
+
+    def drop_source(self):
+        #The xml isn't used once it is parsed, the mac json is kept as it is written out by toJSON
+        if self.format != Format.Mac:
+            self._root = None
+
+    def __getstate__(self):
+        state = dict(getattr(self, "__dict__", {}))
+        for slot in Source.get_slots(type(self)):
+            if hasattr(self, slot):
+                state[slot] = getattr(self, slot)
+        if isinstance(state.get("_root"), ET.Element):
+            state["_root"] = ET.tostring(state["_root"])
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
 class DCJSONEncoder(JSONEncoder):
     def default(self, obj):
         try:
@@ -449,12 +530,13 @@ class Settings:
             settings_json = json["settings"]
 
             if "features" in settings_json:
-                features = Settings.default_features
+                #copied so the features of a policy don't change the defaults of the next ones
+                features = copy.deepcopy(Settings.default_features)
                 for features_key in settings_json["features"]:
                      features[features_key] = settings_json["features"][features_key]
                 settings_dict[Setting.SecuredDevicesConfiguration] = features
             else:
-                settings_dict[Setting.SecuredDevicesConfiguration] = Settings.default_features
+                settings_dict[Setting.SecuredDevicesConfiguration] = copy.deepcopy(Settings.default_features)
 
             if "global" in settings_json:
                 global_json = settings_json["global"]
@@ -568,23 +650,40 @@ class IntuneCustomRow:
 
 class Property:
 
+    #The name, label and allowed values are read from the shared group property
+
+    __slots__ = ("group_property", "value")
+
     def __init__(self, group_property, property_value):
-        self.name = group_property.name
+        self.group_property = group_property
 
-        self.allowed_values = group_property.allowed_values
         if self.allowed_values is not None and property_value not in self.allowed_values:
             raise Exception("Invalid value "+property_value+" for group property "+group_property.name)
-        self.value = property_value
-        self.label = group_property.label
+        self.value = Util.intern(property_value)
+
+    @property
+    def name(self):
+        return self.group_property.name
+
+    @property
+    def label(self):
+        return self.group_property.label
+
+    @property
+    def allowed_values(self):
+        return self.group_property.allowed_values
 
 class Clause:
 
+    __slots__ = ("_properties", "group_type", "clause_type", "sub_clauses", "sub_clause_type", "has_sub_clauses")
+
     def __init__(self,clause, group_type, clause_type = None):
         self._properties = []
         self.group_type = group_type
         self.clause_type = clause_type
         self.sub_clauses = []
         self.sub_clause_type = None
+        self.has_sub_clauses = False
 
         property = None
         value = None
@@ -609,7 +708,7 @@ class Clause:
                 logger.warn("Unknown Clause")
                 return
             
-class GroupProperty:
+class GroupProperty(Shared):
 
     #Reference to group
     WindowsGroupId = "GroupId"
@@ -699,14 +798,14 @@ class GroupProperty:
     properties_by_name = {}
 
     def __init__(self,name,label,description,allowed_values = None):
-        self.name = name
-        self.label = label
+        self.name = Util.intern(name)
+        self.label = Util.intern(label)
         self.description = description
         self.allowed_values = allowed_values
 
         GroupProperty.properties_by_name[name] = self
 
-class GroupType:
+class GroupType(Shared):
 
     
 
@@ -749,8 +848,10 @@ class MatchType:
 
     All = "MatchAll"
     Any = "MatchAny"
+    ExcludeAll = "MatchExcludeAll"
+    ExcludeAny = "MatchExcludeAny"
 
-class Group:
+class Group(Source):
 
     Types = {
         
@@ -1128,6 +1229,10 @@ class Group:
 
     
 
+    #__dict__ is kept for the metadata that is added to the groups of a package
+    __slots__ = ("format", "path", "_properties", "clauses", "group_type", "description",
+                 "id", "type", "name", "match_type", "__dict__")
+
     def __init__(self,root,format,path=None):
 
         self.format = format
@@ -1135,10 +1240,8 @@ class Group:
         self._properties = []
         self.clauses = []
         self.root = root
-        self.conditions = {}
 
         self.group_type = None
-        self.group_properties = {}
 
         self.description = ""
 
@@ -1146,7 +1249,7 @@ class Group:
 
             self.id = root.attrib["Id"]
             if "Type" in root.attrib.keys():
-                self.type = root.attrib["Type"]
+                self.type = Util.intern(root.attrib["Type"])
             else:
                 self.type = "Device"
 
@@ -1161,11 +1264,11 @@ class Group:
             match_node = root.find(".//MatchType")
             if match_node is None:
                 if "MatchType" in root.attrib.keys():
-                    self.match_type = root.attrib["MatchType"]
+                    self.match_type = Util.intern(root.attrib["MatchType"])
                 else:
                     self.match_type = "?"
             else:
-                self.match_type = match_node.text
+                self.match_type = Util.intern(match_node.text)
             
             descriptors = root.findall("./DescriptorIdList//")
             for descriptor in descriptors:
@@ -1188,7 +1291,6 @@ class Group:
                 
 
                 self._properties.append(Property(group_property, descriptor.text))
-                self.conditions[descriptor.tag] = descriptor.text
 
 
             
@@ -1216,8 +1318,6 @@ class Group:
                     for clause in clauses:
                         self.clauses.append(Clause(clause, self.group_type, self.match_type))
 
-                self.conditions = clauses
-
     
     def set_path(self,path):
         if path is not None:
@@ -1229,7 +1329,14 @@ class Group:
         return "./Vendor/MSFT/Defender/Configuration/DeviceControl/PolicyGroups/"+urllib.parse.quote_plus(self.id)+"/GroupData"
         
     def get_conditions(self):
-        return self.conditions
+        #mac groups (and their oma-uri copies) are described by the clauses of their query
+        if isinstance(self.root, dict):
+            return self.root.get("query",{}).get("clauses",{})
+
+        conditions = {}
+        for property in self._properties:
+            conditions[property.name] = property.value
+        return conditions
 
     def toXML(self,indent = "\t"):
 
@@ -1285,7 +1392,7 @@ class Group:
         hashList.sort()
         return hash(str(hashList))
 
-class Enforcement:
+class Enforcement(Shared):
 
     Allow = "allow"
     Deny = "deny"
@@ -1306,7 +1413,7 @@ class Enforcement:
     def __hash__(self):
         return hash(str(self))
     
-class PolicyRule:
+class PolicyRule(Source):
 
     def read_device_properties(device_properties_node,device_properties_list,groups_list):
         for device_property in device_properties_node:
@@ -1363,6 +1470,10 @@ class PolicyRule:
         Allow,Deny,AuditAllowed,AuditDenied
     ]
 
+    __slots__ = ("format", "path", "rule_index", "id", "name", "description",
+                 "included_device_properties", "included_groups", "excluded_groups",
+                 "excluded_device_properties", "entries", "entry_type")
+
 
     def __init__(self,root, format, path=None, rule_index = 1):
 
@@ -1517,7 +1628,7 @@ class PolicyRule:
             return self.toXML()
 
 
-class Option:
+class Option(Shared):
 
     def __init__(self,name,label,variations):
         self.name = name
@@ -1567,6 +1678,8 @@ class Notifications:
     })
 
 
+    __slots__ = ("notifications",)
+
     def __init__(self,options,format):
 
         self.notifications = []
@@ -1621,7 +1734,7 @@ class Notifications:
     def __next__(self):
         return self.notifications.__next__()
 
-class WindowsEntryType:
+class WindowsEntryType(Shared):
 
     DiskReadMask = 0x01
     DiskWriteMask = 0x02
@@ -1706,7 +1819,7 @@ class WindowsEntryType:
     def __str__(self):
         return self.label
 
-class MacEntryType:
+class MacEntryType(Shared):
 
     GenericRead = "generic_read"
     GenericWrite = "generic_write"
@@ -1898,6 +2011,11 @@ class Entry:
             
         print ("No enforcement for "+variation+" in format "+format)
 
+    __slots__ = ("entry_type", "format", "parameters", "sid", "computersid", "rule", "permissions",
+                 "id", "enforcement_type", "enforcement", "options_mask", "notifications", "options_text",
+                 "access_mask", "access_mask_text", "generic_windows_permissions",
+                 "generic_mac_permissions", "all_permissions", "access")
+
     def __init__(self,entry,format = "gpo"):
 
         self.entry_type = None
@@ -1924,16 +2042,16 @@ class Entry:
             
 
             self.id = entry.attrib["Id"]
-            self.enforcement_type = entry.find("./Type").text
+            self.enforcement_type = Util.intern(entry.find("./Type").text)
             self.enforcement = Entry.get_enforcement(self.enforcement_type,format)
             
             
-            self.options_mask = entry.find("./Options").text
+            self.options_mask = Util.intern(entry.find("./Options").text)
             
             self.notifications = Notifications(int(self.options_mask),format)
             self.options_text = str(self.notifications)
             
-            self.access_mask = entry.find("./AccessMask").text
+            self.access_mask = Util.intern(entry.find("./AccessMask").text)
             
             has_mixed_entry_type = False
 
@@ -1977,11 +2095,11 @@ class Entry:
             #        self.notifications.append(notification_masks[mask])
 
            
-            self.sid = Entry.getSID(entry)
+            self.sid = Util.intern(Entry.getSID(entry))
 
             computersid = entry.find("./ComputerSid")
             if computersid is not None:
-                self.computersid = computersid
+                self.computersid = Util.intern(computersid.text)
             else:
                 self.computersid = "All Computers"
 
@@ -2192,8 +2310,10 @@ class Entry:
         
 class Parameters:
 
+    __slots__ = ("match_type", "conditions")
+
     def __init__(self,parameters):
-        self.match_type = parameters.attrib['MatchType']
+        self.match_type = Util.intern(parameters.attrib['MatchType'])
         self.conditions = []
         for condition in parameters.findall("./"):
             match condition.tag:
@@ -2203,6 +2323,8 @@ class Parameters:
                     self.conditions.append(Condition(condition))
                 case "File":
                     self.conditions.append(Condition(condition))
+                case "PrintJob":
+                    self.conditions.append(Condition(condition))
                 case "Parameters":
                     self.conditions.append(Parameters(condition))
                 case other:
@@ -2230,15 +2352,16 @@ class Parameters:
 
 class Condition:
         
-    
+    __slots__ = ("match_type", "groups", "properties", "tag", "condition_type")
+
     def __init__(self,condition):
-        self.match_type = condition.attrib['MatchType']
+        self.match_type = Util.intern(condition.attrib['MatchType'])
         
 
         self.groups = []
         self.properties = []
 
-        self.tag = condition.tag
+        self.tag = Util.intern(condition.tag)
         self.condition_type = condition.tag
         self.read_condition_properties(condition.findall(".//"))
 
@@ -2326,7 +2449,6 @@ class Feature:
 
     def __init__(self, feature_data):
         self.feature_data = feature_data
-        self.support_data = {}
         entry_data = self.feature_data["entry"]
         if "access_masks" in entry_data.keys():
             entry_data["unsupported_access_masks"] = Feature.get_unsupported_dictionary(entry_data["access_masks"])
@@ -2341,11 +2463,9 @@ class Feature:
 
     def get_support_for(self,object):
 
-        if object.id in self.support_data.keys():
-            return self.support_data[object.id]
-        
+        #The support isn't cached by id, groups and rules in different files can have the same id
+        #and different values
         support = Support()
-        self.support_data[object.id] = support
 
         match object.__class__.__name__:
             case "Group":
@@ -2579,8 +2699,8 @@ class api:
 
         logger.debug("localpath="+path)
         logger.debug("Templates Path="+templates_path)
-        templateLoader = jinja2.FileSystemLoader(searchpath=templates_path)
-        self.templateEnv = jinja2.Environment(loader=templateLoader)
+        from mdedevicecontrol.dctemplates import Templates
+        self.templateEnv = Templates.get_environment(templates_path)
 
 
 
@@ -2668,6 +2788,10 @@ class api:
                 match_type_xml.text = MatchType.Any
             case MatchType.All:
                 match_type_xml.text = MatchType.All
+            case MatchType.ExcludeAny:
+                match_type_xml.text = MatchType.ExcludeAny
+            case MatchType.ExcludeAll:
+                match_type_xml.text = MatchType.ExcludeAll
             case _:
                 logger.warn("Unknown MatchType "+match_type)
         
@@ -2995,9 +3119,9 @@ class CommandLine:
         })
 
         #set up templat env
-        templates_path=os.path.join(pathlib.Path(__file__).parent,"templates")
-        templateLoader = jinja2.FileSystemLoader(templates_path)
-        CommandLine.templateEnv = jinja2.Environment(loader=templateLoader)
+        from mdedevicecontrol.dctemplates import Templates
+        templates_path=Templates.packaged_path
+        CommandLine.templateEnv = Templates.get_environment(templates_path)
         CommandLine.rule_template_name = config["templates"]["rule"]
         CommandLine.readme_template_name = config["templates"]["readme"]
         CommandLine.description_template_name = config["templates"]["description"]
@@ -3084,7 +3208,7 @@ class CommandLine:
 
             if args.file_input_format == "oma-uri":
 
-                inventory = Inventory(args.source_dir)
+                inventory = Inventory(args.source_dir,jobs=args.jobs)
                 
                 groups = []
                 rules = []
@@ -3339,6 +3463,7 @@ class CommandLine:
                          config["templates"]["readme"],
                          config["templates"]["description"],
                          policy_filter)
+        logger.info(graph.scheduler.report())
 
 
     async def apply(args,config):
@@ -3357,6 +3482,7 @@ class CommandLine:
         scopes=config["graph"]["scopes"]
         graph = await CommandLine.api.connectToGraph(authentication_type,scopes)
         result = await package.deploy(graph=graph)
+        logger.info(graph.scheduler.report())
 
 
         pass
@@ -3404,6 +3530,7 @@ class CommandLine:
         if confirm_delete:
             logger.info("Deleting")
             result = await package.delete(graph)
+            logger.info(graph.scheduler.report())
         else:
             logger.info("Aborting")
             return
@@ -3450,6 +3577,7 @@ def main():
 
     oma_uri_format = windows_format_arg_group.add_parser("oma-uri")
     oma_uri_format.add_argument("-s","--source",type=dir_path,dest="source_dir",required=True,default="src")
+    oma_uri_format.add_argument("-j","--jobs",type=int,dest="jobs",default=1,help="number of processes used to parse the source files")
 
     mac_arg_group = file_os_parser.add_parser("mac")
     mac_arg_group.add_argument("-p","--policy",dest="policy_file",required=True)
@@ -14,6 +14,31 @@ def log_warning(text, strict):
     else:
         logger.warn("\033[0;93m" + text + "\033[00m")
 
+def get_root_tag(source):
+    for event, element in ET.iterparse(source, events=("start",)):
+        return element.tag
+    return None
+
+def iterparse_children(source, root_tag = None):
+    # Streams a large xml file.  Yields the root element and each of its children as soon
+    # as the child is closed.  The child is then removed from the root, so only one child
+    # is in memory at a time rather than the whole file.
+    # If root_tag is given, the root is checked when it opens, even if it has no children.
+    root = None
+    depth = 0
+    for event, element in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            depth += 1
+            if depth == 1:
+                root = element
+                if root_tag is not None and root.tag != root_tag:
+                    raise Exception('Invalid ' + root_tag + ' XML')
+        else:
+            depth -= 1
+            if depth == 1:
+                yield root, element
+                root.remove(element)
+
 def convert_match_type(match_type, strict):
     match match_type:
         case 'MatchAny':
@@ -174,6 +199,24 @@ def convert_groups(root, strict):
     
     return groups
 
+def convert_groups_file(source, strict):
+    logger.info('Converting Groups...')
+
+    groups = []
+
+    for root, group in iterparse_children(source, "Groups"):
+        if group.tag != "Group":
+            log_warning(f"Unknown XML Element: {group.tag}", strict)
+            continue
+
+        converted_group = convert_group(group, strict)
+        if (converted_group is not None):
+            groups.append(converted_group)
+
+        group.clear()
+
+    return groups
+
 def convert_id_list(id_list, strict):
     groups = []
 
@@ -399,6 +442,24 @@ def convert_rules(root, strict):
 
     return rules
 
+def convert_rules_file(source, strict):
+    logger.info('Converting Rules...')
+
+    rules = []
+
+    for root, rule in iterparse_children(source, "PolicyRules"):
+        if rule.tag != "PolicyRule":
+            log_warning(f"Unknown XML Element: {rule.tag}", strict)
+            continue
+
+        converted_rule = convert_rule(rule, strict)
+        if (converted_rule is not None):
+            rules.append(converted_rule)
+
+        rule.clear()
+
+    return rules
+
 def main():
     import argparse
     import json
@@ -420,14 +481,12 @@ def main():
         converted_policy = {}
 
         if args.groups_file is not None:
-            groups_root = ET.fromstring(args.groups_file.read())
-            converted_policy["groups"] = convert_groups(groups_root, args.strict)
+            converted_policy["groups"] = convert_groups_file(args.groups_file, args.strict)
 
         if args.rules_file is not None:
-            rules_root = ET.fromstring(args.rules_file.read())
-            converted_policy["rules"] = convert_rules(rules_root, args.strict)
+            converted_policy["rules"] = convert_rules_file(args.rules_file, args.strict)
 
-        args.output_file.write(json.dumps(converted_policy, indent=2))
+        json.dump(converted_policy, args.output_file, indent=2)
     except Exception as e:
         log_error("Failed to convert policy:")
         log_error(str(e))
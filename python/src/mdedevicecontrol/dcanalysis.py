@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+
+#Static analysis of the policy rules of a package.
+#
+#The devices matched by a rule are described as a conjunction of clauses,
+#each clause being a set of descriptor values that are or-ed together.
+#
+#   MatchAny group       -> one clause with all of the descriptors
+#   MatchAll group       -> one clause per descriptor
+#   IncludedIdList       -> the clauses of all of the included groups
+#
+#Groups that can't be described this way (MatchExclude*, nested mac
+#clauses) are kept as an opaque value that only matches itself.
+
+import os
+import pathlib
+
+import pandas as pd
+
+from mdedevicecontrol import GroupProperty, MatchType, Format, WindowsEntryType
+from mdedevicecontrol.dcengine import Engine, Descriptor, Device, WildcardMatcher
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class Atom:
+
+    Opaque = "#group"
+
+    #A device has one value for these descriptors, so different values don't overlap
+    single_valued = [
+        GroupProperty.WindowsDeviceFamily,
+        GroupProperty.WindowsDeviceVendorProduct,
+        GroupProperty.WindowsDeviceVendor,
+        GroupProperty.WindowsDeviceProduct,
+        GroupProperty.WindowsDeviceSerialNumber,
+        GroupProperty.WindowsDeviceInstancePath,
+        GroupProperty.WindowsDeviceId,
+        GroupProperty.WindowsDeviceFriendlyName,
+        GroupProperty.WindowsDeviceBus,
+        GroupProperty.WindowsDeviceEncryptedState,
+        GroupProperty.MacDeviceFamily,
+        GroupProperty.MacVendorId,
+        GroupProperty.MacProductId,
+        GroupProperty.MacSerialNumber
+    ]
+
+    def create(name, value):
+        value = Descriptor.normalize(name, value)
+        return (name, value, Descriptor.has_wildcard(value))
+
+    def opaque(group_id):
+        return (Atom.Opaque, group_id, False)
+
+    def is_opaque(atom):
+        return atom[0] == Atom.Opaque
+
+    def get_device(atom):
+        return Device({atom[0]: atom[1]})
+
+    def is_contained(atom, other):
+        #every device matching atom also matches other
+        if atom == other:
+            return True
+        if Atom.is_opaque(atom) or Atom.is_opaque(other) or atom[2]:
+            return False
+
+        values = Atom.get_device(atom).get(other[0])
+        if other[2]:
+            regex = Descriptor.wildcard_to_regex(other[1])
+            for value in values:
+                if regex.fullmatch(value) is not None:
+                    return True
+            return False
+
+        return other[1] in values
+
+
+class Region:
+
+    def __init__(self, clauses):
+        self.clauses = clauses
+
+    def is_empty(self):
+        return self.clauses is None
+
+    def is_contained(self, other):
+        #every clause of the other region has to be implied by one of the clauses of this region
+        for other_clause in other.clauses:
+            implied = False
+            for clause in self.clauses:
+                if Region.is_clause_contained(clause, other_clause):
+                    implied = True
+                    break
+            if not implied:
+                return False
+        return True
+
+    def is_clause_contained(clause, other_clause):
+        for atom in clause:
+            contained = False
+            for other_atom in other_clause:
+                if Atom.is_contained(atom, other_atom):
+                    contained = True
+                    break
+            if not contained:
+                return False
+        return True
+
+    def is_disjoint(self, other):
+        #disjoint if the clauses on one single valued descriptor have no value in common
+        values = {}
+        for clause in self.clauses + other.clauses:
+            names = set([atom[0] for atom in clause])
+            if len(names) != 1:
+                continue
+            name = list(names)[0]
+            if name not in Atom.single_valued:
+                continue
+            if any([atom[2] for atom in clause]):
+                continue
+
+            clause_values = set([atom[1] for atom in clause])
+            if name in values:
+                values[name] = values[name] & clause_values
+            else:
+                values[name] = clause_values
+
+            if len(values[name]) == 0:
+                return True
+
+        return False
+
+    def get_atoms(self):
+        atoms = set()
+        for clause in self.clauses:
+            atoms.update(clause)
+        return atoms
+
+
+class Analysis:
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.group_clauses = {}
+
+        self.regions = []
+        self.excluded_regions = []
+        self.enforcements = []
+
+        for compiled_rule in engine.compiled_rules:
+            rule = compiled_rule.rule
+            self.regions.append(self.get_region(rule.included_device_properties))
+            self.excluded_regions.append([Region(self.get_property_clauses(property)) for property in rule.excluded_device_properties])
+
+            enforcements = {}
+            for mask in WindowsEntryType.access_masks:
+                entry = compiled_rule.get_decisive_entry(mask)
+                if entry is not None:
+                    enforcements[mask] = entry.enforcement
+            self.enforcements.append(enforcements)
+
+        self.build_index()
+
+    def get_group_clauses(self, group_id, visiting = None):
+
+        if group_id in self.group_clauses:
+            return self.group_clauses[group_id]
+
+        if visiting is None:
+            visiting = set()
+        if group_id in visiting or group_id not in self.engine.groups:
+            return [frozenset([Atom.opaque(group_id)])]
+        visiting.add(group_id)
+
+        group = self.engine.groups[group_id]
+        clauses = None
+
+        if group.format == Format.Mac:
+            properties = []
+            for clause in group.clauses:
+                if len(clause.sub_clauses) > 0:
+                    properties = None
+                    break
+                properties.extend(clause._properties)
+            if properties is not None:
+                clauses = self.get_properties_clauses(properties, group.match_type == "all", visiting)
+
+        elif group.match_type in [MatchType.All, MatchType.Any]:
+            clauses = self.get_properties_clauses(group._properties, group.match_type == MatchType.All, visiting)
+
+        if clauses is None:
+            clauses = [frozenset([Atom.opaque(group_id)])]
+
+        visiting.discard(group_id)
+        self.group_clauses[group_id] = clauses
+        return clauses
+
+    def get_properties_clauses(self, properties, require_all, visiting):
+
+        if require_all:
+            clauses = []
+            for property in properties:
+                clauses.extend(self.get_property_clauses(property, visiting))
+            return clauses
+
+        atoms = set()
+        for property in properties:
+            property_clauses = self.get_property_clauses(property, visiting)
+            if len(property_clauses) != 1:
+                return None
+            atoms.update(property_clauses[0])
+        return [frozenset(atoms)]
+
+    def get_property_clauses(self, property, visiting = None):
+        if property.name == GroupProperty.WindowsGroupId or property.name == GroupProperty.MacGroupId:
+            return self.get_group_clauses(property.value, visiting)
+        return [frozenset([Atom.create(property.name, property.value)])]
+
+    def get_region(self, properties):
+        if len(properties) == 0:
+            return Region(None)
+
+        clauses = []
+        for property in properties:
+            clauses.extend(self.get_property_clauses(property))
+        return Region(clauses)
+
+    def build_index(self):
+
+        #each rule is indexed by the atoms of its smallest clause, a rule that
+        #covers another rule has to have one of these atoms
+        self.index = {}
+        self.wildcards = {}
+
+        for i, region in enumerate(self.regions):
+            if region.is_empty():
+                continue
+
+            key_clause = min(region.clauses, key=len)
+            for atom in key_clause:
+                if atom[2]:
+                    if atom[0] not in self.wildcards:
+                        self.wildcards[atom[0]] = WildcardMatcher()
+                    self.wildcards[atom[0]].add(atom[1], i)
+
+                #wildcards are also indexed by their pattern, so rules with the same pattern are found
+                if atom not in self.index:
+                    self.index[atom] = set()
+                self.index[atom].add(i)
+
+    def get_candidates(self, i):
+
+        candidates = set()
+        for atom in self.regions[i].get_atoms():
+            if atom in self.index:
+                candidates.update(self.index[atom])
+
+            if atom[2] or Atom.is_opaque(atom):
+                continue
+
+            #the atom may be contained in an atom of a different descriptor (e.g. VID_PID in VID)
+            device = Atom.get_device(atom)
+            for name in device.descriptors:
+                for value in device.descriptors[name]:
+                    derived = (name, value, False)
+                    if derived != atom and derived in self.index:
+                        candidates.update(self.index[derived])
+                    if name in self.wildcards:
+                        candidates.update(self.wildcards[name].match(value))
+
+        candidates.discard(i)
+        return candidates
+
+    def covers(self, j, i):
+        #rule j matches every device that rule i matches
+        if not self.regions[i].is_contained(self.regions[j]):
+            return False
+
+        for excluded_region in self.excluded_regions[j]:
+            if not self.regions[i].is_disjoint(excluded_region):
+                return False
+
+        return True
+
+    def overlaps(self, j, i):
+        if self.regions[i].is_disjoint(self.regions[j]):
+            return False
+
+        for excluded_region in self.excluded_regions[j]:
+            if self.regions[i].is_contained(excluded_region):
+                return False
+        for excluded_region in self.excluded_regions[i]:
+            if self.regions[j].is_contained(excluded_region):
+                return False
+
+        return True
+
+    def get_rule(self, i):
+        return self.engine.compiled_rules[i].rule
+
+    def find_shadowed_rules(self):
+
+        rows = {
+            "ruleId": [],
+            "name": [],
+            "accessMask": [],
+            "shadowedBy": [],
+            "shadowedByName": [],
+            "fullyShadowed": []
+        }
+
+        for i, region in enumerate(self.regions):
+            if region.is_empty() or len(self.enforcements[i]) == 0:
+                continue
+
+            shadowed_mask = 0
+            shadowed_by = []
+            for j in sorted(self.get_candidates(i)):
+                if j > i:
+                    break
+                if not self.covers(j, i):
+                    continue
+
+                decided = 0
+                for mask in self.enforcements[i]:
+                    if mask in self.enforcements[j] and not mask & shadowed_mask:
+                        decided = decided | mask
+                if decided != 0:
+                    shadowed_mask = shadowed_mask | decided
+                    shadowed_by.append(j)
+
+            if shadowed_mask == 0:
+                continue
+
+            rule = self.get_rule(i)
+            rows["ruleId"].append(rule.id)
+            rows["name"].append(rule.name)
+            rows["accessMask"].append(shadowed_mask)
+            rows["shadowedBy"].append(",".join([self.get_rule(j).id for j in shadowed_by]))
+            rows["shadowedByName"].append(",".join([str(self.get_rule(j).name) for j in shadowed_by]))
+            rows["fullyShadowed"].append(shadowed_mask == sum(self.enforcements[i].keys()))
+
+        return pd.DataFrame(rows)
+
+    def find_conflicts(self):
+
+        rows = {
+            "ruleId": [],
+            "name": [],
+            "enforcement": [],
+            "conflictsWith": [],
+            "conflictsWithName": [],
+            "conflictingEnforcement": [],
+            "accessMask": []
+        }
+
+        #rules can overlap without having an atom in common (e.g. a vendor and a device family),
+        #so every earlier rule is a candidate.  The enforcements are compared first, as they are
+        #cheaper to compare than the regions.
+        for i, region in enumerate(self.regions):
+            if region.is_empty():
+                continue
+
+            for j in range(i):
+                if self.regions[j].is_empty():
+                    continue
+
+                masks = {}
+                for mask in self.enforcements[i]:
+                    if mask in self.enforcements[j] and self.enforcements[j][mask] != self.enforcements[i][mask]:
+                        key = (str(self.enforcements[i][mask]), str(self.enforcements[j][mask]))
+                        masks[key] = masks.get(key, 0) | mask
+
+                if len(masks) == 0 or not self.overlaps(j, i):
+                    continue
+
+                rule = self.get_rule(i)
+                other_rule = self.get_rule(j)
+                for enforcement, other_enforcement in masks:
+                    rows["ruleId"].append(rule.id)
+                    rows["name"].append(rule.name)
+                    rows["enforcement"].append(enforcement)
+                    rows["conflictsWith"].append(other_rule.id)
+                    rows["conflictsWithName"].append(other_rule.name)
+                    rows["conflictingEnforcement"].append(other_enforcement)
+                    rows["accessMask"].append(masks[(enforcement, other_enforcement)])
+
+        return pd.DataFrame(rows)
+
+    def generate_csv(self, dest):
+        self.find_shadowed_rules().to_csv(dest+os.sep+"dc_shadowed_rules.csv", sep=",", index=False)
+        self.find_conflicts().to_csv(dest+os.sep+"dc_rule_conflicts.csv", sep=",", index=False)
+
+        logger.info("Generated rule analysis in "+str(pathlib.Path(dest).resolve()))
+
+
+def analyze(inventory, dest, settings = None):
+    for os_name in [Engine.WINDOWS, Engine.MAC]:
+        engine = Engine.fromInventory(inventory, settings, os_name)
+        if len(engine.compiled_rules) == 0:
+            continue
+
+        analysis = Analysis(engine)
+        if os_name == Engine.WINDOWS:
+            analysis.generate_csv(dest)
+        else:
+            mac_dest = os.path.join(dest, "mac")
+            os.makedirs(mac_dest, exist_ok=True)
+            analysis.generate_csv(mac_dest)
@@ -0,0 +1,531 @@
+#!/usr/bin/env python3
+
+#Batch evaluation of a device inventory against a policy package.
+#
+#The device inventory is held as columns and every group and rule is
+#evaluated for all of the devices at once with vectorized operations.
+
+import os
+import pathlib
+import re
+
+import numpy as np
+import pandas as pd
+
+from mdedevicecontrol import GroupProperty, MatchType, Format, WindowsEntryType
+from mdedevicecontrol.dcengine import Engine, Descriptor, Decision
+
+import logging
+logger = logging.getLogger(__name__)
+
+#pandas needs pyarrow (or fastparquet) for parquet files, which isn't installed by default
+ParquetRequired = "Parquet files need pyarrow, install it with: pip install \"mdedevicecontrol[parquet]\" (or pip install pyarrow)"
+
+
+def parquet_required(e):
+    logger.error(ParquetRequired)
+    return ImportError(ParquetRequired+": "+str(e))
+
+
+class DeviceInventory:
+
+    descriptor_names = [
+        GroupProperty.WindowsDeviceFamily,
+        GroupProperty.WindowsDeviceFriendlyName,
+        GroupProperty.WindowsDeviceVendorProduct,
+        GroupProperty.WindowsDeviceVendor,
+        GroupProperty.WindowsDeviceProduct,
+        GroupProperty.WindowsDeviceInstancePath,
+        GroupProperty.WindowsDeviceId,
+        GroupProperty.WindowsDeviceHardwareId,
+        GroupProperty.WindowsDeviceBus,
+        GroupProperty.WindowsDeviceSerialNumber,
+        GroupProperty.WindowsDeviceEncryptedState,
+        GroupProperty.WindowsPrinterConnection,
+        GroupProperty.MacDeviceFamily,
+        GroupProperty.MacVendorId,
+        GroupProperty.MacProductId,
+        GroupProperty.MacSerialNumber,
+        GroupProperty.MacEncryption
+    ]
+
+    #Common column names in PnP exports
+    column_aliases = {
+        "FriendlyName": GroupProperty.WindowsDeviceFriendlyName,
+        "InstancePath": GroupProperty.WindowsDeviceInstancePath,
+        "DeviceInstanceId": GroupProperty.WindowsDeviceInstancePath,
+        "InstanceId": GroupProperty.WindowsDeviceInstancePath,
+        "HardwareIds": GroupProperty.WindowsDeviceHardwareId,
+        "SerialNumber": GroupProperty.WindowsDeviceSerialNumber,
+        "VendorId": GroupProperty.WindowsDeviceVendor,
+        "ProductId": GroupProperty.WindowsDeviceProduct,
+        "BusType": GroupProperty.WindowsDeviceBus
+    }
+
+    #Descriptors that can have more than one value for a device
+    multi_valued = {
+        GroupProperty.WindowsDeviceHardwareId: ";"
+    }
+
+    id_columns = ["DeviceName", "device", "id"]
+
+    def load(path):
+        p = pathlib.Path(path)
+        logger.info("Loading device inventory "+str(p))
+
+        if p.suffix.lower() == ".parquet":
+            try:
+                data_frame = pd.read_parquet(p)
+            except ImportError as e:
+                raise parquet_required(e) from e
+        else:
+            data_frame = pd.read_csv(p, dtype=str, keep_default_na=False)
+
+        return DeviceInventory(data_frame)
+
+    def __init__(self, data_frame):
+
+        self.size = len(data_frame.index)
+        self.positions = np.arange(self.size)
+
+        self.device_ids = None
+        for id_column in DeviceInventory.id_columns:
+            if id_column in data_frame.columns and id_column not in DeviceInventory.descriptor_names:
+                self.device_ids = data_frame[id_column].to_numpy()
+                break
+
+        #The values and the position of the device for each value
+        self.columns = {}
+
+        for column in data_frame.columns:
+            name = column
+            if name in DeviceInventory.column_aliases:
+                name = DeviceInventory.column_aliases[name]
+
+            if name not in DeviceInventory.descriptor_names or name in self.columns:
+                continue
+
+            self.set_column(name, data_frame[column])
+
+        self.derive_columns()
+
+        logger.debug("Loaded "+str(self.size)+" devices with descriptors "+str(list(self.columns.keys())))
+
+    def normalize(name, series):
+        series = series.fillna("").astype(str).str.strip().str.upper()
+        if name == GroupProperty.WindowsDeviceVendorProduct:
+            for separator in Descriptor.VendorProductSeparators:
+                series = series.str.replace(separator, Descriptor.VendorProductSeparators[separator], regex=False)
+        return series
+
+    def set_column(self, name, series):
+
+        series = pd.Series(series.to_numpy(), index=self.positions)
+
+        if name in DeviceInventory.multi_valued:
+            series = series.fillna("").astype(str).str.split(DeviceInventory.multi_valued[name]).explode()
+
+        series = DeviceInventory.normalize(name, series)
+        series = series[series != ""]
+
+        self.columns[name] = (series.reset_index(drop=True), series.index.to_numpy())
+
+    def has_column(self, name):
+        return name in self.columns
+
+    def derive_columns(self):
+
+        if self.has_column(GroupProperty.WindowsDeviceVendorProduct):
+            values, positions = self.columns[GroupProperty.WindowsDeviceVendorProduct]
+            parts = values.str.split("_", n=1, expand=True)
+            if len(parts.columns) == 2:
+                valid = parts[1].notna().to_numpy()
+                if not self.has_column(GroupProperty.WindowsDeviceVendor):
+                    self.columns[GroupProperty.WindowsDeviceVendor] = (parts[0][valid].reset_index(drop=True), positions[valid])
+                if not self.has_column(GroupProperty.WindowsDeviceProduct):
+                    self.columns[GroupProperty.WindowsDeviceProduct] = (parts[1][valid].reset_index(drop=True), positions[valid])
+
+        if self.has_column(GroupProperty.WindowsDeviceInstancePath) and not self.has_column(GroupProperty.WindowsDeviceId):
+            values, positions = self.columns[GroupProperty.WindowsDeviceInstancePath]
+            valid = values.str.contains("\\", regex=False).to_numpy()
+            device_ids = values[valid].str.rsplit("\\", n=1).str[0]
+            self.columns[GroupProperty.WindowsDeviceId] = (device_ids.reset_index(drop=True), positions[valid])
+
+    def to_mask(self, positions):
+        mask = np.zeros(self.size, dtype=bool)
+        mask[positions] = True
+        return mask
+
+    def match_values(self, name, values):
+        if not self.has_column(name):
+            return np.zeros(self.size, dtype=bool)
+
+        column, positions = self.columns[name]
+        hits = column.isin(values).to_numpy()
+        return self.to_mask(positions[hits])
+
+    def match_wildcard(self, name, pattern):
+        if not self.has_column(name):
+            return np.zeros(self.size, dtype=bool)
+
+        column, positions = self.columns[name]
+        regex = Descriptor.wildcard_to_regex(pattern)
+        hits = column.str.fullmatch(regex.pattern, flags=re.DOTALL).fillna(False).to_numpy(dtype=bool)
+        return self.to_mask(positions[hits])
+
+    def get_device_ids(self):
+        if self.device_ids is not None:
+            return self.device_ids
+        return self.positions
+
+
+class BatchEvaluator:
+
+    default_access_masks = list(WindowsEntryType.access_masks.keys())
+
+    def __init__(self, engine, devices):
+        self.engine = engine
+        self.devices = devices
+        self.group_masks = {}
+        self.wildcard_masks = {}
+        self.rule_masks = None
+
+        #the number of devices decided by each decision
+        self.decision_counts = []
+
+    def match_group(self, group_id):
+
+        if group_id in self.group_masks:
+            return self.group_masks[group_id]
+
+        #guard against groups that reference themselves
+        self.group_masks[group_id] = np.zeros(self.devices.size, dtype=bool)
+
+        if group_id in self.engine.groups:
+            group = self.engine.groups[group_id]
+            if group.format == Format.Mac:
+                mask = self.match_clauses(group.clauses, group.match_type)
+            elif Engine.is_indexed_group(group):
+                mask = self.match_properties(group._properties, False, group.id)
+            else:
+                mask = self.match_properties(group._properties, group.match_type in [MatchType.All, MatchType.ExcludeAll])
+                if group.match_type in [MatchType.ExcludeAll, MatchType.ExcludeAny]:
+                    mask = ~mask
+        else:
+            logger.warning("No group found for "+str(group_id))
+            mask = self.group_masks[group_id]
+
+        self.group_masks[group_id] = mask
+        return mask
+
+    def match_property(self, property):
+        if property.name == GroupProperty.WindowsGroupId or property.name == GroupProperty.MacGroupId:
+            return self.match_group(property.value)
+
+        pattern = Descriptor.normalize(property.name, property.value)
+        if Descriptor.has_wildcard(pattern):
+            return self.devices.match_wildcard(property.name, pattern)
+
+        return self.devices.match_values(property.name, [pattern])
+
+    def get_wildcard_mask(self, name, group_id):
+
+        #each distinct value of the descriptor is run once through the matcher of all the patterns
+        if name not in self.wildcard_masks:
+            hits = {}
+            if self.devices.has_column(name):
+                column, positions = self.devices.columns[name]
+                codes, values = pd.factorize(column)
+                matcher = self.engine.index.wildcards[name]
+
+                matched_codes = {}
+                for code, value in enumerate(values):
+                    for key in matcher.match(value):
+                        if key not in matched_codes:
+                            matched_codes[key] = []
+                        matched_codes[key].append(code)
+
+                for key in matched_codes:
+                    hits[key] = self.devices.to_mask(positions[np.isin(codes, matched_codes[key])])
+
+            self.wildcard_masks[name] = hits
+
+        hits = self.wildcard_masks[name]
+        if group_id in hits:
+            return hits[group_id]
+        return np.zeros(self.devices.size, dtype=bool)
+
+    def match_properties(self, properties, require_all, group_id = None):
+
+        if require_all:
+            masks = [self.match_property(property) for property in properties]
+            return BatchEvaluator.combine(masks, True, self.devices.size)
+
+        #any exact value of the same descriptor is checked with one lookup
+        masks = []
+        exact_values = {}
+        wildcard_names = set()
+        for property in properties:
+            pattern = Descriptor.normalize(property.name, property.value)
+            if property.name in [GroupProperty.WindowsGroupId, GroupProperty.MacGroupId]:
+                masks.append(self.match_property(property))
+            elif Descriptor.has_wildcard(pattern):
+                if group_id is not None and property.name in self.engine.index.wildcards:
+                    wildcard_names.add(property.name)
+                else:
+                    masks.append(self.match_property(property))
+            else:
+                if property.name not in exact_values:
+                    exact_values[property.name] = []
+                exact_values[property.name].append(pattern)
+
+        for name in exact_values:
+            masks.append(self.devices.match_values(name, exact_values[name]))
+
+        for name in wildcard_names:
+            masks.append(self.get_wildcard_mask(name, group_id))
+
+        return BatchEvaluator.combine(masks, False, self.devices.size)
+
+    def match_clauses(self, clauses, clause_type):
+        masks = []
+        for clause in clauses:
+            if len(clause.sub_clauses) > 0:
+                masks.append(self.match_clauses(clause.sub_clauses, clause.sub_clause_type))
+            for property in clause._properties:
+                masks.append(self.match_property(property))
+
+        return BatchEvaluator.combine(masks, clause_type == "all" or clause_type == "and", self.devices.size)
+
+    def combine(masks, require_all, size):
+        if len(masks) == 0:
+            return np.full(size, require_all, dtype=bool)
+        if require_all:
+            return np.logical_and.reduce(masks)
+        return np.logical_or.reduce(masks)
+
+    def match_rule(self, compiled_rule):
+        rule = compiled_rule.rule
+
+        if len(rule.included_device_properties) == 0:
+            return np.zeros(self.devices.size, dtype=bool)
+
+        included = [self.match_property(property) for property in rule.included_device_properties]
+        excluded = [self.match_property(property) for property in rule.excluded_device_properties]
+
+        mask = BatchEvaluator.combine(included, True, self.devices.size)
+        if len(excluded) > 0:
+            mask = mask & ~BatchEvaluator.combine(excluded, False, self.devices.size)
+        return mask
+
+    def get_rule_masks(self):
+        if self.rule_masks is None:
+            self.rule_masks = [self.match_rule(compiled_rule) for compiled_rule in self.engine.compiled_rules]
+        return self.rule_masks
+
+    def evaluate(self, access_masks = None):
+
+        if access_masks is None:
+            access_masks = BatchEvaluator.default_access_masks
+
+        rule_masks = self.get_rule_masks()
+        self.decision_counts = []
+
+        frames = []
+        for access_mask in access_masks:
+
+            #the last decision is the default enforcement
+            decisions = []
+            decision_index = np.full(self.devices.size, -1, dtype=np.int64)
+            undecided = np.ones(self.devices.size, dtype=bool)
+
+            for compiled_rule, rule_mask in zip(self.engine.compiled_rules, rule_masks):
+                decision = compiled_rule.get_decision(access_mask)
+                if decision is None:
+                    continue
+
+                hits = rule_mask & undecided
+                if not hits.any():
+                    continue
+
+                decision_index[hits] = len(decisions)
+                decisions.append(decision)
+                undecided &= ~hits
+
+            decision_index[undecided] = len(decisions)
+            decisions.append(Decision(access_mask, self.engine.default_enforcement))
+
+            counts = np.bincount(decision_index, minlength=len(decisions))
+            for decision, count in zip(decisions, counts):
+                self.decision_counts.append((decision, int(count)))
+
+            frames.append(BatchEvaluator.to_frame(self.devices.get_device_ids(), access_mask, decisions, decision_index))
+
+        return pd.concat(frames, ignore_index=True)
+
+    def to_frame(device_ids, access_mask, decisions, decision_index):
+
+        columns = {
+            "enforcement": [],
+            "rule_id": [],
+            "rule_name": [],
+            "entry_id": [],
+            "notifications": [],
+            "default": []
+        }
+
+        for decision in decisions:
+            columns["enforcement"].append(str(decision.enforcement))
+            columns["default"].append(decision.is_default())
+            columns["notifications"].append(",".join([notification.label for notification in decision.get_notifications()]))
+            if decision.is_default():
+                columns["rule_id"].append("")
+                columns["rule_name"].append("")
+                columns["entry_id"].append("")
+            else:
+                columns["rule_id"].append(decision.rule.id)
+                columns["rule_name"].append(decision.rule.name)
+                columns["entry_id"].append(decision.entry.id)
+
+        frame = {
+            "device": device_ids,
+            "access_mask": np.full(len(decision_index), access_mask),
+            "access_type": WindowsEntryType.access_masks[access_mask] if access_mask in WindowsEntryType.access_masks else str(access_mask)
+        }
+
+        for column in columns:
+            frame[column] = np.asarray(columns[column], dtype=object)[decision_index]
+
+        return pd.DataFrame(frame)
+
+    def write(decisions, path):
+        p = pathlib.Path(path)
+        if p.suffix.lower() == ".parquet":
+            try:
+                decisions.to_parquet(p, index=False)
+            except ImportError as e:
+                raise parquet_required(e) from e
+        else:
+            decisions.to_csv(p, index=False)
+
+        logger.info("Generated decisions "+str(p.resolve()))
+
+
+class Coverage:
+
+    #How many devices each group, rule and entry matches and how many decisions it wins
+
+    def __init__(self, evaluator):
+        self.evaluator = evaluator
+        if len(evaluator.decision_counts) == 0:
+            evaluator.evaluate()
+
+    def get_group_coverage(self):
+        rows = {
+            "groupId": [],
+            "name": [],
+            "type": [],
+            "matchedDevices": [],
+            "reached": []
+        }
+
+        for group_id in self.evaluator.engine.groups:
+            group = self.evaluator.engine.groups[group_id]
+            matched = int(self.evaluator.match_group(group_id).sum())
+            rows["groupId"].append(group_id)
+            rows["name"].append(group.name)
+            rows["type"].append(group.group_type.label if group.group_type is not None else "")
+            rows["matchedDevices"].append(matched)
+            rows["reached"].append(matched > 0)
+
+        return pd.DataFrame(rows)
+
+    def get_rule_coverage(self):
+        decisions = {}
+        for decision, count in self.evaluator.decision_counts:
+            if not decision.is_default():
+                decisions[decision.rule.id] = decisions.get(decision.rule.id, 0) + count
+
+        rows = {
+            "ruleId": [],
+            "name": [],
+            "matchedDevices": [],
+            "decisions": [],
+            "reached": []
+        }
+
+        for compiled_rule, rule_mask in zip(self.evaluator.engine.compiled_rules, self.evaluator.get_rule_masks()):
+            rule = compiled_rule.rule
+            rows["ruleId"].append(rule.id)
+            rows["name"].append(rule.name)
+            rows["matchedDevices"].append(int(rule_mask.sum()))
+            rows["decisions"].append(decisions.get(rule.id, 0))
+            rows["reached"].append(decisions.get(rule.id, 0) > 0)
+
+        default_decisions = 0
+        for decision, count in self.evaluator.decision_counts:
+            if decision.is_default():
+                default_decisions += count
+
+        rows["ruleId"].append("")
+        rows["name"].append("Default Enforcement")
+        rows["matchedDevices"].append(self.evaluator.devices.size)
+        rows["decisions"].append(default_decisions)
+        rows["reached"].append(default_decisions > 0)
+
+        return pd.DataFrame(rows)
+
+    def get_entry_coverage(self):
+        decisions = {}
+        audit_decisions = {}
+        for decision, count in self.evaluator.decision_counts:
+            if decision.is_default():
+                continue
+            key = (decision.rule.id, decision.entry.id)
+            decisions[key] = decisions.get(key, 0) + count
+            for audit_entry in decision.audit_entries:
+                key = (decision.rule.id, audit_entry.id)
+                audit_decisions[key] = audit_decisions.get(key, 0) + count
+
+        rows = {
+            "ruleId": [],
+            "entryId": [],
+            "enforcement": [],
+            "decisions": [],
+            "auditDecisions": [],
+            "reached": []
+        }
+
+        for compiled_rule in self.evaluator.engine.compiled_rules:
+            for compiled_entry in compiled_rule.entries:
+                key = (compiled_rule.rule.id, compiled_entry.entry.id)
+                rows["ruleId"].append(key[0])
+                rows["entryId"].append(key[1])
+                rows["enforcement"].append(str(compiled_entry.enforcement))
+                rows["decisions"].append(decisions.get(key, 0))
+                rows["auditDecisions"].append(audit_decisions.get(key, 0))
+                rows["reached"].append(decisions.get(key, 0) + audit_decisions.get(key, 0) > 0)
+
+        return pd.DataFrame(rows)
+
+    def generate_csv(self, dest):
+        self.get_group_coverage().to_csv(dest+os.sep+"dc_group_coverage.csv", sep=",", index=False)
+        self.get_rule_coverage().to_csv(dest+os.sep+"dc_rule_coverage.csv", sep=",", index=False)
+        self.get_entry_coverage().to_csv(dest+os.sep+"dc_entry_coverage.csv", sep=",", index=False)
+
+        logger.info("Generated coverage in "+str(pathlib.Path(dest).resolve()))
+
+
+def evaluate_devices(inventory, devices_file, out_file, settings = None, coverage_dest = None):
+
+    engine = Engine.fromInventory(inventory, settings)
+    devices = DeviceInventory.load(devices_file)
+
+    evaluator = BatchEvaluator(engine, devices)
+    decisions = evaluator.evaluate()
+    BatchEvaluator.write(decisions, out_file)
+
+    if coverage_dest is not None:
+        Coverage(evaluator).generate_csv(coverage_dest)
+
+    return decisions
@@ -4,13 +4,19 @@ import xml.etree.ElementTree as ET
 import argparse
 import os, sys
 import pandas as pd
-import jinja2
 import pathlib
 import copy
+import concurrent.futures
 import json
+import hashlib
+import pickle
+import re
+import ast
+import time
 
-from mdedevicecontrol import Group, PolicyRule, Entry, Settings, Setting, IntuneCustomRow, Support, IntuneUXFeature, WindowsFeature, WindowsEntryType, MacEntryType
+from mdedevicecontrol import Group, GroupProperty, PolicyRule, Entry, Settings, Setting, IntuneCustomRow, Support, IntuneUXFeature, WindowsFeature, WindowsEntryType, MacEntryType
 import mdedevicecontrol.convert_dc_policy as mac 
+from mdedevicecontrol.dctemplates import Templates
 
 import logging
 logger = logging.getLogger(__name__)
@@ -158,17 +164,283 @@ class Helper:
 
 
 
+class FrameBuffer:
+
+    #Accumulates the rows of a DataFrame as lists of column values.  The DataFrame
+    #is built once, the first time it is read after rows were added.
+
+    Missing = float("nan")
+
+    def __init__(self, columns):
+        self.empty_frame = pd.DataFrame(columns)
+        self.columns = {}
+        for column in columns:
+            self.columns[column] = []
+        self.size = 0
+        self.frame = None
+
+    def append(self, row):
+        for column in row:
+            if column not in self.columns:
+                self.columns[column] = [FrameBuffer.Missing]*self.size
+
+        for column in self.columns:
+            self.columns[column].append(row.get(column, FrameBuffer.Missing))
+
+        self.size = self.size + 1
+        self.frame = None
+
+    def get_frame(self):
+        if self.frame is None:
+            if self.size == 0:
+                self.frame = self.empty_frame
+            else:
+                #concat onto the empty frame so the columns have the same types as when the rows were added one at a time
+                self.frame = pd.concat([self.empty_frame,pd.DataFrame(self.columns)],ignore_index=True)
+        return self.frame
+
+    def __len__(self):
+        return self.size
+
+
+class ParseCache:
+
+    #Keeps the parsed groups and rules of each source file on disk, so only the files that
+    #changed are parsed again.  A file is unchanged if its size and mtime are the same, or
+    #if its SHA-256 hash is the same.
+    #
+    #The cache is stored in its own directory in the cache directory, in a directory per Version
+    #and per hash of the source of the object model and the parsers, so it is not used when
+    #they change.  Increment the Version to invalidate all of the existing caches.
+    #Only the directories created by the cache are removed, the rest of the cache directory
+    #is left alone.
+
+    Version = 1
+
+    Directory = "dcdoc-parse-cache"
+    VersionPattern = re.compile(r"v\d+_[0-9a-f]{16}")
+
+    def __init__(self, cache_dir):
+        version = "v"+str(ParseCache.Version)+"_"+ParseCache.get_model_hash()[:16]
+        self.root = os.path.join(cache_dir,ParseCache.Directory)
+        self.cache_dir = os.path.join(self.root,version)
+
+        #remove the caches of other versions
+        if os.path.isdir(self.root):
+            import shutil
+            for other_version in os.listdir(self.root):
+                if other_version != version and ParseCache.VersionPattern.fullmatch(other_version) is not None:
+                    logger.info("Removing outdated parse cache "+other_version)
+                    shutil.rmtree(os.path.join(self.root,other_version),ignore_errors=True)
+
+        os.makedirs(self.cache_dir,exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+
+    def get_model_hash():
+        #the parsed objects depend on the object model and on the parsers that create them
+        import mdedevicecontrol
+        model_hash = hashlib.sha256()
+        for module_file in [mdedevicecontrol.__file__,__file__,mac.__file__]:
+            model_hash.update(ParseCache.getSHA256Hash(module_file).encode())
+        return model_hash.hexdigest()
+
+    #Same hash as Package.getSHA256Hash(filename,"rb")
+    def getSHA256Hash(filename):
+        with open(filename,"rb") as file:
+            return hashlib.sha256(file.read()).hexdigest()
+
+    def get_entry_path(self, source_file):
+        key = hashlib.sha256(os.path.abspath(source_file).encode()).hexdigest()
+        return os.path.join(self.cache_dir,key+".pickle")
+
+    def get(self, source_file):
+
+        entry_path = self.get_entry_path(source_file)
+        if not os.path.exists(entry_path):
+            self.misses = self.misses + 1
+            return None
+
+        try:
+            with open(entry_path,"rb") as file:
+                entry = pickle.load(file)
+
+            stat = os.stat(source_file)
+            if entry["size"] != stat.st_size:
+                self.misses = self.misses + 1
+                return None
+
+            if entry["mtime"] != stat.st_mtime_ns:
+                #touched but maybe not changed
+                if entry["sha256"] != ParseCache.getSHA256Hash(source_file):
+                    self.misses = self.misses + 1
+                    return None
+                entry["mtime"] = stat.st_mtime_ns
+                self.write(entry_path,entry)
+
+            self.hits = self.hits + 1
+            return entry["parsed"]
+
+        except Exception as e:
+            logger.warning("Ignoring cache entry for "+str(source_file)+": "+str(e))
+            self.misses = self.misses + 1
+            return None
+
+    def put(self, source_file, parsed_file):
+        stat = os.stat(source_file)
+        entry = {
+            "path": str(source_file),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "sha256": ParseCache.getSHA256Hash(source_file),
+            "parsed": parsed_file
+        }
+        self.write(self.get_entry_path(source_file),entry)
+
+    def write(self, entry_path, entry):
+        #write to a temporary file first, so an interrupted run doesn't leave a partial entry
+        temp_path = entry_path+"."+str(os.getpid())+".tmp"
+        with open(temp_path,"wb") as file:
+            pickle.dump(entry,file)
+        os.replace(temp_path,entry_path)
+
+    def clear(cache_dir):
+        root = os.path.join(cache_dir,ParseCache.Directory)
+        if os.path.isdir(root):
+            import shutil
+            shutil.rmtree(root)
+
+
+class RuleQuery:
+
+    #Answers rule queries from indexes of the policy rules rather than evaluating a pandas
+    #expression on every rule.  Queries are made of terms joined with "and" (or "&"):
+    #
+    #   field == 'value'
+    #   field.str.contains('pattern') or field.str.contains('text',regex=False)
+    #
+    #where field is path, format, id or entry_type, or group == '{group id}' for the rules
+    #that reference a group.  Other queries aren't understood, and query returns None so the
+    #query can be evaluated by pandas.
+
+    Fields = ["path","format","id","entry_type","group"]
+
+    Literal = r"'(?:[^'\\]|\\.)*'" + r'|"(?:[^"\\]|\\.)*"'
+    Equals = re.compile(r"\s*\(?\s*(\w+)\s*==\s*("+Literal+r")\s*\)?\s*")
+    Contains = re.compile(r"\s*\(?\s*(\w+)\.str\.contains\(\s*("+Literal+r")\s*(?:,\s*regex\s*=\s*(True|False)\s*)?\)\s*\)?\s*")
+    And = re.compile(r"(?:and|&)")
+
+    def __init__(self, rules, columns):
+        self.size = len(rules)
+        self.index = {}
+        for field in RuleQuery.Fields:
+            self.index[field] = {}
+
+        for position in range(0,self.size):
+            for field in ["path","format","id","entry_type"]:
+                RuleQuery.add(self.index[field],columns[field][position],position)
+
+            rule = rules[position]
+            group_ids = list(rule.included_groups) + list(rule.excluded_groups)
+            for entry in rule.entries:
+                group_ids += entry.get_group_ids()
+            for group_id in group_ids:
+                RuleQuery.add(self.index["group"],group_id,position)
+
+    def add(index, value, position):
+        if value not in index:
+            index[value] = []
+        if len(index[value]) == 0 or index[value][-1] != position:
+            index[value].append(position)
+
+    def parse(query):
+
+        terms = []
+        position = 0
+        while True:
+            match = RuleQuery.Equals.match(query,position)
+            if match is not None:
+                terms.append((match.group(1),"==",ast.literal_eval(match.group(2)),None))
+            else:
+                match = RuleQuery.Contains.match(query,position)
+                if match is None:
+                    return None
+                terms.append((match.group(1),"contains",ast.literal_eval(match.group(2)),match.group(3) != "False"))
+
+            position = match.end()
+            if position == len(query):
+                break
+
+            match = RuleQuery.And.match(query,position)
+            if match is None:
+                return None
+            position = match.end()
+
+        for field, operator, value, regex in terms:
+            if field not in RuleQuery.Fields:
+                return None
+            if operator == "contains" and field == "group":
+                return None
+
+        return terms
+
+    def select(self, field, operator, value, regex = None):
+        index = self.index[field]
+        if operator == "==":
+            return set(index.get(value,[]))
+
+        positions = set()
+        for key in index:
+            if not isinstance(key,str):
+                continue
+            if regex:
+                found = re.search(value,key) is not None
+            else:
+                found = value in key
+            if found:
+                positions.update(index[key])
+        return positions
+
+    def query(self, query):
+        terms = RuleQuery.parse(query)
+        if terms is None:
+            return None
+
+        positions = None
+        for field, operator, value, regex in terms:
+            selected = self.select(field,operator,value,regex)
+            if positions is None:
+                positions = selected
+            else:
+                positions = positions & selected
+
+        #the positions are returned in inventory order, like a pandas query
+        return sorted(positions)
+
+
 class Inventory:
 
     
-    def __init__(self,source_path,generated_files_locations_by_format={},dest="."):
+    def __init__(self,source_path,generated_files_locations_by_format={},dest=".",jobs=1,cache=None,keep_source=True):
         self.paths = source_path
+        self.jobs = jobs
+        self.cache = cache
+        self.keep_source = keep_source
         self.generated_files_locations_by_format = generated_files_locations_by_format
         if self.generated_files_locations_by_format is None:
             self.generated_files_locations_by_format = {}
        
         self.dest_dir = dest
 
+        self.source_files = []
+        self.parsed_files = {}
+
+        self.create_buffers()
+        self.load_inventory()
+
+    def create_buffers(self):
+
         group_columns = {
             "type":[],
             "path":[],
@@ -230,16 +502,16 @@ class Inventory:
         }
 
 
-        self.groups = pd.DataFrame(group_columns)
-        self.policy_rules = pd.DataFrame(rule_columns)
-        self.rule_properties = pd.DataFrame(rule_property_columns)
+        self.group_buffer = FrameBuffer(group_columns)
+        self.policy_rule_buffer = FrameBuffer(rule_columns)
+        self.rule_property_buffer = FrameBuffer(rule_property_columns)
 
-        self.rule_entries = pd.DataFrame(rule_entry_columns)
-        self.entry_parameters = pd.DataFrame(entry_parameters_columns)
-        self.directory_object_conditions = pd.DataFrame(directory_object_condition_columns)
-        self.parameter_conditions = pd.DataFrame(parameter_condition_columns)
+        self.rule_entry_buffer = FrameBuffer(rule_entry_columns)
+        self.entry_parameter_buffer = FrameBuffer(entry_parameters_columns)
+        self.directory_object_condition_buffer = FrameBuffer(directory_object_condition_columns)
+        self.parameter_condition_buffer = FrameBuffer(parameter_condition_columns)
 
-        self.group_property_data_frames = {}
+        self.group_property_buffers = {}
         
 
         #Create the group properties tables
@@ -259,10 +531,10 @@ class Inventory:
             for group_property in group_properties:
                 group_property_columns[group_property.label] = []
 
-            self.group_property_data_frames[group_type.label]= pd.DataFrame(group_property_columns)
+            self.group_property_buffers[group_type.label]= FrameBuffer(group_property_columns)
 
        
-        self.entry_type_data_frames = {}
+        self.entry_type_buffers = {}
         for entry_type in Entry.AllEntryTypes:
 
             entry_type_columns = {
@@ -274,41 +546,181 @@ class Inventory:
                 label = entry_type.access_types[access_type]["label"]
                 entry_type_columns[label] = []
 
-            self.entry_type_data_frames[entry_type.label] = pd.DataFrame(entry_type_columns)
+            self.entry_type_buffers[entry_type.label] = FrameBuffer(entry_type_columns)
 
-        self.load_inventory()
+        self.groups_by_id = {}
+        self.rule_query = None
+
+    #The frames are built from the buffers when they are first read
+    @property
+    def groups(self):
+        return self.group_buffer.get_frame()
+
+    @property
+    def policy_rules(self):
+        return self.policy_rule_buffer.get_frame()
+
+    @property
+    def rule_properties(self):
+        return self.rule_property_buffer.get_frame()
+
+    @property
+    def rule_entries(self):
+        return self.rule_entry_buffer.get_frame()
+
+    @property
+    def entry_parameters(self):
+        return self.entry_parameter_buffer.get_frame()
+
+    @property
+    def directory_object_conditions(self):
+        return self.directory_object_condition_buffer.get_frame()
+
+    @property
+    def parameter_conditions(self):
+        return self.parameter_condition_buffer.get_frame()
+
+    @property
+    def group_property_data_frames(self):
+        frames = {}
+        for group_type_label in self.group_property_buffers:
+            frames[group_type_label] = self.group_property_buffers[group_type_label].get_frame()
+        return frames
+
+    @property
+    def entry_type_data_frames(self):
+        frames = {}
+        for entry_type_label in self.entry_type_buffers:
+            frames[entry_type_label] = self.entry_type_buffers[entry_type_label].get_frame()
+        return frames
 
         
 
     def load_inventory(self):
 
         logger.debug("paths="+str(self.paths))
+
+        source_files = self.get_source_files()
+
+        parsed_files = {}
+        if self.cache is not None:
+            for source_file in source_files:
+                parsed_file = self.cache.get(source_file)
+                if parsed_file is not None:
+                    parsed_files[source_file] = parsed_file
+
+        files_to_parse = [source_file for source_file in source_files if source_file not in parsed_files]
+        if self.cache is not None:
+            logger.debug("Parsing "+str(len(files_to_parse))+" of "+str(len(source_files))+" files, "+str(len(parsed_files))+" were cached")
+
+        if self.jobs > 1 and len(files_to_parse) > 1:
+
+            logger.debug("Parsing "+str(len(files_to_parse))+" files with "+str(self.jobs)+" processes")
+            chunk_size = max(1,len(files_to_parse) // (self.jobs*4))
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self.jobs) as executor:
+                for source_file, parsed_file in zip(files_to_parse,executor.map(Inventory.parse_file,files_to_parse,chunksize=chunk_size)):
+                    parsed_files[source_file] = parsed_file
+        else:
+            for source_file in files_to_parse:
+                parsed_files[source_file] = Inventory.parse_file(source_file)
+
+        if self.cache is not None:
+            for source_file in files_to_parse:
+                self.cache.put(source_file,parsed_files[source_file])
+
+        #the parsed files are kept, so the inventory can be reloaded when some of them change
+        self.source_files = source_files
+        self.parsed_files = parsed_files
+
+        #the files are added in the order they were found, so the inventory is the same however they were parsed
+        for source_file in source_files:
+            self.add_parsed_file(parsed_files[source_file])
+
+    def reload(self,changed_files):
+
+        #Only the changed (or new) files are parsed again, the tables are rebuilt from the
+        #objects of the other files.  Returns the groups and rules of the changed files,
+        #before and after the change.
+        changed_files = set(changed_files)
+        changed_objects = []
+        for source_file in changed_files:
+            if source_file in self.parsed_files:
+                changed_objects += self.parsed_files.pop(source_file)[0]
+
+        source_files = self.get_source_files(False)
+        for source_file in source_files:
+            if source_file in changed_files or source_file not in self.parsed_files:
+                parsed_file = Inventory.parse_file(source_file)
+                if self.cache is not None:
+                    self.cache.put(source_file,parsed_file)
+                self.parsed_files[source_file] = parsed_file
+                changed_objects += parsed_file[0]
+
+        for source_file in list(self.parsed_files.keys()):
+            if source_file not in source_files:
+                changed_objects += self.parsed_files.pop(source_file)[0]
+
+        self.source_files = source_files
+        self.create_buffers()
+        for source_file in source_files:
+            self.add_parsed_file(self.parsed_files[source_file])
+
+        return [object for kind, object, index in changed_objects]
+
+    def get_source_files(self, warn = True):
+
+        source_files = []
         for path in self.paths:
             logger.debug("path="+path)
             
-            if str(path).endswith(".xml"):
-                self.load_xml_file(path)
-            elif str(path).endswith(".json"):
-                self.load_json_file(path)
-
+            if str(path).endswith(".xml") or str(path).endswith(".json"):
+                source_files.append(path)
 
             for dir in os.walk(top=path):
                 logger.debug("dir="+str(dir))
                 files = dir[2]
                 for file in files:
                     logger.debug("Attempting to load file "+str(file))
-                    if str(file).endswith(".xml"):
-                        xml_path = dir[0]+os.sep+file
-                        self.load_xml_file(xml_path)
-                    elif str(file).endswith(".json"):
-                        json_path = dir[0]+os.sep+file
-                        self.load_json_file(json_path)
-                    else:
+                    if str(file).endswith(".xml") or str(file).endswith(".json"):
+                        source_files.append(dir[0]+os.sep+file)
+                    elif warn:
                         logger.warn("Unable to process file "+str(file))
 
-    
-    
+        return source_files
+
+    def add_parsed_file(self,parsed_file):
+
+        objects, error = parsed_file
+        for kind, object, index in objects:
+            if not self.keep_source:
+                object.drop_source()
+
+            if kind == "group":
+                self.addGroup(object,index)
+            else:
+                self.addPolicyRule(object)
+
+        if error is not None:
+            for message in error:
+                logger.error(message)
+
     def load_json_file(self,json_path):
+        self.add_parsed_file(Inventory.parse_json_file(json_path))
+
+    def load_xml_file(self,xml_path):
+        self.add_parsed_file(Inventory.parse_xml_file(xml_path))
+
+    #Parsing a file returns the (kind, object, index) of the groups and rules in the file, and
+    #the error to log if the file could not be parsed.  These are picklable so files can be
+    #parsed in other processes.
+    def parse_file(path):
+        if str(path).endswith(".xml"):
+            return Inventory.parse_xml_file(path)
+        else:
+            return Inventory.parse_json_file(path)
+
+    def parse_json_file(json_path):
+        objects = []
         try:
             with open(json_path) as file:
                 json_object = json.load(file)
@@ -316,62 +728,72 @@ class Inventory:
                 if "groups" in json_object.keys():
                     group_index = 1
                     for group in json_object["groups"]:
-                        self.addGroup(Group(group,"mac",json_path),group_index)
+                        objects.append(("group",Group(group,"mac",json_path),group_index))
                         group_index=group_index+1
 
                 if "rules" in json_object.keys():
                     rule_index = 1
                     for rule in json_object["rules"]:
-                        self.addPolicyRule(PolicyRule(rule,"mac",json_path,rule_index))
+                        objects.append(("rule",PolicyRule(rule,"mac",json_path,rule_index),rule_index))
 
-            return
+            return objects, None
         except Exception as e:
-            logger.error(full_stack())
-            logger.error ("Error in "+json_path+": "+str(e))
-            return
+            return objects, [full_stack(),"Error in "+json_path+": "+str(e)]
     
-    def load_xml_file(self,xml_path):
+    def parse_xml_file(xml_path):
         logger.debug("xml_path="+xml_path)
+        objects = []
         try:
-            with open(xml_path) as file:
-                root = ET.fromstring(file.read())
-                match root.tag:
-                    case "Group":
-                        logger.debug("Found <Group> in "+xml_path)
-                        self.addGroup(Group(root,"oma-uri",xml_path))
-                    case "Groups":
-                        group_index = 1
-                        for group in root.findall(".//Group"):
-                            logger.debug("Found <Groups><Group> in "+xml_path)
-                            self.addGroup(Group(group,"gpo",xml_path), group_index)
-                            group_index=group_index+1
-                    case "PolicyGroups":
-                        #This is what Intune UX looks like on disk
-                        group_index = 1
-                        for group in root.findall(".//Group"):
-                            logger.debug("Found <PolicyGroups><Group> in "+xml_path)
-                            self.addGroup(Group(group,"gpo",xml_path), group_index)
-                            group_index=group_index+1
-                    case "PolicyRule":
-                        logger.debug("Adding a PolicyRule - format OMA-URI")
-                        self.addPolicyRule(PolicyRule(root,"oma-uri",xml_path))
-                    case "PolicyRules":
-                        rule_index = 1
-                        for policyRule in root.findall(".//PolicyRule"):
-                            logger.debug("Adding a policy rule - format GPO")
-                            self.addPolicyRule(PolicyRule(policyRule,"gpo",xml_path,rule_index))
-                            rule_index= rule_index + 1
-
-                return root
+            root_tag = mac.get_root_tag(xml_path)
+            match root_tag:
+                case "Group":
+                    with open(xml_path) as file:
+                        root = ET.fromstring(file.read())
+                    logger.debug("Found <Group> in "+xml_path)
+                    objects.append(("group",Group(root,"oma-uri",xml_path),0))
+                case "Groups" | "PolicyGroups":
+                    #PolicyGroups is what Intune UX looks like on disk
+                    group_index = 1
+                    for group in Inventory.iterparse_elements(xml_path,"Group"):
+                        logger.debug("Found <"+root_tag+"><Group> in "+xml_path)
+                        objects.append(("group",Group(group,"gpo",xml_path),group_index))
+                        group_index=group_index+1
+                case "PolicyRule":
+                    with open(xml_path) as file:
+                        root = ET.fromstring(file.read())
+                    logger.debug("Adding a PolicyRule - format OMA-URI")
+                    objects.append(("rule",PolicyRule(root,"oma-uri",xml_path),0))
+                case "PolicyRules":
+                    rule_index = 1
+                    for policyRule in Inventory.iterparse_elements(xml_path,"PolicyRule"):
+                        logger.debug("Adding a policy rule - format GPO")
+                        objects.append(("rule",PolicyRule(policyRule,"gpo",xml_path,rule_index),rule_index))
+                        rule_index= rule_index + 1
+
+            return objects, None
 
         except Exception as e:
-            logger.error(full_stack())
-            logger.error("Error in "+xml_path+": "+str(e))
-            return
+            if isinstance(e,(ET.ParseError,UnicodeError)):
+                #the file is not loaded if it can't be parsed, even if some of it was streamed
+                objects = []
+            return objects, [full_stack(),"Error in "+xml_path+": "+str(e)]
+
+    #Groups and PolicyRules files can be very large, so the elements are streamed from the file
+    #rather than building the whole tree.  Each element is detached once it is closed, so only
+    #the elements kept by the groups and rules are in memory.
+    def iterparse_elements(xml_path,tag):
+        with open(xml_path) as file:
+            for root, element in mac.iterparse_children(file):
+                if element.tag == tag:
+                    yield element
+                else:
+                    for nested_element in element.findall(".//"+tag):
+                        yield nested_element
 
     def addGroup(self,group, group_index=0):
 
-        logger.debug("Adding group "+str(group)+" to inventory")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Adding group "+str(group)+" to inventory")
 
         path = group.path
         format = group.format
@@ -384,7 +806,7 @@ class Inventory:
 
 
         #Could check for Intune UX support
-        new_row = pd.DataFrame([{
+        self.group_buffer.append({
             "type":group.type,
             "path":path,
             "format":format,
@@ -393,9 +815,27 @@ class Inventory:
             "match_type":group.match_type,
             "object": group,
             "type_label": group.group_type.label
-        }])
+        })
+
+        #Index the group by id, keeping the first group of each format.  Other groups with the
+        #same id are only kept if they are different, to report the conflict
+        if group.id not in self.groups_by_id:
+            self.groups_by_id[group.id] = {
+                "gpo":[],
+                "oma-uri":[],
+                "mac":[],
+                "paths":[],
+                "conflicts":[]
+            }
 
-        self.groups = pd.concat([self.groups,new_row],ignore_index=True)
+        indexed_groups = self.groups_by_id[group.id]
+        indexed_groups["paths"].append(path)
+        if group in indexed_groups[format]:
+            return
+        elif len(indexed_groups[format]) == 0:
+            indexed_groups[format].append(group)
+        else:
+            indexed_groups["conflicts"].append((group,path))
 
     def addPolicyRule(self,rule):
 
@@ -412,7 +852,7 @@ class Inventory:
         
 
 
-        new_row = pd.DataFrame([{
+        self.policy_rule_buffer.append({
             "path":path,
             "format":format,
             "name":rule.name,
@@ -422,21 +862,17 @@ class Inventory:
             "excluded_groups":rule.excluded_groups,
             "object": rule,
             "rule_index": rule_index
-        }])
-
-        self.policy_rules = pd.concat([self.policy_rules,new_row],ignore_index=True)
+        })
 
         for entry in rule.entries:
 
-            new_entry = pd.DataFrame([{
+            self.rule_entry_buffer.append({
                 "ruleId": rule.id,
                 "entryId": entry.id,
                 "entry_type": entry.entry_type.label,
                 "enforcement": entry.enforcement.label,
                 "notifications": str(entry.notifications)
-            }])
-
-            self.rule_entries = pd.concat([self.rule_entries,new_entry],ignore_index=True)
+            })
 
             new_entry_permissions = {
                 "entryId": entry.id,
@@ -454,47 +890,37 @@ class Inventory:
 
                 new_entry_permissions[column] = permissions[permission]
 
-            new_entry_permissions = pd.DataFrame([
-                new_entry_permissions
-            ])
-
-            self.entry_type_data_frames[entry.entry_type.label] = pd.concat([self.entry_type_data_frames[entry.entry_type.label],new_entry_permissions],ignore_index=True)
+            self.entry_type_buffers[entry.entry_type.label].append(new_entry_permissions)
 
             if entry.has_user_condition():
                   
-                  new_condition = pd.DataFrame([{
+                  self.directory_object_condition_buffer.append({
                     "ruleId": rule.id,
                     "entryId": entry.id,
                     "objectType": "User",
                     "objectValue": entry.sid
-                  }])
-
-                  self.directory_object_conditions = pd.concat([self.directory_object_conditions,new_condition],ignore_index=True)
+                  })
 
             if entry.has_computer_condition():
                   
-                  new_condition = pd.DataFrame([{
+                  self.directory_object_condition_buffer.append({
                     "ruleId": rule.id,
                     "entryId": entry.id,
                     "objectType": "Computer",
                     "objectValue": entry.computersid
-                  }])
-
-                  self.directory_object_conditions = pd.concat([self.directory_object_conditions,new_condition],ignore_index=True)
+                  })
 
             if entry.parameters is not None:
                 for condition in entry.parameters.conditions:
                     for property in condition.properties:
 
-                        new_condition = pd.DataFrame([{
+                        self.parameter_condition_buffer.append({
                             "ruleId": rule.id,
                             "entryId": entry.id,
                             "conditionType": condition.condition_type.label,
                             "conditionProperty": property.label,
                             "conditionValue": property.value
-                        }])
-
-                        self.parameter_conditions = pd.concat([self.parameter_conditions,new_condition],ignore_index=True)
+                        })
 
 
     
@@ -538,29 +964,20 @@ class Inventory:
 
 
     def get_group_by_id(self,group_id):
-        group_frame = self.groups.query("id == '"+group_id+"'")
-        if group_frame.size == 0:
+        if group_id not in self.groups_by_id:
             logger.warning("No group found for "+group_id)
             return None
         else:
-            logger.debug("Found "+str(group_frame.size)+" group(s) for "+group_id)
+            indexed_groups = self.groups_by_id[group_id]
+            logger.debug("Found "+str(len(indexed_groups["paths"]))+" group(s) for "+group_id)
             groups = {
-                "gpo":[],
-                "oma-uri":[],
-                "mac":[]
+                "gpo":list(indexed_groups["gpo"]),
+                "oma-uri":list(indexed_groups["oma-uri"]),
+                "mac":list(indexed_groups["mac"])
             }
-            
-            for i in range(0,group_frame.index.size):
-                group = group_frame.iloc[i]["object"]
-                format = group_frame.iloc[i]["format"]
-                path = group_frame.iloc[i]["path"]
-                if group in groups[format]:
-                    continue
-                elif len(groups[format]) == 0:
-                    logger.debug("Adding group "+str(group)+" to format")
-                    groups[format].append(group)
-                else:
-                    logger.warning("Conflicting groups for "+group_id+" at "+path+"\n"+str(group) +"\n!=\n" +str(groups[format][0]))
+
+            for group, path in indexed_groups["conflicts"]:
+                logger.warning("Conflicting groups for "+group_id+" at "+path+"\n"+str(group) +"\n!=\n" +str(groups[group.format][0]))
 
             #Use either GPO or Mac, to create an OMA-URI group
             if len(groups["oma-uri"]) == 0:
@@ -576,10 +993,27 @@ class Inventory:
             return groups
     
     def get_path_for_group(self,group_id):
-        group_frame = self.groups.query("id == '"+group_id+"'")
-        return group_frame.iloc[0]["path"]
+        return self.groups_by_id[group_id]["paths"][0]
     
 
+    def build_indexes(self):
+        #builds the frames and indexes used by the queries up front, so processes that share the
+        #inventory don't each build them
+        self.policy_rules
+        self.get_rule_query()
+
+    def get_rule_query(self):
+        #rebuilt when rules were added since the last query
+        if self.rule_query is None or self.rule_query.size != len(self.policy_rule_buffer):
+            self.rule_query = RuleQuery(self.policy_rule_buffer.columns["object"],self.policy_rule_buffer.columns)
+        return self.rule_query
+
+    def get_rules(self,query):
+        positions = self.get_rule_query().query(query)
+        if positions is None:
+            return list(self.policy_rules.query(query, engine='python')["object"])
+        return [self.policy_rule_buffer.columns["object"][position] for position in positions]
+
     def query_policy_rules(self,query):
         rules = {
             "gpo":{},
@@ -593,16 +1027,19 @@ class Inventory:
         logger.debug("query="+str(query)+" class="+str(query.__class__))
         logger.debug("policy_rules="+str(self.policy_rules))
 
-        rule_frame = self.policy_rules.query(query, engine='python')
+        positions = self.get_rule_query().query(query)
+        if positions is None:
+            logger.debug("query is not indexed, using pandas")
+            rule_frame = self.policy_rules.query(query, engine='python')
+        else:
+            rule_frame = self.policy_rules.iloc[positions]
         rule_frame = rule_frame.sort_values("rule_index", ascending=True)
 
         logger.debug("query returned "+str(rule_frame.index.size)+" results.")
 
-        for i in range(0,rule_frame.index.size):
-            rule = rule_frame.iloc[i]["object"]
-            logger.debug(">>>"+str(i)+" rule="+str(rule))
-            format = rule_frame.iloc[i]["format"]
-            rule_index = rule_frame.iloc[i]["rule_index"]
+        for rule, format in zip(rule_frame["object"],rule_frame["format"]):
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(">>> rule="+str(rule))
             rule_id = rule.id
 
             if format == "oma-uri":
@@ -774,39 +1211,33 @@ class Inventory:
         self.parameter_conditions.to_csv(dest+os.sep+"dc_parameter_conditions.csv",sep=",",index=False)
         
         #create the list of group-rule-mappings
-        for i in range(0,self.policy_rules.index.size):
-            rule = self.policy_rules.iloc[i]["object"]
+        for rule in self.policy_rules["object"]:
 
             for property in rule.included_device_properties:
-                new_row = pd.DataFrame([{
+                self.rule_property_buffer.append({
                     "type": "included",
                     "ruleId": rule.id,
                     "propertyType": property.name,
                     "propertyValue": property.value
-                }])
-
-                self.rule_properties = pd.concat([self.rule_properties,new_row],ignore_index=True)
+                })
             
             for property in rule.excluded_device_properties:
-                new_row = pd.DataFrame([{
+                self.rule_property_buffer.append({
                     "type": "excluded",
                     "ruleId": rule.id,
                     "propertyType": property.name,
                     "propertyValue": property.value
-                }])
-
-                self.rule_properties = pd.concat([self.rule_properties,new_row],ignore_index=True)
+                })
             
 
 
         self.rule_properties.to_csv(dest+os.sep+"dc_rule_properties.csv",sep=",",index=False)
 
         #Add the group values to the dataframe
-        for i in range(0,self.groups.index.size):
+        for group in self.groups["object"]:
             new_row = {
 
             }
-            group = self.groups.iloc[i]["object"]
             new_row["groupId"] = group.id
             if group.format != "mac":
                 for property in group._properties:
@@ -832,10 +1263,7 @@ class Inventory:
                     new_row[clause_property.label] = clause_property.value
                     
 
-            self.group_property_data_frames[group.group_type.label] = pd.concat([
-                self.group_property_data_frames[group.group_type.label],
-                pd.DataFrame([new_row])
-            ],ignore_index=True)
+            self.group_property_buffers[group.group_type.label].append(new_row)
 
         #save the csvs
         for group_type_label in self.group_property_data_frames:
@@ -1046,15 +1474,321 @@ def generate_readme(results,templateEnv,dest,title,readme_template,readme_file,t
 
     logger.info("Generated README "+str(pathlib.Path(readme_file_path).resolve()))
 
+def get_scenario_policy_file(scenario,scenarios_dir,source_paths):
+
+    policy_path = pathlib.Path(os.path.join(scenarios_dir,scenario["file"])).resolve()
+    for source_path in source_paths:
+        try:
+            policy_path = policy_path.relative_to(source_path)
+            logger.debug(str(policy_path)+" is relative to "+source_path)
+            return os.path.join(source_path,policy_path)
+        except ValueError as e:
+            logger.info(str(e))
+
+    return None
+
+def generate_scenario(inventory,scenario,policy_file,args,templateEnv):
+
+    title = None
+    description = None
+
+    if "description" in scenario.keys():
+        description = scenario["description"]
+    
+    if "title" in scenario.keys():
+        title = scenario["title"]
+    
+    logger.debug("Generating parameters for "+policy_file)
+    query,default_title,default_outfile,default_settings = parse_in_file(policy_file)
+    if "settings" in scenario.keys():
+        settings = Settings(scenario["settings"])
+    else:
+        settings = default_settings
+    
+    result = inventory.process_query(query)
+    if args.format == "text":
+        if title is None:
+            title = default_title
+
+        if description is not None:
+            result["description"] = description
+        else:
+            result["description"] = Description(result,templateEnv, args.description_template)
+
+        TEMPLATE_FILE = args.template
+        template = templateEnv.get_template(TEMPLATE_FILE)
+
+        inventory.generate_text(result,template,args.dest,default_outfile,title,settings)
+
+    return {
+        "result":result,
+        "title": title,
+        "file": default_outfile,
+        "query": query
+    }
+
+class ScenarioWorker:
+
+    #The scenarios are independent once the inventory is loaded, so they can be generated by a pool
+    #of processes.  The workers share a read-only snapshot of the inventory, that is copied on write
+    #when the processes are forked (or pickled once per worker when they are spawned).
+
+    inventory = None
+    args = None
+    templateEnv = None
+
+    def initialize(inventory,args):
+        ScenarioWorker.inventory = inventory
+        ScenarioWorker.args = args
+
+        ScenarioWorker.templateEnv = get_template_environment(args)
+
+    def generate(tasks):
+        entries = []
+        for scenario, policy_file in tasks:
+            entry = generate_scenario(ScenarioWorker.inventory,scenario,policy_file,ScenarioWorker.args,ScenarioWorker.templateEnv)
+
+            #The description was rendered into the documentation, it refers to the template
+            #environment of the worker and isn't used by the readme
+            entry["result"].pop("description",None)
+            entries.append(entry)
+
+        return entries
+
+def generate_scenarios(inventory,scenarios,args,templateEnv,results=None,policy_files=None):
+
+    #Generates the documentation for the scenarios (or only for the scenarios of the policy_files)
+    #and the readme
+    if results is None:
+        results = {}
+
+    scenarios_dir = os.path.dirname(args.scenarios)
+    tasks = []
+    for scenario in scenarios["scenarios"]:
+
+        policy_file = get_scenario_policy_file(scenario,scenarios_dir,args.source_path)
+        if policy_file is None:
+            logger.warning("Policy file in "+scenario["file"]+" wasn't found in "+str(args.source_path))
+            continue
+
+        if policy_files is not None and policy_file not in policy_files:
+            continue
+
+        tasks.append((scenario,policy_file))
+
+    jobs = getattr(args,"jobs",1)
+    if jobs > 1 and len(tasks) > 1:
+
+        #Scenarios that write the same file are generated one after the other by the same worker,
+        #so the last one is written like when they are generated one at a time
+        chains = {}
+        for i, task in enumerate(tasks):
+            out_file = parse_in_file(task[1])[2]
+            if out_file not in chains:
+                chains[out_file] = []
+            chains[out_file].append(i)
+        chains = list(chains.values())
+
+        logger.debug("Generating "+str(len(tasks))+" scenarios with "+str(jobs)+" processes")
+        inventory.build_indexes()
+        entries = [None]*len(tasks)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs,initializer=ScenarioWorker.initialize,initargs=(inventory,args)) as executor:
+            chain_tasks = [[tasks[i] for i in chain] for chain in chains]
+            for chain, chain_entries in zip(chains,executor.map(ScenarioWorker.generate,chain_tasks)):
+                for i, entry in zip(chain,chain_entries):
+                    entries[i] = entry
+
+        #the results are in the order of the scenarios, however the workers finished
+        for task, entry in zip(tasks,entries):
+            results[task[1]] = entry
+
+    else:
+        for scenario, policy_file in tasks:
+            results[policy_file] = generate_scenario(inventory,scenario,policy_file,args,templateEnv)
+
+    generate_readme(results,templateEnv,args.dest,scenarios["title"],args.readme_template, args.readme_file, args.templates_path)
+
+    return results
+
+def generate_document(inventory,query,args,templateEnv,out_file,title,settings):
+
+    result = inventory.process_query(query)
+
+    result["description"] = Description(result,templateEnv,args.description_template)
+
+    TEMPLATE_FILE = args.template
+    template = templateEnv.get_template(TEMPLATE_FILE)
+
+    inventory.generate_text(result,template,args.dest,out_file,title,settings)
+
+    return result
+
+
+class Watcher:
+
+    #Polls the modification time and size of the files, which works the same way on all of
+    #the platforms and file systems dcdoc is run on
+
+    def __init__(self,get_files):
+        self.get_files = get_files
+        self.snapshot = self.get_snapshot()
+
+    def get_snapshot(self):
+        snapshot = {}
+        for file in self.get_files():
+            try:
+                stat = os.stat(file)
+                snapshot[file] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                continue
+        return snapshot
+
+    def poll(self):
+        snapshot = self.get_snapshot()
+        changed_files = [file for file in snapshot if self.snapshot.get(file) != snapshot[file]]
+        changed_files += [file for file in self.snapshot if file not in snapshot]
+        self.snapshot = snapshot
+        return changed_files
+
+
+class Watch:
+
+    #Keeps the inventory loaded while the source files are edited.  Only the files that changed
+    #are parsed again, and only the documentation that uses their groups and rules is generated again.
+
+    def __init__(self,inventory,args,templateEnv,results,scenarios=None):
+        self.inventory = inventory
+        self.args = args
+        self.templateEnv = templateEnv
+        self.results = results
+        self.scenarios = scenarios
+        self.watcher = Watcher(self.get_files)
+
+    def get_files(self):
+        files = self.inventory.get_source_files(False)
+        if self.scenarios is not None:
+            files.append(self.args.scenarios)
+        return files
+
+    def get_group_ids(result):
+        group_ids = set()
+        for rule in result["rules"].values():
+            group_ids.update(rule.included_groups)
+            group_ids.update(rule.excluded_groups)
+            for entry in rule.entries:
+                group_ids.update(entry.get_group_ids())
+
+        for group in result["groups"].values():
+            for property in group._properties:
+                if property.name == GroupProperty.WindowsGroupId:
+                    group_ids.add(property.value)
+
+        return group_ids
+
+    def is_affected(self,document,changed_paths,changed_rules,changed_group_ids):
+
+        #the rules of the document, or the rules that the query selects now, are in a changed file
+        for rule in document["result"]["rules"].values():
+            if rule.path in changed_paths:
+                return True
+
+        if document["query"] is None:
+            #all of the rules are documented
+            if len(changed_rules) > 0:
+                return True
+        else:
+            query = str(document["query"]).encode('unicode-escape').decode()
+            for rule in self.inventory.get_rules(query):
+                if id(rule) in changed_rules:
+                    return True
+
+        #a group used by the rules of the document changed
+        return len(Watch.get_group_ids(document["result"]) & changed_group_ids) > 0
+
+    def update(self):
+
+        changed_files = self.watcher.poll()
+        if len(changed_files) == 0:
+            return []
+
+        start = time.perf_counter()
+        logger.info("Changed: "+", ".join(changed_files))
+
+        scenarios_changed = self.scenarios is not None and self.args.scenarios in changed_files
+        source_files = [file for file in changed_files if not (scenarios_changed and file == self.args.scenarios)]
+
+        changed_rules = {}
+        changed_group_ids = set()
+        if len(source_files) > 0:
+            for object in self.inventory.reload(source_files):
+                if isinstance(object,Group):
+                    changed_group_ids.add(object.id)
+                else:
+                    changed_rules[id(object)] = object
+
+        changed_paths = set([str(pathlib.Path(file).resolve()) for file in source_files])
+
+        if scenarios_changed:
+            self.scenarios = load_scenarios(self.args.scenarios)
+            self.results = {}
+            keys = None
+        else:
+            keys = [key for key in self.results if self.is_affected(self.results[key],changed_paths,changed_rules,changed_group_ids)]
+            if len(keys) == 0:
+                logger.info("No documentation uses the changed files")
+                return []
+
+        if self.scenarios is not None:
+            self.results = generate_scenarios(self.inventory,self.scenarios,self.args,self.templateEnv,self.results,keys)
+        else:
+            for key in keys:
+                document = self.results[key]
+                document["result"] = generate_document(self.inventory,document["query"],self.args,self.templateEnv,
+                                                       document["file"],document["title"],document["settings"])
+
+        if keys is None:
+            keys = list(self.results.keys())
+
+        logger.info("Generated "+str(len(keys))+" document(s) in "+str(int((time.perf_counter()-start)*1000))+" ms")
+        return keys
+
+    def run(self,interval):
+        logger.info("Watching "+str(self.args.source_path)+" for changes, press Ctrl+C to stop")
+        try:
+            while True:
+                time.sleep(interval)
+                self.update()
+        except KeyboardInterrupt:
+            logger.info("Stopped watching")
+
+
+def get_template_environment(args):
+    #the compiled templates are cached with the parsed files when there is a cache directory
+    cache_dir = getattr(args,"cache_dir",None)
+    if cache_dir is not None:
+        cache_dir = os.path.join(cache_dir,"templates")
+    return Templates.get_environment(args.templates_path,cache_dir)
+
+
 def process_args(args):
 
     import logging.config
     logging.config.fileConfig(args.loggingConf)
     
-    templateLoader = jinja2.FileSystemLoader(searchpath=args.templates_path)
-    templateEnv = jinja2.Environment(loader=templateLoader)
+    templateEnv = get_template_environment(args)
+
+    cache = None
+    cache_dir = getattr(args,"cache_dir",None)
+    if cache_dir is not None:
+        if getattr(args,"clear_cache",False):
+            ParseCache.clear(cache_dir)
+        cache = ParseCache(cache_dir)
 
-    inventory = Inventory(args.source_path,args.generated_files_locations,args.dest)
+    inventory = Inventory(args.source_path,args.generated_files_locations,args.dest,getattr(args,"jobs",1),cache,
+                          not getattr(args,"drop_source",False))
+
+    if cache is not None:
+        logger.info("Parse cache: "+str(cache.hits)+" hits, "+str(cache.misses)+" misses")
 
     query = args.query
     title = None
@@ -1063,69 +1797,34 @@ def process_args(args):
 
     out_file = args.out_file
 
-    if args.scenarios is not None:
+    if getattr(args,"analyze",False):
 
-        scenarios_dir = os.path.dirname(args.scenarios)
+        from mdedevicecontrol.dcanalysis import analyze
 
-        results = {}
-        scenarios = load_scenarios(args.scenarios)
-        for rule in scenarios["scenarios"]:
-            policy_file = rule["file"]
-
-            policy_path = pathlib.Path(os.path.join(scenarios_dir,policy_file)).resolve()
-            policy_file = None
-            for source_path in args.source_path:
-                try:
-                    policy_path = policy_path.relative_to(source_path)
-                    logger.debug(str(policy_path)+" is relative to "+source_path)
-                    policy_file = os.path.join(source_path,policy_path)
-                    break
-                except ValueError as e:
-                    logger.info(str(e))
-
-            if policy_file is None:
-                logger.warning("Policy file in "+rule["file"]+" wasn't found in "+str(args.source_path))
-                continue
-            
-            title = None
-            description = None
+        analyze(inventory,args.dest,Default_Settings)
 
-            if "description" in rule.keys():
-                description = rule["description"]
-            
-            if "title" in rule.keys():
-                title = rule["title"]
-            
-            logger.debug("Generating parameters for "+policy_file)
-            query,default_title,default_outfile,default_settings = parse_in_file(policy_file)
-            if "settings" in rule.keys():
-                settings = Settings(rule["settings"])
-            else:
-                settings = default_settings
-            
-            result = inventory.process_query(query)
-            if args.format == "text":
-                if title is None:
-                    title = default_title
+    if getattr(args,"devices_file",None) is not None:
 
-                if description is not None:
-                    result["description"] = description
-                else:
-                    result["description"] = Description(result,templateEnv, args.description_template)
+        from mdedevicecontrol.dcbatch import evaluate_devices
 
-                TEMPLATE_FILE = args.template
-                template = templateEnv.get_template(TEMPLATE_FILE)
+        if out_file is None:
+            out_file = "dc_decisions.csv"
 
-                inventory.generate_text(result,template,args.dest,default_outfile,title,settings)
+        if not pathlib.Path.is_absolute(pathlib.Path(out_file)):
+            out_file = os.path.join(args.dest,out_file)
 
-            results[policy_file] = {
-                "result":result,
-                "title": title,
-                "file": default_outfile
-            }
+        evaluate_devices(inventory,args.devices_file,out_file,Default_Settings,args.dest)
 
-        generate_readme(results,templateEnv,args.dest,scenarios["title"],args.readme_template, args.readme_file, args.templates_path)
+        if args.format == "csv":
+            inventory.generate_csv(args.dest)
 
+    elif args.scenarios is not None:
+
+        scenarios = load_scenarios(args.scenarios)
+        results = generate_scenarios(inventory,scenarios,args,templateEnv)
+
+        if getattr(args,"watch_interval",None) is not None:
+            Watch(inventory,args,templateEnv,results,scenarios).run(args.watch_interval)
 
     elif query is None:
         if args.in_file is not None:
@@ -1134,14 +1833,20 @@ def process_args(args):
                 out_file = default_outfile
 
         if args.format == "text":
-            result = inventory.process_query(query)
-
-            result["description"] = Description(result,templateEnv,args.description_template)
-
-            TEMPLATE_FILE = args.template
-            template = templateEnv.get_template(TEMPLATE_FILE)
+            result = generate_document(inventory,query,args,templateEnv,out_file,title,settings)
+
+            if getattr(args,"watch_interval",None) is not None:
+                results = {
+                    out_file: {
+                        "result": result,
+                        "title": title,
+                        "file": out_file,
+                        "query": query,
+                        "settings": settings
+                    }
+                }
+                Watch(inventory,args,templateEnv,results).run(args.watch_interval)
 
-            inventory.generate_text(result,template,args.dest,out_file,title,settings)
         elif args.format == "csv":
             inventory.generate_csv(args.dest)
         
@@ -1156,6 +1861,7 @@ def main():
     input_group.add_argument('-q','--query',dest="query",help='The query to retrieve the policy rules to process')
     input_group.add_argument('-s','--scenarios',dest="scenarios",type=file,help='A JSON file that contains a list of scenarios to process')
     input_group.add_argument('-i','--input',dest="in_file",type=file,help='A policy rule to process')
+    input_group.add_argument('-e','--evaluate',dest="devices_file",type=file,help='A device inventory (csv or parquet) to evaluate against the policy rules')
 
     arg_parser.add_argument('-l','--loggingConf', type=file,dest="loggingConf",help="path to the logging.conf",default="logging.conf")
 
@@ -1165,6 +1871,12 @@ def main():
     arg_parser.add_argument('-o','--output',dest="out_file",help="The output file")
     arg_parser.add_argument('-d','--dest',dest="dest",type=dir,help="The output directory.  Defaults to current working directory.",default=".")
     arg_parser.add_argument('-g','--generate',dest="generated_files_locations", type=generate_files_format, help='Generates files for other formats')
+    arg_parser.add_argument('-a','--analyze',dest="analyze",action="store_true",help="Reports shadowed and conflicting policy rules")
+    arg_parser.add_argument('-j','--jobs',dest="jobs",type=int,help="The number of processes used to parse the source files and to generate the scenarios.  Defaults to 1.",default=1)
+    arg_parser.add_argument('-c','--cache',dest="cache_dir",help="A directory to cache the parsed source files in, so only changed files are parsed again")
+    arg_parser.add_argument('--clear_cache',dest="clear_cache",action="store_true",help="Clears the cache before loading the source files")
+    arg_parser.add_argument('-w','--watch',dest="watch_interval",type=float,nargs="?",const=1.0,help="Keeps running and regenerates the documentation that uses the source files that change.  The files are checked every WATCH_INTERVAL seconds, defaults to 1.")
+    arg_parser.add_argument('--drop_source',dest="drop_source",action="store_true",help="Drops the xml of the groups and rules once they are parsed to use less memory")
     
     arg_parser.add_argument('-t','--template',dest="template",help="Jinja2 template to use to generate output.  Defaults to dcutil.j2.",default="dcutil.j2")
     arg_parser.add_argument('-rt','--readme_template',dest="readme_template",help="Jinja2 template to use for the readme.  Defaults to readme.j2.",default="readme.j2")
@@ -0,0 +1,1042 @@
+#!/usr/bin/env python3
+
+#Offline evaluation of device control policies.
+#
+#The policy is compiled once into plain python closures so that each
+#device/access query only walks the rules in order and never touches XML.
+
+import re
+import hashlib
+from collections import OrderedDict
+
+from mdedevicecontrol import GroupProperty, GroupType, PolicyRule, MatchType, Format, Setting, WindowsEntryType
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class Descriptor:
+
+    Wildcards = "*?"
+
+    #Descriptors where '-' and '_' are both used to separate vendor and product
+    VendorProductSeparators = {
+        "-": "_"
+    }
+
+    def normalize(name, value):
+        if value is None:
+            return None
+
+        out = str(value).strip().upper()
+        if name == GroupProperty.WindowsDeviceVendorProduct:
+            for separator in Descriptor.VendorProductSeparators:
+                out = out.replace(separator, Descriptor.VendorProductSeparators[separator])
+
+        return out
+
+    def has_wildcard(value):
+        for wildcard in Descriptor.Wildcards:
+            if wildcard in value:
+                return True
+        return False
+
+    def wildcard_to_regex(value):
+        out = ""
+        for c in value:
+            if c == "*":
+                out += ".*"
+            elif c == "?":
+                out += "."
+            else:
+                out += re.escape(c)
+
+        return re.compile(out, re.DOTALL)
+
+
+class Device:
+
+    def __init__(self, descriptors = None, **kwargs):
+        self.descriptors = {}
+        self.fingerprint = None
+
+        if descriptors is not None:
+            for name in descriptors:
+                self.set(name, descriptors[name])
+
+        for name in kwargs:
+            self.set(name, kwargs[name])
+
+        self.derive_descriptors()
+
+    def set(self, name, value):
+        if value is None:
+            return
+
+        if isinstance(value, (list, tuple, set)):
+            values = value
+        else:
+            values = [value]
+
+        normalized = []
+        for v in values:
+            if v is None or str(v) == "":
+                continue
+            normalized.append(Descriptor.normalize(name, v))
+
+        if len(normalized) > 0:
+            self.descriptors[name] = tuple(normalized)
+
+    def get(self, name):
+        if name in self.descriptors:
+            return self.descriptors[name]
+        return ()
+
+    def derive_descriptors(self):
+
+        #VID and PID are the two halves of VID_PID
+        vid_pid = self.get(GroupProperty.WindowsDeviceVendorProduct)
+        if len(vid_pid) > 0:
+            vids = []
+            pids = []
+            for value in vid_pid:
+                parts = value.split("_", 1)
+                if len(parts) == 2:
+                    vids.append(parts[0])
+                    pids.append(parts[1])
+
+            if GroupProperty.WindowsDeviceVendor not in self.descriptors and len(vids) > 0:
+                self.descriptors[GroupProperty.WindowsDeviceVendor] = tuple(vids)
+            if GroupProperty.WindowsDeviceProduct not in self.descriptors and len(pids) > 0:
+                self.descriptors[GroupProperty.WindowsDeviceProduct] = tuple(pids)
+
+        #The DeviceId is the instance path without the instance specific part
+        instance_paths = self.get(GroupProperty.WindowsDeviceInstancePath)
+        if GroupProperty.WindowsDeviceId not in self.descriptors and len(instance_paths) > 0:
+            device_ids = []
+            for instance_path in instance_paths:
+                if "\\" in instance_path:
+                    device_ids.append(instance_path.rsplit("\\", 1)[0])
+
+            if len(device_ids) > 0:
+                self.descriptors[GroupProperty.WindowsDeviceId] = tuple(device_ids)
+
+    def get_fingerprint(self):
+        if self.fingerprint is None:
+            self.fingerprint = tuple(sorted(self.descriptors.items()))
+        return self.fingerprint
+
+    def __str__(self):
+        return str(self.descriptors)
+
+
+class WildcardMatcher:
+
+    #The wildcard patterns are kept in a trie by their literal prefix so that a
+    #value is only tested against the patterns whose prefix it starts with.
+
+    class Node:
+
+        def __init__(self):
+            self.children = {}
+            self.patterns = []
+            self.regexes = []
+            self.combined = None
+
+    def __init__(self):
+        self.root = WildcardMatcher.Node()
+        self.size = 0
+        self.compiled = True
+
+    def add(self, pattern, key):
+
+        prefix_length = len(pattern)
+        for wildcard in Descriptor.Wildcards:
+            position = pattern.find(wildcard)
+            if position >= 0 and position < prefix_length:
+                prefix_length = position
+
+        node = self.root
+        for c in pattern[:prefix_length]:
+            if c not in node.children:
+                node.children[c] = WildcardMatcher.Node()
+            node = node.children[c]
+
+        node.patterns.append((pattern[prefix_length:], key))
+        self.size += 1
+        self.compiled = False
+
+    def compile(self):
+
+        nodes = [self.root]
+        while len(nodes) > 0:
+            node = nodes.pop()
+            nodes.extend(node.children.values())
+
+            if len(node.patterns) == 0:
+                continue
+
+            node.regexes = []
+            for remainder, key in node.patterns:
+                node.regexes.append((Descriptor.wildcard_to_regex(remainder), key))
+
+            #one pass rejects the values that don't match any of the patterns of the node
+            node.combined = re.compile("|".join(["(?:"+regex.pattern+")" for regex, key in node.regexes]), re.DOTALL)
+
+        self.compiled = True
+
+    def match(self, value):
+
+        if not self.compiled:
+            self.compile()
+
+        keys = set()
+        node = self.root
+        i = 0
+        while node is not None:
+            if node.combined is not None and node.combined.fullmatch(value, i) is not None:
+                for regex, key in node.regexes:
+                    if key not in keys and regex.fullmatch(value, i) is not None:
+                        keys.add(key)
+
+            if i == len(value):
+                break
+
+            node = node.children.get(value[i])
+            i += 1
+
+        return keys
+
+    def __len__(self):
+        return self.size
+
+
+class DescriptorIndex:
+
+    #Maps each descriptor value to the ids of the groups that reference it.
+    #Wildcard values are kept in a WildcardMatcher per descriptor.
+
+    def is_indexed(property):
+        return property.name != GroupProperty.WindowsGroupId and property.name != GroupProperty.MacGroupId
+
+    def __init__(self, groups = None):
+        self.index = {}
+        self.wildcards = {}
+        self.group_ids = set()
+
+        if groups is not None:
+            for group in groups:
+                self.add_group(group)
+
+    def add_group(self, group):
+        if group.format == Format.Mac:
+            return
+
+        for property in group._properties:
+            if DescriptorIndex.is_indexed(property):
+                self.add(property.name, property.value, group.id)
+
+    def add(self, name, value, group_id):
+        value = Descriptor.normalize(name, value)
+        self.group_ids.add(group_id)
+
+        if Descriptor.has_wildcard(value):
+            if name not in self.wildcards:
+                self.wildcards[name] = WildcardMatcher()
+            self.wildcards[name].add(value, group_id)
+            return
+
+        if name not in self.index:
+            self.index[name] = {}
+
+        values = self.index[name]
+        if value not in values:
+            values[value] = set()
+
+        values[value].add(group_id)
+
+    def get_groups(self, name, value):
+        if name not in self.index:
+            return set()
+
+        value = Descriptor.normalize(name, value)
+        if value in self.index[name]:
+            return self.index[name][value]
+        return set()
+
+    def lookup(self, device):
+        group_ids = set()
+        for name in device.descriptors:
+            if name in self.index:
+                values = self.index[name]
+                for value in device.descriptors[name]:
+                    if value in values:
+                        group_ids.update(values[value])
+
+            if name in self.wildcards:
+                matcher = self.wildcards[name]
+                for value in device.descriptors[name]:
+                    group_ids.update(matcher.match(value))
+
+        return group_ids
+
+    def __len__(self):
+        size = 0
+        for name in self.index:
+            size += len(self.index[name])
+        for name in self.wildcards:
+            size += len(self.wildcards[name])
+        return size
+
+
+class ClauseCompiler:
+
+    #Compiles the and/or trees of mac groups into short-circuiting closures.
+    #
+    #Nested clauses with the same operator are flattened, equality checks on the
+    #same descriptor are merged into one set test and run before the wildcards,
+    #group references and sub clauses. Identical sub clauses (in any group) are
+    #compiled once and evaluated once per device.
+
+    AND = "and"
+    OR = "or"
+
+    def __init__(self, compile_descriptor):
+        self.compile_descriptor = compile_descriptor
+        self.compiled = {}
+
+    def get_operator(clause_type):
+        if clause_type in ["all", "and"]:
+            return ClauseCompiler.AND
+        return ClauseCompiler.OR
+
+    def build(self, clauses, clause_type):
+
+        operator = ClauseCompiler.get_operator(clause_type)
+
+        children = []
+        for clause in clauses:
+            if len(clause.sub_clauses) > 0:
+                child = self.build(clause.sub_clauses, clause.sub_clause_type)
+                if child[0] == operator:
+                    children.extend(child[1])
+                else:
+                    children.append(child)
+
+            for property in clause._properties:
+                children.append(("leaf", property.name, Descriptor.normalize(property.name, property.value), property.value))
+
+        #duplicate clauses don't change the result
+        unique = {}
+        for child in children:
+            unique[ClauseCompiler.get_key(child)] = child
+        children = [unique[key] for key in sorted(unique.keys())]
+
+        if len(children) == 1:
+            return children[0]
+
+        return (operator, children)
+
+    def get_key(node):
+        if node[0] == "leaf":
+            return ("leaf", node[1], node[2])
+        return (node[0], tuple([ClauseCompiler.get_key(child) for child in node[1]]))
+
+    def compile(self, clauses, clause_type):
+        node = self.build(clauses, clause_type)
+        if node[0] != "leaf" and len(node[1]) == 0:
+            return Engine.combine([], node[0] == ClauseCompiler.AND)
+        return self.compile_node(node)
+
+    def compile_node(self, node):
+
+        key = ClauseCompiler.get_key(node)
+        if key in self.compiled:
+            return self.compiled[key]
+
+        if node[0] == "leaf":
+            matcher = self.compile_descriptor(node[1], node[3])
+            self.compiled[key] = matcher
+            return matcher
+
+        require_all = node[0] == ClauseCompiler.AND
+
+        equality = {}
+        wildcards = []
+        references = []
+        sub_clauses = []
+        for child in node[1]:
+            if child[0] != "leaf":
+                sub_clauses.append(child)
+            elif child[1] == GroupProperty.WindowsGroupId or child[1] == GroupProperty.MacGroupId:
+                references.append(self.compile_node(child))
+            elif Descriptor.has_wildcard(child[2]):
+                wildcards.append(self.compile_node(child))
+            else:
+                if child[1] not in equality:
+                    equality[child[1]] = set()
+                equality[child[1]].add(child[2])
+
+        matchers = []
+        for name in sorted(equality.keys()):
+            matchers.append(ClauseCompiler.compile_equality(name, frozenset(equality[name]), require_all))
+
+        matchers.extend(wildcards)
+        matchers.extend(references)
+
+        #the smaller sub clauses are cheaper
+        sub_clauses.sort(key=lambda child: len(child[1]))
+        for child in sub_clauses:
+            matchers.append(ClauseCompiler.memoize(ClauseCompiler.get_key(child), self.compile_node(child)))
+
+        matcher = Engine.combine(matchers, require_all)
+        self.compiled[key] = matcher
+        return matcher
+
+    def compile_equality(name, values, require_all):
+
+        if require_all:
+            def match_all_values(device, memo):
+                device_values = device.get(name)
+                for value in values:
+                    if value not in device_values:
+                        return False
+                return True
+            return match_all_values
+
+        def match_any_value(device, memo):
+            return not values.isdisjoint(device.get(name))
+        return match_any_value
+
+    def memoize(key, matcher):
+        def match_memoized(device, memo):
+            if key in memo:
+                return memo[key]
+            result = matcher(device, memo)
+            memo[key] = result
+            return result
+        return match_memoized
+
+
+class Context:
+
+    #The facts that entry conditions (Parameters, Sid and ComputerSid) are
+    #evaluated against.  Each facet is a set of descriptors and keeps the
+    #results of the condition groups, so changing one facet only re-evaluates
+    #the groups of that facet.
+
+    Network = "Network"
+    VPNConnection = "VPNConnection"
+    File = "File"
+    PrintJob = "PrintJob"
+
+    Facets = [Network, VPNConnection, File, PrintJob]
+
+    def __init__(self, network = None, vpn_connection = None, file = None, print_job = None, user_sids = None, computer_sids = None):
+        self.facets = {}
+        self.memos = {}
+        self.fingerprint = None
+
+        self.set(Context.Network, network)
+        self.set(Context.VPNConnection, vpn_connection)
+        self.set(Context.File, file)
+        self.set(Context.PrintJob, print_job)
+
+        self.set_user_sids(user_sids)
+        self.set_computer_sids(computer_sids)
+
+    def set(self, facet, descriptors):
+        if facet not in Context.Facets:
+            raise Exception("Unknown context "+str(facet))
+
+        self.memos.pop(facet, None)
+        self.fingerprint = None
+
+        if descriptors is None:
+            self.facets.pop(facet, None)
+        elif isinstance(descriptors, Device):
+            self.facets[facet] = descriptors
+        else:
+            self.facets[facet] = Device(descriptors)
+
+    def set_network(self, network):
+        self.set(Context.Network, network)
+
+    def set_vpn_connection(self, vpn_connection):
+        self.set(Context.VPNConnection, vpn_connection)
+
+    def set_file(self, path):
+        if path is None:
+            self.set(Context.File, None)
+        else:
+            self.set(Context.File, {GroupProperty.FilePath: path})
+
+    def set_print_job(self, print_job):
+        self.set(Context.PrintJob, print_job)
+
+    def normalize_sids(sids):
+        if sids is None:
+            return frozenset()
+        if isinstance(sids, str):
+            sids = [sids]
+        return frozenset([str(sid).strip().upper() for sid in sids])
+
+    def set_user_sids(self, sids):
+        self.user_sids = Context.normalize_sids(sids)
+        self.fingerprint = None
+
+    def set_computer_sids(self, sids):
+        self.computer_sids = Context.normalize_sids(sids)
+        self.fingerprint = None
+
+    def get(self, facet):
+        if facet in self.facets:
+            return self.facets[facet]
+        return None
+
+    def get_fingerprint(self):
+        if self.fingerprint is None:
+            facets = []
+            for facet in sorted(self.facets.keys()):
+                facets.append((facet, self.facets[facet].get_fingerprint()))
+            self.fingerprint = (tuple(facets), tuple(sorted(self.user_sids)), tuple(sorted(self.computer_sids)))
+        return self.fingerprint
+
+
+class DecisionCache:
+
+    #Least recently used cache of decisions.  The cache is cleared when it is
+    #used with a different set of groups and policy rules.
+
+    def __init__(self, max_size = 4096):
+        if max_size < 1:
+            raise Exception("Invalid cache size "+str(max_size))
+
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.policy_fingerprint = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def validate(self, policy_fingerprint):
+        if self.policy_fingerprint != policy_fingerprint:
+            if self.policy_fingerprint is not None:
+                logger.debug("Policy changed, clearing "+str(len(self.entries))+" cached decisions")
+                self.invalidations += 1
+            self.entries.clear()
+            self.policy_fingerprint = policy_fingerprint
+
+    def get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+
+        self.misses += 1
+        return None
+
+    def put(self, key, decision):
+        self.entries[key] = decision
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def get_statistics(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_ratio": self.hits / lookups if lookups > 0 else 0.0
+        }
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class Decision:
+
+    def __init__(self, access_mask, enforcement, rule = None, entry = None, audit_entries = None):
+        self.access_mask = access_mask
+        self.enforcement = enforcement
+        self.rule = rule
+        self.entry = entry
+        self.audit_entries = audit_entries if audit_entries is not None else []
+
+    def is_default(self):
+        return self.rule is None
+
+    def get_notifications(self):
+        notifications = []
+        entries = self.audit_entries
+        if self.entry is not None:
+            entries = [self.entry] + entries
+
+        for entry in entries:
+            for notification in entry.notifications:
+                if notification not in notifications:
+                    notifications.append(notification)
+
+        return notifications
+
+    def __str__(self):
+        out = str(self.enforcement)
+        if self.rule is not None:
+            out += " by rule "+str(self.rule.name)+" ("+str(self.rule.id)+") entry "+str(self.entry.id)
+        else:
+            out += " by default enforcement"
+        return out
+
+
+class Engine:
+
+    WINDOWS = "windows"
+    MAC = "mac"
+
+    formats_for_os = {
+        WINDOWS: [Format.GPO, Format.OMA_URI],
+        MAC: [Format.Mac]
+    }
+
+    decisive_enforcements = {
+        PolicyRule.Allow.name: PolicyRule.Allow,
+        PolicyRule.Deny.name: PolicyRule.Deny
+    }
+
+    #Audit entries only apply to the matching enforcement
+    audit_enforcements = {
+        PolicyRule.AuditAllowed.name: PolicyRule.Allow,
+        PolicyRule.AuditDenied.name: PolicyRule.Deny
+    }
+
+    class CompiledEntry:
+
+        def __init__(self, entry, conditions = None):
+            self.entry = entry
+            self.conditions = conditions
+            self.enforcement = entry.enforcement
+
+            if entry.format == Format.Mac:
+                self.access_mask = WindowsEntryType.getAccessMaskForPermissions(entry.generic_windows_permissions)
+            else:
+                self.access_mask = int(entry.access_mask)
+
+            self.is_decisive = str(self.enforcement) in Engine.decisive_enforcements
+            self.audit_for = None
+            if str(self.enforcement) in Engine.audit_enforcements:
+                self.audit_for = Engine.audit_enforcements[str(self.enforcement)]
+
+            self.has_conditions = entry.has_conditions()
+
+        def applies(self, access_mask, context):
+            if not self.access_mask & access_mask:
+                return False
+            if not self.has_conditions:
+                return True
+
+            #entries with conditions only apply when there is a context to evaluate them
+            if context is None or self.conditions is None:
+                return False
+            return self.conditions(context)
+
+    class CompiledRule:
+
+        def __init__(self, rule, included, excluded, compile_conditions = None):
+            self.rule = rule
+            self.included = included
+            self.excluded = excluded
+            self.entries = []
+            for entry in rule.entries:
+                conditions = None
+                if compile_conditions is not None and entry.has_conditions():
+                    conditions = compile_conditions(entry)
+                self.entries.append(Engine.CompiledEntry(entry, conditions))
+
+        def get_decisive_entry(self, access_mask, context = None):
+            for compiled_entry in self.entries:
+                if not compiled_entry.is_decisive:
+                    continue
+                if compiled_entry.applies(access_mask, context):
+                    return compiled_entry
+            return None
+
+        def get_audit_entries(self, enforcement, access_mask, context = None):
+            audit_entries = []
+            for compiled_entry in self.entries:
+                if compiled_entry.audit_for is not enforcement:
+                    continue
+                if compiled_entry.applies(access_mask, context):
+                    audit_entries.append(compiled_entry.entry)
+            return audit_entries
+
+        def get_decision(self, access_mask, context = None):
+            decisive_entry = self.get_decisive_entry(access_mask, context)
+            if decisive_entry is None:
+                return None
+
+            audit_entries = self.get_audit_entries(decisive_entry.enforcement, access_mask, context)
+            return Decision(access_mask, decisive_entry.enforcement, self.rule, decisive_entry.entry, audit_entries)
+
+    def fromInventory(inventory, settings = None, os = WINDOWS, cache = None):
+
+        groups = []
+        for ind in inventory.groups.index:
+            groups.append(inventory.groups["object"][ind])
+
+        rule_frame = inventory.policy_rules.sort_values("rule_index", ascending=True, kind="stable")
+        rules = []
+        for ind in rule_frame.index:
+            rules.append(rule_frame["object"][ind])
+
+        return Engine(groups, rules, settings, os, cache)
+
+    def __init__(self, groups, rules, settings = None, os = WINDOWS, cache = None):
+
+        self.os = os
+        self.formats = Engine.formats_for_os[os]
+        self.cache = cache
+        self.load(groups, rules, settings)
+
+    def load(self, groups, rules, settings = None):
+
+        self.default_enforcement = Engine.get_default_enforcement(settings)
+
+        self.groups = {}
+        for group in groups:
+            if group.format not in self.formats:
+                continue
+            if group.id in self.groups:
+                continue
+            self.groups[group.id] = group
+
+        self.rules = []
+        rule_ids = set()
+        for rule in rules:
+            if rule.format not in self.formats or rule.id is None:
+                continue
+            if rule.id in rule_ids:
+                logger.debug("Skipping duplicate rule "+str(rule.id))
+                continue
+            rule_ids.add(rule.id)
+            self.rules.append(rule)
+
+        self.policy_fingerprint = Engine.get_policy_fingerprint(self.groups.values(), self.rules, self.default_enforcement)
+
+        self.compile()
+
+    def get_policy_fingerprint(groups, rules, default_enforcement):
+        sha256 = hashlib.sha256()
+        sha256.update(str(default_enforcement).encode())
+        for group in sorted(groups, key=lambda group: group.id):
+            sha256.update(str(group).encode())
+        for rule in rules:
+            sha256.update(str(rule).encode())
+        return sha256.hexdigest()
+
+    def get_default_enforcement(settings):
+        if settings is not None:
+            for setting in settings:
+                if setting.name == Setting.DefaultEnforcement:
+                    if str(setting.value).lower() in [PolicyRule.Deny.name, "2"]:
+                        return PolicyRule.Deny
+                    return PolicyRule.Allow
+
+        return PolicyRule.Allow
+
+    def compile(self):
+
+        #the descriptors of MatchAny groups are answered by the index
+        indexed_groups = []
+        for group_id in self.groups:
+            group = self.groups[group_id]
+            if Engine.is_indexed_group(group):
+                indexed_groups.append(group)
+        self.index = DescriptorIndex(indexed_groups)
+
+        self.clause_compiler = ClauseCompiler(self.compile_descriptor)
+        self.condition_count = 0
+
+        self.group_matchers = {}
+        for group_id in self.groups:
+            self.group_matchers[group_id] = self.compile_group(self.groups[group_id])
+
+        self.compiled_rules = []
+        for rule in self.rules:
+            included = self.compile_id_list(rule.included_device_properties)
+            excluded = self.compile_id_list(rule.excluded_device_properties)
+            self.compiled_rules.append(Engine.CompiledRule(rule, included, excluded, self.compile_conditions))
+
+        logger.debug("Compiled "+str(len(self.group_matchers))+" groups ("+str(len(self.index))+" indexed descriptors) and "+str(len(self.compiled_rules))+" rules")
+
+    def compile_descriptor(self, name, value):
+
+        if name == GroupProperty.WindowsGroupId or name == GroupProperty.MacGroupId:
+            group_id = value
+            def match_group(device, memo):
+                return self.match_group(group_id, device, memo)
+            return match_group
+
+        pattern = Descriptor.normalize(name, value)
+        if Descriptor.has_wildcard(pattern):
+            regex = Descriptor.wildcard_to_regex(pattern)
+            def match_wildcard(device, memo):
+                for device_value in device.get(name):
+                    if regex.fullmatch(device_value) is not None:
+                        return True
+                return False
+            return match_wildcard
+
+        def match_exact(device, memo):
+            return pattern in device.get(name)
+        return match_exact
+
+    def compile_group(self, group):
+
+        if group.format == Format.Mac:
+            return self.clause_compiler.compile(group.clauses, group.match_type)
+
+        require_all = group.match_type in [MatchType.All, MatchType.ExcludeAll]
+        is_indexed = Engine.is_indexed_group(group)
+
+        matchers = []
+        for property in group._properties:
+            if is_indexed and DescriptorIndex.is_indexed(property):
+                continue
+            matchers.append(self.compile_descriptor(property.name, property.value))
+
+        matcher = Engine.combine(matchers, require_all)
+        if group.match_type in [MatchType.ExcludeAll, MatchType.ExcludeAny]:
+            return Engine.negate(matcher)
+        return matcher
+
+    def is_indexed_group(group):
+        return group.format != Format.Mac and group.match_type not in [MatchType.All, MatchType.ExcludeAll, MatchType.ExcludeAny]
+
+    def negate(matcher):
+        def match_none(device, memo):
+            return not matcher(device, memo)
+        return match_none
+
+    def combine(matchers, require_all):
+
+        matchers = tuple(matchers)
+
+        if require_all:
+            def match_all(device, memo):
+                for matcher in matchers:
+                    if not matcher(device, memo):
+                        return False
+                return True
+            return match_all
+
+        def match_any(device, memo):
+            for matcher in matchers:
+                if matcher(device, memo):
+                    return True
+            return False
+        return match_any
+
+    def compile_id_list(self, device_properties):
+        matchers = []
+        for property in device_properties:
+            matchers.append(self.compile_descriptor(property.name, property.value))
+        return tuple(matchers)
+
+    def compile_conditions(self, entry):
+
+        matchers = []
+
+        if entry.has_user_condition():
+            sid = Context.normalize_sids(entry.sid)
+            def match_user(context):
+                return not sid.isdisjoint(context.user_sids)
+            matchers.append(match_user)
+
+        if entry.has_computer_condition():
+            computer_sid = Context.normalize_sids(entry.computersid)
+            def match_computer(context):
+                return not computer_sid.isdisjoint(context.computer_sids)
+            matchers.append(match_computer)
+
+        if entry.has_parameters():
+            matchers.append(self.compile_parameters(entry.parameters))
+
+        return Engine.combine_conditions(matchers, True)
+
+    def compile_parameters(self, parameters):
+
+        matchers = []
+        for condition in parameters.conditions:
+            if hasattr(condition, "conditions"):
+                matchers.append(self.compile_parameters(condition))
+            else:
+                matchers.append(self.compile_condition(condition))
+
+        return Engine.combine_conditions(matchers, parameters.match_type != MatchType.Any)
+
+    def compile_condition(self, condition):
+
+        facet = condition.tag
+
+        #the result of the condition is kept with the facet
+        key = ("condition", self.condition_count)
+        self.condition_count += 1
+
+        property_matchers = []
+        for property in condition.properties:
+            property_matchers.append(self.compile_descriptor(property.name, property.value))
+
+        require_all = condition.match_type in [MatchType.All, MatchType.ExcludeAll]
+        matcher = Engine.combine(property_matchers, require_all)
+        if condition.match_type in [MatchType.ExcludeAll, MatchType.ExcludeAny]:
+            matcher = Engine.negate(matcher)
+
+        def match_condition(context):
+            facet_memo = self.get_facet_memo(context, facet)
+            if facet_memo is None:
+                return False
+
+            if key not in facet_memo:
+                facet_memo[key] = matcher(context.get(facet), facet_memo)
+            return facet_memo[key]
+
+        return match_condition
+
+    def combine_conditions(matchers, require_all):
+        matchers = tuple(matchers)
+
+        if require_all:
+            def match_all_conditions(context):
+                for matcher in matchers:
+                    if not matcher(context):
+                        return False
+                return True
+            return match_all_conditions
+
+        def match_any_condition(context):
+            for matcher in matchers:
+                if matcher(context):
+                    return True
+            return False
+        return match_any_condition
+
+    def get_facet_memo(self, context, facet):
+
+        device = context.get(facet)
+        if device is None:
+            return None
+
+        if facet in context.memos:
+            policy_fingerprint, memo = context.memos[facet]
+            if policy_fingerprint == self.policy_fingerprint:
+                return memo
+
+        memo = dict.fromkeys(self.index.lookup(device), True)
+        context.memos[facet] = (self.policy_fingerprint, memo)
+        return memo
+
+    def match_group(self, group_id, device, memo):
+
+        if group_id in memo:
+            return memo[group_id]
+
+        #guard against groups that reference themselves
+        memo[group_id] = False
+
+        if group_id in self.group_matchers:
+            result = self.group_matchers[group_id](device, memo)
+        else:
+            logger.warning("No group found for "+str(group_id))
+            result = False
+
+        memo[group_id] = result
+        return result
+
+    def match_groups(self, descriptors, group_type = None):
+
+        if isinstance(descriptors, Device):
+            device = descriptors
+        else:
+            device = Device(descriptors)
+
+        memo = dict.fromkeys(self.index.lookup(device), True)
+
+        group_ids = []
+        for group_id in self.groups:
+            if group_type is not None and self.groups[group_id].group_type.name != group_type:
+                continue
+            if self.match_group(group_id, device, memo):
+                group_ids.append(group_id)
+
+        return group_ids
+
+    def groups_for_file(self, path):
+        return self.match_groups({GroupProperty.FilePath: path}, GroupType.FileGroupType)
+
+    def match_rule(self, compiled_rule, device, memo):
+
+        if len(compiled_rule.included) == 0:
+            return False
+
+        #device has to match all of the included groups
+        for matcher in compiled_rule.included:
+            if not matcher(device, memo):
+                return False
+
+        #and none of the excluded groups
+        for matcher in compiled_rule.excluded:
+            if matcher(device, memo):
+                return False
+
+        return True
+
+    def evaluate(self, device, access_mask, context = None):
+
+        if not isinstance(device, Device):
+            device = Device(device)
+
+        access_mask = int(access_mask)
+
+        if self.cache is None:
+            return self.evaluate_device(device, access_mask, context)
+
+        self.cache.validate(self.policy_fingerprint)
+
+        context_fingerprint = None
+        if context is not None:
+            context_fingerprint = context.get_fingerprint()
+
+        key = (device.get_fingerprint(), access_mask, context_fingerprint)
+        decision = self.cache.get(key)
+        if decision is None:
+            decision = self.evaluate_device(device, access_mask, context)
+            self.cache.put(key, decision)
+
+        return decision
+
+    def evaluate_device(self, device, access_mask, context = None):
+
+        memo = dict.fromkeys(self.index.lookup(device), True)
+
+        for compiled_rule in self.compiled_rules:
+
+            if not self.match_rule(compiled_rule, device, memo):
+                continue
+
+            decision = compiled_rule.get_decision(access_mask, context)
+            if decision is None:
+                continue
+
+            return decision
+
+        return Decision(access_mask, self.default_enforcement)
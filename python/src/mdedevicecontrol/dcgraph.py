@@ -43,6 +43,18 @@ from msgraph_beta.generated.models.o_data_errors.o_data_error import ODataError
 
 from msgraph_beta.generated.security.microsoft_graph_security_run_hunting_query.run_hunting_query_post_request_body import RunHuntingQueryPostRequestBody
 
+from msgraph_beta.generated.models.group import Group
+from msgraph_beta.generated.models.device_management_configuration_setting_definition import DeviceManagementConfigurationSettingDefinition
+from msgraph_beta.generated.models.device_management_configuration_policy_assignment_collection_response import DeviceManagementConfigurationPolicyAssignmentCollectionResponse
+from msgraph_beta.generated.models.device_configuration_assignment_collection_response import DeviceConfigurationAssignmentCollectionResponse
+from msgraph_beta.generated.device_management.device_configurations.item.get_oma_setting_plain_text_value_with_secret_reference_value_id.get_oma_setting_plain_text_value_with_secret_reference_value_id_get_response import GetOmaSettingPlainTextValueWithSecretReferenceValueIdGetResponse
+
+from kiota_abstractions.method import Method
+from kiota_abstractions.request_information import RequestInformation
+from kiota_serialization_json.json_parse_node import JsonParseNode
+import json
+import contextlib
+
 scopes = "DeviceManagementConfiguration.Read.All DeviceManagementConfiguration.ReadWrite.All Directory.Read.All"
 
 '''
@@ -54,8 +66,12 @@ https://graph.microsoft.com/beta/deviceManagement/reusablePolicySettings
 import logging
 logger = logging.getLogger(__name__)
 
-from kiota_http.middleware import BaseMiddleware
+from kiota_http.middleware import BaseMiddleware, RetryHandler
 import httpx
+import time
+import random
+import urllib.parse
+from email.utils import parsedate_to_datetime
 
 class DebugHandler(BaseMiddleware):
 
@@ -88,12 +104,325 @@ class DebugHandler(BaseMiddleware):
 
 
 
+class TokenBucket:
+
+    #Allows a burst of up to capacity requests, refilled at rate requests per second
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity,self.tokens + (now - self.updated)*self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        #returns the number of seconds waited for a token
+        waited = 0
+        while True:
+            self.refill()
+            if self.tokens >= 1:
+                self.tokens = self.tokens - 1
+                return waited
+
+            delay = (1 - self.tokens)/self.rate
+            await asyncio.sleep(delay)
+            waited = waited + delay
+
+
+class Scheduler:
+
+    #Paces the requests to the Graph API and retries the throttled ones.
+    #
+    #Each request takes a token from a bucket for the app, and from a bucket for its endpoint
+    #(e.g. deviceManagement/configurationPolicies) and kind (reads or writes).  The buckets
+    #are sized to the Intune limits per app per tenant: 1000 requests, and 100 writes
+    #(POST, PUT, PATCH, DELETE) per endpoint, every 20 seconds.
+    #
+    #A throttled request (429, 503 or 504) waits for its Retry-After, or for a jittered
+    #exponential backoff if there is none, and is sent again up to MaxRetries times.  The
+    #time spent waiting is reported by report().
+
+    Period = 20
+    AppLimit = 1000
+    ReadLimit = 1000
+    WriteLimit = 100
+
+    MaxRetries = 6
+    BaseDelay = 1
+    MaxDelay = 60
+
+    ThrottledStatus = [429, 503, 504]
+    WriteMethods = ["POST", "PUT", "PATCH", "DELETE"]
+
+    def __init__(self, app_limit = AppLimit, read_limit = ReadLimit, write_limit = WriteLimit, period = Period,
+                 max_retries = MaxRetries, base_delay = BaseDelay, max_delay = MaxDelay):
+
+        self.limits = {
+            "read": read_limit,
+            "write": write_limit
+        }
+        self.period = period
+        self.app_bucket = TokenBucket(app_limit/period,app_limit)
+        self.buckets = {}
+
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.requests = 0
+        self.throttled = 0
+        self.throttled_time = 0
+        self.paced_time = 0
+
+    def get_endpoint(url):
+        #the resource of the url up to the first id, e.g. deviceManagement/configurationPolicies
+        path = urllib.parse.urlsplit(url).path
+        segments = [segment for segment in path.split("/") if segment != ""]
+        if len(segments) > 0 and segments[0] in ["beta","v1.0"]:
+            segments = segments[1:]
+
+        endpoint = []
+        for segment in segments[:2]:
+            #configurationPolicies('id') addresses an item of configurationPolicies
+            name = segment.split("(")[0]
+            if name == "" or any(c.isdigit() for c in name):
+                break
+            endpoint.append(name)
+            if name != segment:
+                break
+        return "/".join(endpoint)
+
+    def get_bucket(self, method, url):
+        kind = "read"
+        if method.upper() in Scheduler.WriteMethods:
+            kind = "write"
+
+        key = (Scheduler.get_endpoint(url),kind)
+        if key not in self.buckets:
+            limit = self.limits[kind]
+            self.buckets[key] = TokenBucket(limit/self.period,limit)
+        return self.buckets[key]
+
+    async def acquire(self, method, url):
+        self.requests = self.requests + 1
+        waited = await self.app_bucket.acquire()
+        waited = waited + await self.get_bucket(method,url).acquire()
+        self.paced_time = self.paced_time + waited
+
+    async def acquire_for_request(self, request):
+        #a batch takes a token for each of its requests
+        if request.method == "POST" and request.url.path.endswith("/$batch"):
+            try:
+                batch = json.loads(request.content)
+                for batch_request in batch["requests"]:
+                    await self.acquire(batch_request["method"],batch_request["url"])
+                return
+            except (ValueError, KeyError, TypeError):
+                pass
+
+        await self.acquire(request.method,str(request.url))
+
+    def is_throttled(status):
+        return int(status) in Scheduler.ThrottledStatus
+
+    def get_retry_after(headers):
+        retry_after = None
+        for key in headers.keys():
+            if key.lower() == "retry-after":
+                retry_after = str(headers[key])
+        if retry_after is None:
+            return None
+
+        try:
+            return max(0,float(retry_after))
+        except ValueError:
+            pass
+
+        try:
+            return max(0,parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def get_delay(self, attempt, headers):
+        delay = Scheduler.get_retry_after(headers)
+        if delay is None:
+            #exponential backoff with jitter, so throttled requests don't all retry at once
+            delay = min(self.max_delay,self.base_delay*(2**attempt))
+            delay = random.uniform(delay/2,delay)
+        return delay
+
+    def can_retry(self, attempt):
+        return attempt < self.max_retries
+
+    async def wait_for_retry(self, attempt, status, headers, description):
+        delay = self.get_delay(attempt,headers)
+        logger.info("Throttled ("+str(status)+") "+description+", retrying in "+str(round(delay,2))+"s")
+
+        self.throttled = self.throttled + 1
+        self.throttled_time = self.throttled_time + delay
+        await asyncio.sleep(delay)
+
+    def report(self):
+        return "Graph requests: "+str(self.requests)+", throttled "+str(self.throttled)+" times for "+ \
+               str(round(self.throttled_time,1))+"s, paced for "+str(round(self.paced_time,1))+"s"
+
+
+class ThrottleHandler(BaseMiddleware):
+
+    #Sends each request when the scheduler allows it, and sends it again while it's throttled.
+    #Replaces the default RetryHandler.
+
+    def __init__(self, scheduler):
+        super().__init__()
+        self.scheduler = scheduler
+
+    async def send(
+        self, request: httpx.Request, transport: httpx.AsyncBaseTransport
+    ) -> httpx.Response:
+
+        attempt = 0
+        while True:
+            await self.scheduler.acquire_for_request(request)
+            response: httpx.Response = await super().send(request, transport)
+
+            if not Scheduler.is_throttled(response.status_code) or not self.scheduler.can_retry(attempt):
+                return response
+
+            await response.aread()
+            await self.scheduler.wait_for_retry(attempt,response.status_code,response.headers,request.method+" "+str(request.url.path))
+            attempt = attempt + 1
+
+
+class GraphBatch:
+
+    #Coalesces independent requests into JSON batches (POST /$batch) of at most 20 requests.
+    #
+    #A batch is sent when it is full, or once a turn of the event loop passes without any
+    #new requests, so the requests made by concurrent tasks (e.g. asyncio.gather) are sent
+    #together.  The responses are returned to each caller by the id of its request.  Only
+    #requests that don't depend on each other should be batched, as Graph may run them in
+    #any order.
+
+    MaxRequests = 20
+
+    def __init__(self, send, scheduler = None):
+        #send(body) posts a batch request body and returns the batch response body
+        self.send = send
+
+        #throttled requests in a batch are retried in a later batch
+        self.scheduler = scheduler
+
+        self.pending = []
+        self.handle = None
+        self.tasks = set()
+
+        self.batches = 0
+        self.requests = 0
+
+    async def request(self, method, url, body = None, headers = None):
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        request = {
+            "method": method,
+            "url": url
+        }
+        if headers:
+            request["headers"] = headers
+        if body is not None:
+            request["body"] = body
+
+        self.add((request,future,0))
+
+        #returns (status, headers, body)
+        return await future
+
+    def add(self, entry):
+        self.pending.append(entry)
+
+        if len(self.pending) >= GraphBatch.MaxRequests:
+            self.flush()
+        elif self.handle is None:
+            self.handle = asyncio.get_running_loop().call_soon(self.wait,len(self.pending))
+
+    def wait(self, count):
+        self.handle = None
+        if len(self.pending) == 0:
+            return
+
+        if len(self.pending) > count:
+            #requests are still being added
+            self.handle = asyncio.get_running_loop().call_soon(self.wait,len(self.pending))
+        else:
+            self.flush()
+
+    def flush(self):
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+
+        while len(self.pending) > 0:
+            batch = self.pending[:GraphBatch.MaxRequests]
+            self.pending = self.pending[GraphBatch.MaxRequests:]
+
+            task = asyncio.ensure_future(self.send_batch(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def send_batch(self, batch):
+
+        requests = []
+        for index, (request, future, attempt) in enumerate(batch):
+            requests.append(dict(request,id=str(index+1)))
+
+        self.batches = self.batches + 1
+        self.requests = self.requests + len(requests)
+        logger.debug("Sending batch of "+str(len(requests))+" requests")
+
+        try:
+            response = await self.send({"requests": requests})
+        except Exception as e:
+            for request, future, attempt in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        responses = {}
+        for item in response.get("responses",[]):
+            responses[str(item.get("id"))] = item
+
+        for index, (request, future, attempt) in enumerate(batch):
+            if future.done():
+                continue
+
+            item = responses.get(str(index+1))
+            if item is None:
+                future.set_exception(Exception("No response in batch for "+request["method"]+" "+request["url"]))
+            elif self.scheduler is not None and Scheduler.is_throttled(item["status"]) and self.scheduler.can_retry(attempt):
+                task = asyncio.ensure_future(self.retry((request,future,attempt),item))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+            else:
+                future.set_result((int(item["status"]),item.get("headers",{}),item.get("body")))
+
+    async def retry(self, entry, item):
+        request, future, attempt = entry
+        await self.scheduler.wait_for_retry(attempt,item["status"],item.get("headers",{}),request["method"]+" "+request["url"])
+        if not future.done():
+            self.add((request,future,attempt+1))
+
+
 class Graph:
     
     device_code_credential: DeviceCodeCredential
     user_client: GraphServiceClient
 
-    def __init__(self, tenantId, clientId, clientSecret, scopes = None):
+    def __init__(self, tenantId, clientId, clientSecret, scopes = None, batching = True):
         
         client_id = clientId
         self.tenant_id = tenantId
@@ -119,7 +448,14 @@ class Graph:
 
 
         
+        #the requests are paced and retried by the scheduler rather than the default RetryHandler
+        self.scheduler = Scheduler()
+
         _middleware = GraphClientFactory.get_default_middleware(None)
+        if any(isinstance(middleware,RetryHandler) for middleware in _middleware):
+            _middleware = [ThrottleHandler(self.scheduler) if isinstance(middleware,RetryHandler) else middleware for middleware in _middleware]
+        else:
+            _middleware.insert(0,ThrottleHandler(self.scheduler))
         _middleware.append(DebugHandler())
         _http_client = GraphClientFactory.create_with_custom_middleware(
             _middleware
@@ -143,6 +479,101 @@ class Graph:
 )
         logger.debug("Graph client created.")
 
+        #independent requests are sent in JSON batches
+        self.batch = None
+        if batching:
+            self.batch = GraphBatch(self.send_batch,self.scheduler)
+
+    async def send_batch(self, body):
+
+        request_adapter = self.graph_client.request_adapter
+
+        request_info = RequestInformation()
+        request_info.http_method = Method.POST
+        request_info.url_template = request_adapter.base_url.rstrip("/")+"/$batch"
+        request_info.headers.try_add("Accept","application/json")
+        request_info.set_stream_content(json.dumps(body).encode("utf-8"),"application/json")
+
+        content = await request_adapter.send_primitive_async(request_info,"bytes",{"XXX": ODataError})
+        return json.loads(content)
+
+    async def send(self, request_info, parsable_factory):
+        #sends the request of a request builder in the next batch, and parses the response like the request builder does
+
+        base_url = self.graph_client.request_adapter.base_url.rstrip("/")
+        request_info.path_parameters["baseurl"] = base_url
+        url = request_info.url
+        if url.startswith(base_url):
+            url = url[len(base_url):]
+
+        body = None
+        headers = None
+        if request_info.content:
+            body = json.loads(request_info.content)
+            headers = {"Content-Type": "application/json"}
+
+        status, response_headers, response_body = await self.batch.request(request_info.http_method.value,url,body,headers)
+
+        if status >= 400:
+            error = ODataError()
+            if isinstance(response_body,dict):
+                error = JsonParseNode(response_body).get_object_value(ODataError)
+            error.response_status_code = status
+            error.response_headers = response_headers
+            raise error
+
+        if response_body is None or parsable_factory is None:
+            return None
+        return JsonParseNode(response_body).get_object_value(parsable_factory)
+
+    async def get(self, request_builder, parsable_factory, request_configuration = None):
+        if self.batch is None:
+            return await request_builder.get(request_configuration = request_configuration)
+        return await self.send(request_builder.to_get_request_information(request_configuration),parsable_factory)
+
+    async def get_pages(self, request_builder, request_configuration = None):
+        #Yields the pages of a collection by following @odata.nextLink.  The next page is
+        #requested when a page is yielded, so it's retrieved while the page is processed.
+
+        page = await request_builder.get(request_configuration = request_configuration)
+        while page is not None:
+
+            next_page = None
+            if page.odata_next_link:
+                next_page = asyncio.ensure_future(request_builder.with_url(page.odata_next_link).get())
+
+            try:
+                yield page
+            except BaseException:
+                #the caller stopped before the next page
+                if next_page is not None:
+                    next_page.cancel()
+                raise
+
+            page = None
+            if next_page is not None:
+                page = await next_page
+
+    async def get_items(self, request_builder, request_configuration = None):
+        async with contextlib.aclosing(self.get_pages(request_builder,request_configuration)) as pages:
+            async for page in pages:
+                for item in page.value or []:
+                    yield item
+
+    async def get_all_pages(self, request_builder, request_configuration = None):
+        #the first page, with the items of all of the pages
+        result = None
+        async for page in self.get_pages(request_builder,request_configuration):
+            if result is None:
+                result = page
+                result.value = list(page.value or [])
+            else:
+                result.value.extend(page.value or [])
+
+        if result is not None:
+            result.odata_next_link = None
+        return result
+
     async def get_app_only_token(self):
         logger.debug("get_app_only_token")
         graph_scope = 'https://graph.microsoft.com/.default'
@@ -174,6 +605,12 @@ class Graph:
         return user
 
     async def export_device_configurations(self,policyFilter):
+        return await self.get_all_pages(*self.get_device_configurations_request(policyFilter))
+
+    def iterate_device_configurations(self,policyFilter):
+        return self.get_items(*self.get_device_configurations_request(policyFilter))
+
+    def get_device_configurations_request(self,policyFilter):
         
         filter_str = ""
         if policyFilter is None or policyFilter.included_policies is None:
@@ -195,8 +632,7 @@ class Graph:
         )
 
 
-        configs = await self.graph_client.device_management.device_configurations.get(request_configuration=request_configuration)
-        return configs
+        return self.graph_client.device_management.device_configurations, request_configuration
     
 
     async def create_device_configuration(self,device_configuration):
@@ -263,13 +699,14 @@ class Graph:
     async def get_xml(self,id,secret_reference):
 
         logger.debug(">>>> get_xml id="+id+" secret_reference="+secret_reference)
-        xml = await self.graph_client.device_management.device_configurations.by_device_configuration_id(id).get_oma_setting_plain_text_value_with_secret_reference_value_id(secret_reference_value_id=secret_reference).get()
+        xml = await self.get(self.graph_client.device_management.device_configurations.by_device_configuration_id(id).get_oma_setting_plain_text_value_with_secret_reference_value_id(secret_reference_value_id=secret_reference),
+                             GetOmaSettingPlainTextValueWithSecretReferenceValueIdGetResponse)
         logger.debug("<<<< get_xml "+str(xml))
         return xml
     
     async def get_group_by_id(self,group_id):
 
-        group = await self.graph_client.groups.by_group_id(group_id=group_id).get()
+        group = await self.get(self.graph_client.groups.by_group_id(group_id=group_id),Group)
         return group
     
     async def get_device_control_policy_template(self):
@@ -300,6 +737,12 @@ class Graph:
 
 
     async def get_device_control_policies(self):
+        return await self.get_all_pages(*self.get_device_control_policies_request())
+
+    def iterate_device_control_policies(self):
+        return self.get_items(*self.get_device_control_policies_request())
+
+    def get_device_control_policies_request(self):
 
         query_params = ConfigurationPoliciesRequestBuilder.ConfigurationPoliciesRequestBuilderGetQueryParameters(
 		filter = "templateReference/templateDisplayName eq 'Device Control'",
@@ -309,17 +752,19 @@ class Graph:
             query_parameters = query_params,
         )
 
-        result = await self.graph_client.device_management.configuration_policies.get(request_configuration = request_configuration)
-        return result
+        return self.graph_client.device_management.configuration_policies, request_configuration
     
     async def get_device_control_policy_settings(self,id):
-        result = await self.graph_client.device_management.configuration_policies.by_device_management_configuration_policy_id(id).settings.get()
-        return result
+        return await self.get_all_pages(self.graph_client.device_management.configuration_policies.by_device_management_configuration_policy_id(id).settings)
+
+    def iterate_device_control_policy_settings(self,id):
+        return self.get_items(self.graph_client.device_management.configuration_policies.by_device_management_configuration_policy_id(id).settings)
     
     async def get_configuration_policy_settings_templates_by_id(self,id):
+        return await self.get_all_pages(self.graph_client.device_management.configuration_policy_templates.by_device_management_configuration_policy_template_id(id).setting_templates)
 
-        result = await self.graph_client.device_management.configuration_policy_templates.by_device_management_configuration_policy_template_id(id).setting_templates.get()
-        return result
+    def iterate_configuration_policy_settings_templates_by_id(self,id):
+        return self.get_items(self.graph_client.device_management.configuration_policy_templates.by_device_management_configuration_policy_template_id(id).setting_templates)
     
     async def get_configuration_settings_for_definition(self,deviceManagementConfigurationSettingDefinitionid):
 
@@ -331,7 +776,8 @@ class Graph:
             query_parameters = query_params,
         )
 
-        result = await self.graph_client.device_management.configuration_settings.by_device_management_configuration_setting_definition_id(deviceManagementConfigurationSettingDefinitionid).get()
+        result = await self.get(self.graph_client.device_management.configuration_settings.by_device_management_configuration_setting_definition_id(deviceManagementConfigurationSettingDefinitionid),
+                                DeviceManagementConfigurationSettingDefinition)
 
         return result
 
@@ -340,13 +786,15 @@ class Graph:
         return result
     
     async def get_assignments_for_policy(self,policy_id):
-        result = await self.graph_client.device_management.configuration_policies.by_device_management_configuration_policy_id(policy_id).assignments.get()
+        result = await self.get(self.graph_client.device_management.configuration_policies.by_device_management_configuration_policy_id(policy_id).assignments,
+                                DeviceManagementConfigurationPolicyAssignmentCollectionResponse)
         
         return result
     
     async def get_assignments_for_configuration(self,id):
  
-        assignments = await self.graph_client.device_management.device_configurations.by_device_configuration_id(id).assignments.get()
+        assignments = await self.get(self.graph_client.device_management.device_configurations.by_device_configuration_id(id).assignments,
+                                     DeviceConfigurationAssignmentCollectionResponse)
         return assignments
     
     async def get_group_details(self,id):
@@ -359,10 +807,17 @@ class Graph:
             query_parameters = query_params,
         )
 
-        result = await self.graph_client.device_management.reusable_policy_settings.by_device_management_reusable_policy_setting_id(id).get(request_configuration = request_configuration)
+        result = await self.get(self.graph_client.device_management.reusable_policy_settings.by_device_management_reusable_policy_setting_id(id),
+                                DeviceManagementReusablePolicySetting,request_configuration)
         return result
     
     async def get_reusable_settings_for_groups(self):
+        return await self.get_all_pages(*self.get_reusable_settings_for_groups_request())
+
+    def iterate_reusable_settings_for_groups(self):
+        return self.get_items(*self.get_reusable_settings_for_groups_request())
+
+    def get_reusable_settings_for_groups_request(self):
         query_params = ReusableSettingsRequestBuilder.ReusableSettingsRequestBuilderGetQueryParameters(
 		    filter = "offsetUri eq '/configuration/devicecontrol/policygroups/{0}/groupdata'",
         )
@@ -371,8 +826,7 @@ class Graph:
             query_parameters = query_params,
         )
 
-        result = await self.graph_client.device_management.reusable_settings.get(request_configuration = request_configuration)
-        return result
+        return self.graph_client.device_management.reusable_settings, request_configuration
     
     async def update_group_v2(self,group,name,group_id):
 
@@ -390,7 +844,11 @@ class Graph:
 
         try:
             logger.debug("Deleteing Group v2 "+str(group_id))
-            result = await self.graph_client.device_management.reusable_policy_settings.by_device_management_reusable_policy_setting_id(group_id).delete()
+            request_builder = self.graph_client.device_management.reusable_policy_settings.by_device_management_reusable_policy_setting_id(group_id)
+            if self.batch is None:
+                result = await request_builder.delete()
+            else:
+                result = await self.send(request_builder.to_delete_request_information(),None)
             return result
         except RuntimeError as e:
             logger.error(str(e))   
@@ -408,7 +866,11 @@ class Graph:
         setting.display_name = name
         setting.setting_definition_id = "device_vendor_msft_defender_configuration_devicecontrol_policygroups_{groupid}_groupdata"
         
-        result = await self.graph_client.device_management.reusable_policy_settings.post(setting)
+        request_builder = self.graph_client.device_management.reusable_policy_settings
+        if self.batch is None:
+            result = await request_builder.post(setting)
+        else:
+            result = await self.send(request_builder.to_post_request_information(setting),DeviceManagementReusablePolicySetting)
         logger.debug(str(result))
         return result
 
@@ -1,7 +1,6 @@
 import asyncio
 import os
 import base64
-import jinja2
 from datetime import datetime
 import time
 
@@ -23,12 +22,14 @@ from msgraph_beta.generated.models.device_management_configuration_simple_settin
 from msgraph_beta.generated.models.device_management_configuration_setting_instance import DeviceManagementConfigurationSettingInstance
 
 from mdedevicecontrol.dcgraph import Graph
+from mdedevicecontrol.dctemplates import Templates
 import plistlib
 import argparse
 import json
 import pathlib
 import urllib.parse
 import hashlib
+import pickle
 
 import xml.etree.ElementTree as ET
 
@@ -51,6 +52,156 @@ def full_stack():
          stackstr += '  ' + traceback.format_exc().lstrip(trc)
     return stackstr
 
+DefaultConcurrency = 8
+
+async def run_bounded(semaphore, coroutine):
+    async with semaphore:
+        return await coroutine
+
+async def gather_items(items, get_coroutine, semaphore = None):
+    #Starts a task for each item of an async iterator as soon as it's received (e.g. while the
+    #next page is retrieved), and returns their results in the order of the items.
+    #
+    #With a semaphore, at most as many tasks run at a time as it allows.  Only the outer tasks
+    #(e.g. one per policy) hold the semaphore, so they can gather their own requests without
+    #waiting on each other.
+    tasks = []
+    try:
+        async for item in items:
+            coroutine = get_coroutine(item)
+            if coroutine is None:
+                continue
+            if semaphore is not None:
+                coroutine = run_bounded(semaphore,coroutine)
+            tasks.append(asyncio.ensure_future(coroutine))
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    return await asyncio.gather(*tasks)
+
+
+class SettingDefinitionCache:
+
+    #Setting definitions almost never change, so each definition is fetched from the Graph API
+    #once, and concurrent requests for the same definition wait for the same fetch.
+    #
+    #With a cache directory (or DC_DEFINITION_CACHE), the definitions are also kept on disk in a
+    #directory per tenant, and are fetched again once they are older than the TTL in seconds
+    #(or DC_DEFINITION_CACHE_TTL).  Increment the Version to invalidate the existing caches.
+
+    Version = 1
+    DefaultTTL = 24*60*60
+
+    def __init__(self, graph, cache_dir = None, ttl = None):
+        self.graph = graph
+
+        #definition id -> definition, and -> task for the fetches in progress
+        self.definitions = {}
+        self.pending = {}
+
+        if cache_dir is None and "DC_DEFINITION_CACHE" in os.environ:
+            cache_dir = os.environ["DC_DEFINITION_CACHE"]
+
+        if ttl is None:
+            ttl = float(os.environ.get("DC_DEFINITION_CACHE_TTL",SettingDefinitionCache.DefaultTTL))
+        self.ttl = ttl
+
+        tenant_id = getattr(graph,"tenant_id",None)
+        self.cache_dir = None
+        if cache_dir is not None:
+            if tenant_id is None:
+                logger.warning("Not caching setting definitions on disk without a tenantId")
+            else:
+                tenant_key = hashlib.sha256(tenant_id.encode()).hexdigest()[:16]
+                self.cache_dir = os.path.join(cache_dir,"v"+str(SettingDefinitionCache.Version),tenant_key)
+                os.makedirs(self.cache_dir,exist_ok=True)
+
+        self.hits = 0
+        self.fetches = 0
+
+    async def get(self, definition_id):
+
+        if definition_id in self.definitions:
+            self.hits = self.hits + 1
+            return self.definitions[definition_id]
+
+        task = self.pending.get(definition_id)
+        if task is None:
+            task = asyncio.ensure_future(self.load(definition_id))
+            self.pending[definition_id] = task
+        else:
+            self.hits = self.hits + 1
+
+        #shielded, so a cancelled caller doesn't cancel the fetch for the other callers
+        return await asyncio.shield(task)
+
+    async def load(self, definition_id):
+        try:
+            definition = self.read(definition_id)
+            if definition is None:
+                self.fetches = self.fetches + 1
+                definition = await self.graph.get_configuration_settings_for_definition(definition_id)
+                self.write(definition_id,definition)
+
+            self.definitions[definition_id] = definition
+            return definition
+        finally:
+            self.pending.pop(definition_id,None)
+
+    def get_entry_path(self, definition_id):
+        key = hashlib.sha256(definition_id.encode()).hexdigest()
+        return os.path.join(self.cache_dir,key+".pickle")
+
+    def read(self, definition_id):
+        if self.cache_dir is None:
+            return None
+
+        entry_path = self.get_entry_path(definition_id)
+        if not os.path.exists(entry_path):
+            return None
+
+        try:
+            with open(entry_path,"rb") as file:
+                entry = pickle.load(file)
+        except Exception as e:
+            logger.warning("Ignoring cached setting definition "+definition_id+": "+str(e))
+            return None
+
+        if entry["id"] != definition_id or time.time() - entry["fetched"] > self.ttl:
+            return None
+
+        return entry["definition"]
+
+    def write(self, definition_id, definition):
+        if self.cache_dir is None:
+            return
+
+        entry = {
+            "id": definition_id,
+            "fetched": time.time(),
+            "definition": definition
+        }
+
+        #write to a temporary file first, so an interrupted export doesn't leave a partial entry
+        entry_path = self.get_entry_path(definition_id)
+        temp_path = entry_path+"."+str(os.getpid())+".tmp"
+        try:
+            with open(temp_path,"wb") as file:
+                pickle.dump(entry,file)
+            os.replace(temp_path,entry_path)
+        except Exception as e:
+            logger.warning("Unable to cache setting definition "+definition_id+": "+str(e))
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def clear(cache_dir):
+        if os.path.isdir(cache_dir):
+            import shutil
+            shutil.rmtree(cache_dir)
+
+
 class DeviceControlPolicyTemplate:
 
     class Util:
@@ -731,10 +882,8 @@ class DeviceControlPolicyTemplate:
             self.policy_settings = policy_settings
 
         async def proces_data(self,graph):
-            for assignment in self.assignments.value:
-                intune_assignment = Package.IntuneAssignment(assignment)
-                await intune_assignment.update_groups(graph)
-                self.intune_assignments.append(intune_assignment)
+            self.intune_assignments = [Package.IntuneAssignment(assignment) for assignment in self.assignments.value]
+            await asyncio.gather(*[intune_assignment.update_groups(graph) for intune_assignment in self.intune_assignments])
             
             self.assignments = self.intune_assignments
             self.description = ""
@@ -785,66 +934,72 @@ class DeviceControlPolicyTemplate:
             
 
 
-    async def getTemplate(graph):
-        template = DeviceControlPolicyTemplate(graph)
+    async def getTemplate(graph,definition_cache=None):
+        template = DeviceControlPolicyTemplate(graph,definition_cache)
         await template.load_data()
         return template
 
-    def __init__(self,graph):
+    def __init__(self,graph,definition_cache=None):
         self.dc_setting_instance_templates = {}
         self.graph = graph
 
+        self.definition_cache = definition_cache
+        if definition_cache is None:
+            self.definition_cache = SettingDefinitionCache(graph)
 
-    async def getPolicies(self,policyFilter):
-
-        policies = []
-
-        #get the device control configuration policies
-        dc_policies = await self.graph.get_device_control_policies()
-        logger.info("v2 policies retrieved="+str(len(dc_policies.value))+" policies.")
-        for dc_policy in dc_policies.value:
 
-            id = dc_policy.id
-            name = dc_policy.name
+    async def getPolicies(self,policyFilter,concurrency=DefaultConcurrency):
 
+        def get_policy(dc_policy):
             if policyFilter is not None and policyFilter.included_policies is not None:
-                if name not in policyFilter.included_policies:
-                    logger.debug("Not including policy name="+name)
-                    continue
-
-
-            description = dc_policy.description
-
-            settings = await self.graph.get_device_control_policy_settings(id)
-
-            settings_value_for_policy = {}
-            for setting in settings.value:
-
-                setting_config = \
-                    await self.get_configuration_settings_for_definition(
-                        setting.setting_instance.setting_definition_id
-                )
-
-                setting_value = await self.get_value(setting)
-                if setting.setting_instance.setting_definition_id == DeviceControlPolicyTemplate.DeviceControlRule.RULE_SETTING_ID:
-                    settings_value_for_policy[setting.setting_instance.setting_definition_id] = { "value": setting_value, "id": setting.id }
-                else:
-                    oma_uri = setting_config.base_uri + setting_config.offset_uri
-                    settings_value_for_policy[oma_uri] = { "value": setting_value, "config": setting_config , "id": setting.id}
-
-
-            assignments = await self.graph.get_assignments_for_policy(id)
-
-
+                if dc_policy.name not in policyFilter.included_policies:
+                    logger.debug("Not including policy name="+dc_policy.name)
+                    return None
+            return self.getPolicy(dc_policy)
+
+        #get the device control configuration policies, a page at a time.  The policies are
+        #retrieved concurrently, and returned in the order of the Graph API
+        semaphore = asyncio.Semaphore(concurrency)
+        policies = await gather_items(self.graph.iterate_device_control_policies(),get_policy,semaphore)
+
+        logger.info("v2 policies retrieved="+str(len(policies))+" policies.")
+        return policies
+
+    async def getPolicy(self,dc_policy):
+
+        id = dc_policy.id
+        name = dc_policy.name
+        description = dc_policy.description
+
+        #the assignments are retrieved while the settings are
+        assignments = asyncio.ensure_future(self.graph.get_assignments_for_policy(id))
+        try:
+            setting_values = await gather_items(self.graph.iterate_device_control_policy_settings(id),self.get_setting_value)
+        except BaseException:
+            assignments.cancel()
+            raise
+        assignments = await assignments
+
+        settings_value_for_policy = {}
+        for setting, setting_config, setting_value in setting_values:
+            if setting.setting_instance.setting_definition_id == DeviceControlPolicyTemplate.DeviceControlRule.RULE_SETTING_ID:
+                settings_value_for_policy[setting.setting_instance.setting_definition_id] = { "value": setting_value, "id": setting.id }
+            else:
+                oma_uri = setting_config.base_uri + setting_config.offset_uri
+                settings_value_for_policy[oma_uri] = { "value": setting_value, "config": setting_config , "id": setting.id}
 
-            policy = DeviceControlPolicyTemplate.DeviceControlPolicy("v2",id,name,settings_value_for_policy,assignments)
-            await policy.proces_data(self.graph)
-            policy.description = description
+        policy = DeviceControlPolicyTemplate.DeviceControlPolicy("v2",id,name,settings_value_for_policy,assignments)
+        await policy.proces_data(self.graph)
+        policy.description = description
 
-            logger.info("Retrieved policy name="+policy.name+" id=("+policy.id+")")
-            policies.append(policy)
+        logger.info("Retrieved policy name="+policy.name+" id=("+policy.id+")")
+        return policy
 
-        return policies    
+    async def get_setting_value(self,setting):
+        setting_config, setting_value = await asyncio.gather(
+            self.get_configuration_settings_for_definition(setting.setting_instance.setting_definition_id),
+            self.get_value(setting))
+        return setting, setting_config, setting_value
 
 
 
@@ -856,10 +1011,8 @@ class DeviceControlPolicyTemplate:
         dc_policy_template = await self.graph.get_device_control_policy_template()
         dc_policy_template_id = dc_policy_template.value[0].id
 
-        dc_policy_template_settings_instance_templates = await self.graph.get_configuration_policy_settings_templates_by_id(dc_policy_template_id)
-        
         #Add the settings from the dc template to the devicecontrol api settings
-        for dc_policy_template_setting_instance_template in dc_policy_template_settings_instance_templates.value:
+        async for dc_policy_template_setting_instance_template in self.graph.iterate_configuration_policy_settings_templates_by_id(dc_policy_template_id):
             setting_instance_template = dc_policy_template_setting_instance_template.setting_instance_template
             
             details = await self.get_configuration_settings_for_definition(setting_instance_template.setting_definition_id)
@@ -944,12 +1097,11 @@ class DeviceControlPolicyTemplate:
 
             dc.Setting.addSettingData(details.name,setting_data.get_data())
 
-        group_settings = await self.graph.get_reusable_settings_for_groups()
-        for group_setting in group_settings.value:
+        async for group_setting in self.graph.iterate_reusable_settings_for_groups():
             DeviceControlPolicyTemplate.DeviceControlGroup.group_settings[group_setting.id] = group_setting
 
     async def get_configuration_settings_for_definition(self,definitionId):
-        details = await self.graph.get_configuration_settings_for_definition(definitionId)
+        details = await self.definition_cache.get(definitionId)
         return details
 
     async def get_value(self,setting):
@@ -960,19 +1112,28 @@ class DeviceControlPolicyTemplate:
         elif setting_instance.odata_type == "#microsoft.graph.deviceManagementConfigurationGroupSettingCollectionInstance":
             if setting_instance.setting_definition_id == DeviceControlPolicyTemplate.DeviceControlRule.RULE_SETTING_ID:
                 rules = DeviceControlPolicyTemplate.DeviceControlRule.createRulesFromSetting(setting_instance)
+
+                #the groups used by the rules are retrieved once each, concurrently
+                group_ids = []
+                for rule in rules:
+                    for group_id in rule.included_groups + rule.excluded_groups:
+                        if group_id not in group_ids:
+                            group_ids.append(group_id)
+
+                group_settings = await asyncio.gather(*[self.graph.get_group_details(group_id) for group_id in group_ids])
+                group_settings = dict(zip(group_ids,group_settings))
+
                 for rule in rules:
                     updated_included_groups = []
                     for group_id in rule.included_groups:
-                        group_setting = await self.graph.get_group_details(group_id)
-                        group = DeviceControlPolicyTemplate.DeviceControlGroup.createGroupfromSetting(group_setting)
+                        group = DeviceControlPolicyTemplate.DeviceControlGroup.createGroupfromSetting(group_settings[group_id])
                         updated_included_groups.append(group)
 
                     rule.included_groups = updated_included_groups
 
                     updated_excluded_groups = []
                     for group_id in rule.excluded_groups:
-                        group_setting = await self.graph.get_group_details(group_id)
-                        group = DeviceControlPolicyTemplate.DeviceControlGroup.createGroupfromSetting(group_setting)
+                        group = DeviceControlPolicyTemplate.DeviceControlGroup.createGroupfromSetting(group_settings[group_id])
                         updated_excluded_groups.append(group)
 
                     rule.excluded_groups = updated_excluded_groups
@@ -993,8 +1154,9 @@ class DeviceControlPolicyTemplate:
         if choice_setting_value.odata_type == "#microsoft.graph.deviceManagementConfigurationChoiceSettingValue":
             logger.debug("choice_value > setting_instance > choice_setting_value > value ="+choice_setting_value.value)
             
-            config = await self.graph.get_configuration_settings_for_definition(setting_instance.setting_definition_id)
-            option = await self.get_option_for_value(setting_instance.setting_definition_id,choice_setting_value.value)
+            config, option = await asyncio.gather(
+                self.get_configuration_settings_for_definition(setting_instance.setting_definition_id),
+                self.get_option_for_value(setting_instance.setting_definition_id,choice_setting_value.value))
             
             #oma_uri = config.base_uri + config.offset_uri
 
@@ -1006,7 +1168,7 @@ class DeviceControlPolicyTemplate:
                 for child in choice_setting_value.children:
                     value = None
 
-                    child_config = await self.graph.get_configuration_settings_for_definition(child.setting_definition_id)
+                    child_config = await self.get_configuration_settings_for_definition(child.setting_definition_id)
 
                     if child.odata_type == "#microsoft.graph.deviceManagementConfigurationSimpleSettingCollectionInstance":
                         value = self.get_simple_setting_collection_value(child)
@@ -1295,10 +1457,9 @@ class Package:
 
         async def setAssignments(self,assignments):
 
-            for assignment in assignments.value:
-                intune_assignment = Package.IntuneAssignment(assignment)
-                await intune_assignment.update_groups(self.graph)
-                self.assignments.append(intune_assignment)
+            intune_assignments = [Package.IntuneAssignment(assignment) for assignment in assignments.value]
+            await asyncio.gather(*[intune_assignment.update_groups(self.graph) for intune_assignment in intune_assignments])
+            self.assignments.extend(intune_assignments)
 
 
         def addGroup(self,group):
@@ -1675,8 +1836,7 @@ class Package:
         self.policies = []
         self.templateEnv = templateEnv
         if templateEnv is None:
-            templateLoader = jinja2.FileSystemLoader("templates")
-            self.templateEnv = jinja2.Environment(loader=templateLoader)
+            self.templateEnv = Templates.get_environment("templates")
 
         self.metadata = Package.Metadata()
         self.source_path = None
@@ -2041,17 +2201,23 @@ class Package:
                 result.setResultForPolicy(graph_result)
 
             if "groups" in metadata_for_policy:
+                group_names = []
                 for group_name in metadata_for_policy["groups"]:
                     group = metadata_for_policy["groups"][group_name]
                     if "id" in group and "@odata.context" in group:
                         logger.debug("group @odata.context="+group["@odata.context"])
-                        group_result = await graph.delete_group_v2(group["id"])
-                        if isinstance(group_result,ODataError):
-                            result.addResultForGroup(group_result,group_name)
-                        else:
-                            result.addResultForGroup(Package.IntuneResults.ObjectDeleted(group["id"]),group_name)
+                        group_names.append(group_name)
                     else:
                         logger.debug("No id in group "+group_name)
+
+                #the groups are deleted concurrently, so they can be sent in batches
+                group_results = await asyncio.gather(*[graph.delete_group_v2(metadata_for_policy["groups"][group_name]["id"]) for group_name in group_names])
+                for group_name, group_result in zip(group_names,group_results):
+                    group = metadata_for_policy["groups"][group_name]
+                    if isinstance(group_result,ODataError):
+                        result.addResultForGroup(group_result,group_name)
+                    else:
+                        result.addResultForGroup(Package.IntuneResults.ObjectDeleted(group["id"]),group_name)
                 
             results[policy.name] = result
             
@@ -2497,6 +2663,9 @@ async def main():
     parser_export.add_argument('-dt','--description_template',dest="description_template",help="Jinja2 template to use for the description.  Defaults to description.j2.",default="description.j2")
     parser_export.add_argument('-r','--readme',dest="readme_file",help="The readme file to generate.  Defaults to readme.md.",default="readme.md")
     parser_export.add_argument('-tp','--templates_path',dest="templates_path",help="path to Jinja2 templates.  Defaults to templates.",default="templates",type=path_array)
+    parser_export.add_argument('-cd','--cache_dir',dest="cache_dir",help="A directory to cache the setting definitions in.  Defaults to DC_DEFINITION_CACHE.",default=None)
+    parser_export.add_argument('-ct','--cache_ttl',dest="cache_ttl",type=float,help="The number of seconds the cached setting definitions are used for.  Defaults to a day.",default=None)
+    parser_export.add_argument('-j','--concurrency',dest="concurrency",type=int,help="The number of policies to retrieve at a time.  Defaults to "+str(DefaultConcurrency)+".",default=DefaultConcurrency)
     
    
 
@@ -2522,19 +2691,23 @@ async def process_args(args):
     try:
         if args.command == "export":
 
-            templateLoader = jinja2.FileSystemLoader(searchpath=args.templates_path)
-            templateEnv = jinja2.Environment(loader=templateLoader)
+            templateEnv = Templates.get_environment(args.templates_path)
 
             logger.info("Exporting package "+args.package_name+" from tenantId "+args.tenantId+" to "+args.dest)
 
             logger.debug("description_template="+args.description_template)
 
 
+            definition_cache = SettingDefinitionCache(graph,getattr(args,"cache_dir",None),getattr(args,"cache_ttl",None))
+
             await export(graph,args.dest,args.package_name,
                          templateEnv,
                          args.template,
                          args.readme_template,
-                         args.description_template)
+                         args.description_template,
+                         definition_cache=definition_cache,
+                         concurrency=getattr(args,"concurrency",DefaultConcurrency))
+            logger.info(graph.scheduler.report())
         
         elif not hasattr("command",args):
             logging.warning("No command")
@@ -2552,112 +2725,134 @@ async def process_args(args):
 
 
 
-async def export(graph: Graph, destination,name, 
-                 templateEnv, 
-                 rule_template="dcutil.j2",
-                 readme_template="readme.j2",
-                 description_template="description.j2",
-                 policy_filter = None):
+async def export_device_configuration(graph: Graph, device_config):
 
-    package = Package(name,templateEnv)
+    if device_config.odata_type == "#microsoft.graph.macOSCustomConfiguration":
+        payload_bytes = device_config.payload
+        payload = base64.b64decode(payload_bytes)
+        plist = plistlib.loads(payload,fmt=plistlib.FMT_XML)
+        if 'deviceControl' in plist['PayloadContent'][0]:
 
-    dc_policy_template = await DeviceControlPolicyTemplate.getTemplate(graph)
-    dc_policies = await dc_policy_template.getPolicies(policy_filter)
-    for dc_policy in dc_policies:
-        package.addPolicy(dc_policy)
-    
-    configs = await graph.export_device_configurations(policy_filter)
+            policy = Package.Policy(graph)
 
-    logger.info("v1 policies retrieved="+str(len(configs.value))+" policies.")
-       
-    for device_config in configs.value:
-        if device_config.odata_type == "#microsoft.graph.macOSCustomConfiguration":
-            payload_bytes = device_config.payload
-            payload = base64.b64decode(payload_bytes)
-            plist = plistlib.loads(payload,fmt=plistlib.FMT_XML)
-            if 'deviceControl' in plist['PayloadContent'][0]:
+            id = device_config.id
 
-                policy = Package.Policy(graph)
+            
+            policy.os = Package.MAC_OS
+            policy.id = id
+            policy.name = device_config.display_name
+            policy.description = device_config.description
 
-                id = device_config.id
+            deviceControl = plist['PayloadContent'][0]['deviceControl']
+            
+            policy.setPayload(deviceControl['policy'])
 
-                
-                policy.os = Package.MAC_OS
-                policy.id = id
-                policy.name = device_config.display_name
-                policy.description = device_config.description
+            assignments = await graph.get_assignments_for_configuration(id)
 
-                deviceControl = plist['PayloadContent'][0]['deviceControl']
-                
-                policy.setPayload(deviceControl['policy'])
+            await policy.setAssignments(assignments)
 
-                assignments = await graph.get_assignments_for_configuration(id)
+            logger.info("Retrieved policy name="+policy.name+" id="+policy.id)
+            return policy
 
-                await policy.setAssignments(assignments)
+    if device_config.odata_type == "#microsoft.graph.windows10CustomConfiguration":
+        
+        policy = Package.Policy(graph)
 
-                logger.info("Retrieved policy name="+policy.name+" id="+policy.id)
-                package.addPolicy(policy)
+        id = device_config.id
 
-        if device_config.odata_type == "#microsoft.graph.windows10CustomConfiguration":
-            
-            policy = Package.Policy(graph)
+        policy.id = id
+        policy.name = device_config.display_name
+        policy.description = device_config.description
 
-            id = device_config.id
+        #the assignments and the xml of the settings are retrieved concurrently
+        async def get_xml(oma_setting):
+            if oma_setting.odata_type == "#microsoft.graph.omaSettingStringXml":
+                return await graph.get_xml(id,oma_setting.secret_reference_value_id)
+            return None
 
-            policy.id = id
-            policy.name = device_config.display_name
-            policy.description = device_config.description
+        assignments, *xmls = await asyncio.gather(
+            graph.get_assignments_for_configuration(id),
+            *[get_xml(oma_setting) for oma_setting in device_config.oma_settings])
 
-            
-            assignments = await graph.get_assignments_for_configuration(id)
+        await policy.setAssignments(assignments)
 
-            await policy.setAssignments(assignments)
 
+        for oma_setting, xml in zip(device_config.oma_settings,xmls):
+            
+            name = oma_setting.display_name
+            description = oma_setting.description
+            oma_uri = oma_setting.oma_uri
 
-            for oma_setting in device_config.oma_settings:
-                
-                name = oma_setting.display_name
-                description = oma_setting.description
-                oma_uri = oma_setting.oma_uri
+            
+            if oma_setting.odata_type == "#microsoft.graph.omaSettingStringXml":
+                root = ET.fromstring(xml.value)
 
+                #logger.debug("xml="+str(xml.value))
                 
-                if oma_setting.odata_type == "#microsoft.graph.omaSettingStringXml":
-                    secret_reference_value_id = oma_setting.secret_reference_value_id
-                    xml = await graph.get_xml(id,secret_reference_value_id)
-                    root = ET.fromstring(xml.value)
 
-                    #logger.debug("xml="+str(xml.value))
-                    
+                #file name without .xml
+                name = str(oma_setting.file_name).split(".")[0]
+                if root.tag == "PolicyRule":
+                    try:
+                        rule = dc.PolicyRule(root,dc.Format.OMA_URI)
+                        policy.addRule(rule)
+                        policy.name = name
+                        policy.description = description
+                    except RuntimeError as e:
+                        logger.error("Error loading policy rule from xml: "+str(e))
+
+                elif root.tag == "Group":
+                    try:
+                        group = dc.Group(root,dc.Format.OMA_URI)
+                        policy.addGroup(group)
+                        group.name = name
+                        group.description = description
+                    except RuntimeError as e:
+                        logger.error("Error loading group from xml: "+str(e))
+            else:
+                dc_setting_name = dc.Setting.getSettingNameFor(oma_uri)
+                if dc_setting_name is not None:
+                    setting_value = oma_setting.value
+                    dc_setting = dc.Setting(dc_setting_name,setting_value)
+                    intune_settings = Package.IntuneSetting(dc_setting,oma_setting.display_name,description)
+                    policy.addSetting(intune_settings)
 
-                    #file name without .xml
-                    name = str(oma_setting.file_name).split(".")[0]
-                    if root.tag == "PolicyRule":
-                        try:
-                            rule = dc.PolicyRule(root,dc.Format.OMA_URI)
-                            policy.addRule(rule)
-                            policy.name = name
-                            policy.description = description
-                        except RuntimeError as e:
-                            logger.error("Error loading policy rule from xml: "+str(e))
-
-                    elif root.tag == "Group":
-                        try:
-                            group = dc.Group(root,dc.Format.OMA_URI)
-                            policy.addGroup(group)
-                            group.name = name
-                            group.description = description
-                        except RuntimeError as e:
-                            logger.error("Error loading group from xml: "+str(e))
-                else:
-                    dc_setting_name = dc.Setting.getSettingNameFor(oma_uri)
-                    if dc_setting_name is not None:
-                        setting_value = oma_setting.value
-                        dc_setting = dc.Setting(dc_setting_name,setting_value)
-                        intune_settings = Package.IntuneSetting(dc_setting,oma_setting.display_name,description)
-                        policy.addSetting(intune_settings)
+        logger.info("Retrieved policy name="+policy.name+" id="+policy.id)
 
-            logger.info("Retrieved policy name="+policy.name+" id="+policy.id)
+        return policy
+
+    return None
+
+
+async def export(graph: Graph, destination,name, 
+                 templateEnv, 
+                 rule_template="dcutil.j2",
+                 readme_template="readme.j2",
+                 description_template="description.j2",
+                 policy_filter = None,
+                 definition_cache = None,
+                 concurrency = DefaultConcurrency):
+
+    package = Package(name,templateEnv)
+
+    dc_policy_template = await DeviceControlPolicyTemplate.getTemplate(graph,definition_cache)
+    dc_policies = await dc_policy_template.getPolicies(policy_filter,concurrency)
+
+    definition_cache = dc_policy_template.definition_cache
+    logger.info("Setting definitions: "+str(definition_cache.fetches)+" fetched, "+str(definition_cache.hits)+" cached")
+    for dc_policy in dc_policies:
+        package.addPolicy(dc_policy)
+    
+    #the policies are retrieved concurrently, a page at a time, and added to the package in the order of the Graph API
+    semaphore = asyncio.Semaphore(concurrency)
+    policies = await gather_items(graph.iterate_device_configurations(policy_filter),
+                                  lambda device_config: export_device_configuration(graph,device_config),
+                                  semaphore)
+
+    logger.info("v1 policies retrieved="+str(len(policies))+" policies.")
 
+    for policy in policies:
+        if policy is not None:
             package.addPolicy(policy)
     
 
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+
+#Replays an Advanced Hunting export of DeviceEvents against a policy package.
+#
+#The export is read in chunks so that only one chunk of events, the decision
+#cache and the per rule counters are held in memory.
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import pathlib
+
+import pandas as pd
+
+from mdedevicecontrol import GroupProperty, PolicyRule, Settings, Setting, WindowsEntryType
+from mdedevicecontrol.dcengine import Engine, Device, DecisionCache
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class Event:
+
+    RemovableStoragePolicyTriggered = "RemovableStoragePolicyTriggered"
+    RemovableStorageFileEvent = "RemovableStorageFileEvent"
+    PrintJobBlocked = "PrintJobBlocked"
+    PnpDeviceAllowed = "PnpDeviceAllowed"
+    PnpDeviceBlocked = "PnpDeviceBlocked"
+
+    #AdditionalFields (with and without the Media prefix used by the reports)
+    descriptor_fields = {
+        GroupProperty.WindowsDeviceInstancePath: ["MediaInstanceId", "DeviceInstanceId", "InstanceId"],
+        GroupProperty.WindowsDeviceId: ["MediaDeviceId", "DeviceId"],
+        GroupProperty.WindowsDeviceSerialNumber: ["MediaSerialNumber", "SerialNumber"],
+        GroupProperty.WindowsDeviceFriendlyName: ["MediaName", "FriendlyName", "PrinterName"],
+        GroupProperty.WindowsDeviceBus: ["MediaBusType", "BusType"],
+        GroupProperty.WindowsDeviceVendor: ["MediaVendorId", "VendorId"],
+        GroupProperty.WindowsDeviceProduct: ["MediaProductId", "ProductId"],
+        GroupProperty.WindowsDeviceHardwareId: ["HardwareId", "HardwareIds"]
+    }
+
+    access_labels = {
+        "READ": WindowsEntryType.DiskReadMask,
+        "WRITE": WindowsEntryType.DiskWriteMask,
+        "EXECUTE": WindowsEntryType.DiskExecuteMask,
+        "FILEREAD": WindowsEntryType.FileReadMask,
+        "FILEWRITE": WindowsEntryType.FileWriteMask,
+        "FILEEXECUTE": WindowsEntryType.FileExecuteMask,
+        "PRINT": WindowsEntryType.PrintMask
+    }
+
+    device_families = {
+        "CDROM": GroupProperty.WindowsCdRomDevices,
+        "WPD": GroupProperty.WindowsPortableDevices
+    }
+
+    def get_additional_fields(record):
+        additional_fields = record.get("AdditionalFields")
+        if additional_fields is None or (isinstance(additional_fields, float) and pd.isna(additional_fields)):
+            return {}
+        if isinstance(additional_fields, dict):
+            return additional_fields
+        try:
+            return json.loads(additional_fields)
+        except ValueError:
+            logger.debug("Unable to parse AdditionalFields "+str(additional_fields))
+            return {}
+
+    def get_field(fields, names):
+        for name in names:
+            if name in fields and fields[name] is not None and str(fields[name]) != "":
+                return str(fields[name])
+        return None
+
+    def get_access_mask(access):
+        access_mask = 0
+        if access is None:
+            return access_mask
+
+        for label in str(access).replace(";", ",").replace("|", ",").split(","):
+            label = label.strip().replace(" ", "").upper()
+            if label in Event.access_labels:
+                access_mask = access_mask | Event.access_labels[label]
+            elif label.isdigit():
+                access_mask = access_mask | int(label)
+
+        return access_mask
+
+    def get_enforcement(verdict):
+        if verdict is None:
+            return None
+
+        verdict = str(verdict).strip().lower()
+        for enforcement in PolicyRule.Enforcements:
+            if verdict in [enforcement.name.lower(), enforcement.variations["gpo"].lower()]:
+                #an audit only records the decision of the allow or deny entry
+                if str(enforcement) in Engine.audit_enforcements:
+                    return Engine.audit_enforcements[str(enforcement)]
+                return enforcement
+
+        if verdict.startswith("allow"):
+            return PolicyRule.Allow
+        if verdict.startswith("deny") or verdict.startswith("block"):
+            return PolicyRule.Deny
+
+        return None
+
+    def __init__(self, record):
+
+        self.action_type = record.get("ActionType")
+        self.timestamp = record.get("Timestamp")
+        self.device_name = record.get("DeviceName")
+        self.report_id = record.get("ReportId")
+
+        fields = Event.get_additional_fields(record)
+        descriptors = {}
+        for name in Event.descriptor_fields:
+            value = Event.get_field(fields, Event.descriptor_fields[name])
+            if value is not None:
+                descriptors[name] = value
+
+        if GroupProperty.WindowsDeviceVendor in descriptors and GroupProperty.WindowsDeviceProduct in descriptors:
+            descriptors[GroupProperty.WindowsDeviceVendorProduct] = descriptors[GroupProperty.WindowsDeviceVendor]+"_"+descriptors[GroupProperty.WindowsDeviceProduct]
+
+        if self.action_type == Event.PrintJobBlocked:
+            descriptors[GroupProperty.WindowsDeviceFamily] = GroupProperty.WindowsPrinterDevices
+            self.access_mask = WindowsEntryType.PrintMask
+        else:
+            class_name = str(Event.get_field(fields, ["MediaClassName", "ClassName"])).upper()
+            if class_name in Event.device_families:
+                descriptors[GroupProperty.WindowsDeviceFamily] = Event.device_families[class_name]
+            else:
+                descriptors[GroupProperty.WindowsDeviceFamily] = GroupProperty.WindowsRemovableMediaDevices
+            self.access_mask = Event.get_access_mask(Event.get_field(fields, ["RemovableStorageAccess", "AccessMask"]))
+
+        self.device = Device(descriptors)
+        self.enforcement = Event.get_enforcement(Event.get_field(fields, ["RemovableStoragePolicyVerdict", "PolicyVerdict", "Verdict"]))
+        self.rule_id = Event.get_field(fields, ["RemovableStoragePolicy", "PolicyRuleId", "RuleId"])
+
+    def is_valid(self):
+        return self.access_mask != 0 and len(self.device.descriptors) > 1
+
+
+class EventReader:
+
+    def __init__(self, path, chunk_size = 10000):
+        self.path = path
+        self.chunk_size = chunk_size
+
+    def is_json(self):
+        return pathlib.Path(self.path).suffix.lower() in [".json", ".jsonl", ".ndjson"]
+
+    def __iter__(self):
+        if self.is_json():
+            return self.read_json()
+        return self.read_csv()
+
+    def read_json(self):
+        with open(self.path, "r", encoding="utf-8") as json_file:
+            while True:
+                lines = list(itertools.islice(json_file, self.chunk_size))
+                if len(lines) == 0:
+                    break
+
+                records = []
+                for line in lines:
+                    line = line.strip()
+                    if len(line) > 0:
+                        records.append(json.loads(line))
+                yield records
+
+    def read_csv(self):
+        for chunk in pd.read_csv(self.path, dtype=str, keep_default_na=False, chunksize=self.chunk_size):
+            yield chunk.to_dict("records")
+
+
+class ReplayReport:
+
+    mismatch_columns = ["Timestamp", "DeviceName", "ReportId", "ActionType", "AccessMask", "ObservedEnforcement", "ObservedRule", "ExpectedEnforcement", "ExpectedRule", "ExpectedRuleName"]
+
+    def __init__(self, engine, mismatch_file = None, max_mismatches = 1000):
+        self.events = 0
+        self.evaluated = 0
+        self.skipped = 0
+        self.mismatch_count = 0
+        self.default_hits = 0
+
+        self.rule_hits = {}
+        self.rule_names = {}
+        for compiled_rule in engine.compiled_rules:
+            self.rule_hits[compiled_rule.rule.id] = 0
+            self.rule_names[compiled_rule.rule.id] = compiled_rule.rule.name
+
+        #only a sample of the mismatches is kept in memory, the rest are written to the file
+        self.max_mismatches = max_mismatches
+        self.mismatches = []
+
+        self.mismatch_file = None
+        self.mismatch_writer = None
+        if mismatch_file is not None:
+            self.mismatch_file = open(mismatch_file, "w", newline="", encoding="utf-8")
+            self.mismatch_writer = csv.writer(self.mismatch_file)
+            self.mismatch_writer.writerow(ReplayReport.mismatch_columns)
+
+    def add(self, event, decision):
+        self.evaluated += 1
+
+        if decision.is_default():
+            self.default_hits += 1
+        else:
+            self.rule_hits[decision.rule.id] += 1
+
+        expected_rule = None if decision.is_default() else decision.rule.id
+
+        mismatch = event.enforcement is not None and event.enforcement != decision.enforcement
+        if event.rule_id is not None and expected_rule is not None and event.rule_id.lower() != expected_rule.lower():
+            mismatch = True
+
+        if mismatch:
+            self.mismatch_count += 1
+            row = [
+                event.timestamp,
+                event.device_name,
+                event.report_id,
+                event.action_type,
+                event.access_mask,
+                str(event.enforcement),
+                event.rule_id,
+                str(decision.enforcement),
+                expected_rule,
+                None if decision.is_default() else decision.rule.name
+            ]
+            if len(self.mismatches) < self.max_mismatches:
+                self.mismatches.append(row)
+            if self.mismatch_writer is not None:
+                self.mismatch_writer.writerow(row)
+
+    def close(self):
+        if self.mismatch_file is not None:
+            self.mismatch_file.close()
+            self.mismatch_file = None
+            self.mismatch_writer = None
+
+    def get_rule_hits(self):
+        rows = {
+            "rule_id": [],
+            "rule_name": [],
+            "hits": []
+        }
+        for rule_id in self.rule_hits:
+            rows["rule_id"].append(rule_id)
+            rows["rule_name"].append(self.rule_names[rule_id])
+            rows["hits"].append(self.rule_hits[rule_id])
+
+        rows["rule_id"].append("")
+        rows["rule_name"].append("Default Enforcement")
+        rows["hits"].append(self.default_hits)
+
+        return pd.DataFrame(rows)
+
+    def get_mismatches(self):
+        return pd.DataFrame(self.mismatches, columns=ReplayReport.mismatch_columns)
+
+    def __str__(self):
+        out = "events="+str(self.events)
+        out += " evaluated="+str(self.evaluated)
+        out += " skipped="+str(self.skipped)
+        out += " mismatches="+str(self.mismatch_count)
+        return out
+
+
+class Replay:
+
+    def __init__(self, engine, cache_size = 65536):
+        self.engine = engine
+        if self.engine.cache is None and cache_size > 0:
+            self.engine.cache = DecisionCache(cache_size)
+
+    def run(self, reader, mismatch_file = None, max_mismatches = 1000):
+
+        report = ReplayReport(self.engine, mismatch_file, max_mismatches)
+        try:
+            for records in reader:
+                for record in records:
+                    report.events += 1
+
+                    event = Event(record)
+                    if not event.is_valid():
+                        report.skipped += 1
+                        continue
+
+                    decision = self.engine.evaluate(event.device, event.access_mask)
+                    report.add(event, decision)
+
+                logger.debug("Replayed "+str(report))
+        finally:
+            report.close()
+
+        if self.engine.cache is not None:
+            logger.info("Decision cache "+str(self.engine.cache.get_statistics()))
+
+        return report
+
+
+def replay(inventory, events_file, dest = ".", chunk_size = 10000, settings = None):
+
+    engine = Engine.fromInventory(inventory, settings)
+
+    mismatch_file = os.path.join(dest, "dc_replay_mismatches.csv")
+    report = Replay(engine).run(EventReader(events_file, chunk_size), mismatch_file)
+
+    rule_hits_file = os.path.join(dest, "dc_replay_rule_hits.csv")
+    report.get_rule_hits().to_csv(rule_hits_file, index=False)
+
+    logger.info("Replayed "+str(report))
+    logger.info("Generated "+str(pathlib.Path(rule_hits_file).resolve())+" and "+str(pathlib.Path(mismatch_file).resolve()))
+
+    return report
+
+
+def process_args(args):
+
+    import logging.config
+    logging.config.fileConfig(args.loggingConf)
+
+    from mdedevicecontrol.dcdoc import Inventory
+
+    inventory = Inventory(args.source_path, None, args.dest)
+    settings = Settings({Setting.DefaultEnforcement: args.default_enforcement})
+
+    replay(inventory, args.events_file, args.dest, args.chunk_size, settings)
+
+
+def main():
+
+    from mdedevicecontrol.dcdoc import dir_path, dir, file
+
+    arg_parser = argparse.ArgumentParser(
+        description='Replays an Advanced Hunting export of DeviceEvents against device control policies.')
+
+    arg_parser.add_argument('-e', '--events', dest="events_file", type=file, required=True, help='The exported DeviceEvents (jsonl or csv)')
+    arg_parser.add_argument('-l', '--loggingConf', type=file, dest="loggingConf", help="path to the logging.conf", default="logging.conf")
+    arg_parser.add_argument('-p', '--path', type=dir_path, dest="source_path", help='The path to search for source files.  Defaults to current working directory.', default=".")
+    arg_parser.add_argument('-d', '--dest', dest="dest", type=dir, help="The output directory.  Defaults to current working directory.", default=".")
+    arg_parser.add_argument('-c', '--chunk_size', dest="chunk_size", type=int, help="The number of events to read at a time.  Defaults to 10000.", default=10000)
+    arg_parser.add_argument('-de', '--default_enforcement', dest="default_enforcement", choices=["Allow", "Deny"], help="The default enforcement.  Defaults to Deny.", default="Deny")
+
+    args = arg_parser.parse_args()
+
+    process_args(args)
+
+if __name__ == '__main__':
+    main()
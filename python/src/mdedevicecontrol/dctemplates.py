@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+
+#Shared Jinja2 environments for the templates.
+#
+#An environment is created once per template search path and reused by every caller in the
+#process (and by forked workers).  The compiled templates are kept in a bytecode cache on disk,
+#so they are only compiled again when their source changes.
+#
+#The packaged templates can also be precompiled into python modules, either after installing
+#(dctemplates) or when the package is built (DC_PRECOMPILE_TEMPLATES=1 pip install).
+#A precompiled template is only used while its source has the same SHA-256 hash as when it
+#was compiled, and with the same version of Jinja2.  Otherwise it is loaded from the source.
+#
+#This module doesn't import the rest of the package, so it can be loaded when building it.
+
+import os
+import json
+import hashlib
+import pathlib
+
+import jinja2
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class PrecompiledLoader(jinja2.ModuleLoader):
+
+    def __init__(self, compiled_path, templates_path, manifest):
+        super().__init__(compiled_path)
+        self.templates_path = templates_path
+        self.hashes = manifest["templates"]
+
+        #name -> (mtime, size, is current) so unchanged sources aren't hashed again
+        self.checked = {}
+
+    def is_current(self, name):
+        if name not in self.hashes:
+            return False
+
+        source_file = os.path.join(self.templates_path,name)
+        try:
+            stat = os.stat(source_file)
+        except OSError:
+            return False
+
+        checked = self.checked.get(name)
+        if checked is not None and checked[0] == stat.st_mtime_ns and checked[1] == stat.st_size:
+            return checked[2]
+
+        current = Templates.getSHA256Hash(source_file) == self.hashes[name]
+        if not current:
+            logger.debug("Precompiled template "+name+" is out of date")
+        self.checked[name] = (stat.st_mtime_ns,stat.st_size,current)
+        return current
+
+    def load(self, environment, name, globals=None):
+        if not self.is_current(name):
+            raise jinja2.TemplateNotFound(name)
+
+        template = super().load(environment,name,globals)
+
+        #reload from the source if it changes while the environment is in use
+        template._uptodate = lambda: self.is_current(name)
+        return template
+
+
+class Templates:
+
+    packaged_path = str(pathlib.Path(__file__).parent.resolve() / "templates")
+    compiled_path = str(pathlib.Path(__file__).parent.resolve() / "templates_compiled")
+
+    Manifest = "manifest.json"
+
+    #(search path, cache dir) -> Environment
+    environments = {}
+
+    def get_search_path(templates_path):
+        if isinstance(templates_path,(str,os.PathLike)):
+            templates_path = [templates_path]
+        return [str(pathlib.Path(path).resolve()) for path in templates_path]
+
+    def get_cache_dir(cache_dir = None):
+        if cache_dir is None and "DC_TEMPLATE_CACHE" in os.environ:
+            cache_dir = os.environ["DC_TEMPLATE_CACHE"]
+        return cache_dir
+
+    def create_bytecode_cache(cache_dir = None):
+        cache_dir = Templates.get_cache_dir(cache_dir)
+        if cache_dir is None:
+            #a private directory per user in the temp directory
+            return jinja2.FileSystemBytecodeCache()
+        os.makedirs(cache_dir,exist_ok=True)
+        return jinja2.FileSystemBytecodeCache(cache_dir)
+
+    def create_environment(loader, bytecode_cache = None):
+        #the precompiled templates are compiled with these same options
+        return jinja2.Environment(loader=loader,bytecode_cache=bytecode_cache)
+
+    def get_environment(templates_path = None, cache_dir = None):
+
+        if templates_path is None:
+            templates_path = Templates.packaged_path
+
+        search_path = Templates.get_search_path(templates_path)
+        cache_dir = Templates.get_cache_dir(cache_dir)
+
+        key = (tuple(search_path),cache_dir)
+        if key not in Templates.environments:
+            logger.debug("Creating template environment for "+os.pathsep.join(search_path))
+            Templates.environments[key] = Templates.create_environment(Templates.create_loader(search_path),
+                                                                       Templates.create_bytecode_cache(cache_dir))
+        return Templates.environments[key]
+
+    def create_loader(search_path):
+
+        loader = jinja2.FileSystemLoader(search_path)
+        if Templates.packaged_path not in search_path:
+            return loader
+
+        manifest = Templates.load_manifest(Templates.compiled_path)
+        if manifest is None:
+            return loader
+
+        #templates earlier in the search path still override the packaged ones
+        loaders = []
+        index = search_path.index(Templates.packaged_path)
+        if index > 0:
+            loaders.append(jinja2.FileSystemLoader(search_path[:index]))
+        loaders.append(PrecompiledLoader(Templates.compiled_path,Templates.packaged_path,manifest))
+        loaders.append(loader)
+
+        return jinja2.ChoiceLoader(loaders)
+
+    def load_manifest(compiled_path):
+        manifest_file = os.path.join(compiled_path,Templates.Manifest)
+        if not os.path.exists(manifest_file):
+            return None
+
+        try:
+            with open(manifest_file) as file:
+                manifest = json.load(file)
+        except Exception as e:
+            logger.warning("Ignoring precompiled templates in "+compiled_path+": "+str(e))
+            return None
+
+        if manifest.get("jinja2") != jinja2.__version__:
+            logger.info("Ignoring precompiled templates for Jinja2 "+str(manifest.get("jinja2")))
+            return None
+
+        return manifest
+
+    #Same hash as Package.getSHA256Hash(filename,"rb")
+    def getSHA256Hash(filename):
+        with open(filename,"rb") as file:
+            return hashlib.sha256(file.read()).hexdigest()
+
+    def precompile(templates_path = None, compiled_path = None):
+
+        if templates_path is None:
+            templates_path = Templates.packaged_path
+        if compiled_path is None:
+            compiled_path = Templates.compiled_path
+
+        environment = Templates.create_environment(jinja2.FileSystemLoader(templates_path))
+        names = environment.list_templates(filter_func=lambda name: name.endswith(".j2"))
+
+        os.makedirs(compiled_path,exist_ok=True)
+        manifest_file = os.path.join(compiled_path,Templates.Manifest)
+        if os.path.exists(manifest_file):
+            os.remove(manifest_file)
+
+        environment.compile_templates(compiled_path,zip=None,filter_func=lambda name: name in names,
+                                      log_function=logger.debug,ignore_errors=False)
+
+        manifest = {
+            "jinja2": jinja2.__version__,
+            "templates": {}
+        }
+        for name in names:
+            manifest["templates"][name] = Templates.getSHA256Hash(os.path.join(templates_path,name))
+
+        #written last, so the modules aren't used if the compile is interrupted
+        with open(manifest_file,"w") as file:
+            json.dump(manifest,file,indent=2)
+
+        logger.info("Precompiled "+str(len(names))+" templates to "+str(compiled_path))
+        return names
+
+    def clear(compiled_path = None):
+        import shutil
+
+        if compiled_path is None:
+            compiled_path = Templates.compiled_path
+        if os.path.isdir(compiled_path):
+            shutil.rmtree(compiled_path)
+
+        Templates.create_bytecode_cache().clear()
+        Templates.environments = {}
+
+
+def main():
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(
+        description='Precompiles the Jinja2 templates used to generate the documentation and the packages.')
+
+    arg_parser.add_argument('-tp','--templates_path',dest="templates_path",help="path to Jinja2 templates.  Defaults to the packaged templates.",default=None)
+    arg_parser.add_argument('-o','--output',dest="compiled_path",help="directory to write the compiled templates to.  Defaults to the package.",default=None)
+    arg_parser.add_argument('--clear',dest="clear",action="store_true",help="removes the precompiled templates and the template cache")
+
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    if args.clear:
+        Templates.clear(args.compiled_path)
+    else:
+        Templates.precompile(args.templates_path,args.compiled_path)
+
+
+if __name__ == '__main__':
+    main()
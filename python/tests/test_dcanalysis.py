@@ -0,0 +1,105 @@
+import mdedevicecontrol as dc
+from mdedevicecontrol.dcengine import Engine
+from mdedevicecontrol.dcanalysis import Analysis, Atom, Region
+
+from tests.test_dcengine import create_policy
+
+
+def create_analysis():
+
+    groups, rules = create_policy()
+    api = dc.api()
+
+    kingston = api.createGroup(name="Kingston",
+            properties=[api.createProperty(dc.Group.WindowsDeviceVendorProductProperty,"0951-1666")])
+
+    deny_all = rules[2].entries[0]
+    deny_kingston = api.createRule("Deny Kingston",included_groups=[kingston],entries=[deny_all])
+    deny_removable = api.createRule("Deny removable media",included_groups=[groups[0]],entries=[deny_all])
+
+    groups.append(kingston)
+    rules.insert(2,deny_kingston)
+    rules.append(deny_removable)
+
+    return Analysis(Engine(groups,rules)), rules
+
+
+def test_atoms():
+
+    kingston = Atom.create(dc.GroupProperty.WindowsDeviceVendorProduct,"0951-1666")
+    assert Atom.is_contained(kingston,Atom.create(dc.GroupProperty.WindowsDeviceVendorProduct,"0951_16*"))
+    assert Atom.is_contained(kingston,Atom.create(dc.GroupProperty.WindowsDeviceVendor,"0951"))
+    assert not Atom.is_contained(kingston,Atom.create(dc.GroupProperty.WindowsDeviceVendor,"abcd"))
+
+    other = Atom.create(dc.GroupProperty.WindowsDeviceVendorProduct,"abcd_1234")
+    assert Region([frozenset([kingston])]).is_disjoint(Region([frozenset([other])]))
+    assert not Region([frozenset([kingston,other])]).is_disjoint(Region([frozenset([other])]))
+
+
+def test_shadowed_rules():
+
+    analysis, rules = create_analysis()
+    shadowed = analysis.find_shadowed_rules()
+
+    assert list(shadowed["ruleId"]) == [rules[2].id]
+    assert shadowed["shadowedBy"][0] == rules[0].id
+    assert shadowed["accessMask"][0] == 7
+    assert shadowed["fullyShadowed"][0]
+
+
+def test_conflicts():
+
+    analysis, rules = create_analysis()
+    conflicts = analysis.find_conflicts()
+
+    found = {}
+    for ind in conflicts.index:
+        found[(conflicts["ruleId"][ind],conflicts["conflictsWith"][ind])] = conflicts["accessMask"][ind]
+
+    #Deny Kingston overlaps Allow USBs, Deny removable media overlaps the read only rule on read
+    assert found[(rules[2].id,rules[0].id)] == 7
+    assert found[(rules[5].id,rules[1].id)] == dc.WindowsEntryType.DiskReadMask
+
+
+def test_conflicts_without_common_atoms():
+
+    analysis, rules = create_analysis()
+    conflicts = analysis.find_conflicts()
+
+    #Allow USBs (by vendor and product) and Deny removable media (by device family) have no descriptor in common
+    assert analysis.get_candidates(5) == {1}
+    conflicting = [(conflicts["ruleId"][ind],conflicts["conflictsWith"][ind]) for ind in conflicts.index]
+    assert (rules[5].id,rules[0].id) in conflicting
+
+
+def test_wildcard_rules():
+
+    api = dc.api()
+
+    usb_storage = api.createGroup(name="USB storage",
+            properties=[api.createProperty(dc.Group.WindowsDeviceInstancePathProperty,"USBSTOR\\*")])
+
+    deny_all = api.createEntry(enforcement=dc.PolicyRule.Deny,permissions={
+        dc.WindowsEntryType.DiskReadMask: True,
+        dc.WindowsEntryType.DiskWriteMask: True,
+        dc.WindowsEntryType.DiskExecuteMask: True
+    })
+    read_only = api.createEntry(permissions={
+        dc.WindowsEntryType.DiskReadMask: True
+    })
+
+    rules = [api.createRule("Deny USB storage",included_groups=[usb_storage],entries=[deny_all]),
+             api.createRule("Deny USB storage again",included_groups=[usb_storage],entries=[deny_all]),
+             api.createRule("Read USB storage",included_groups=[usb_storage],entries=[read_only])]
+
+    analysis = Analysis(Engine([usb_storage],rules))
+
+    shadowed = analysis.find_shadowed_rules()
+    assert list(shadowed["ruleId"]) == [rules[1].id,rules[2].id]
+    assert list(shadowed["shadowedBy"]) == [rules[0].id,rules[0].id]
+    assert shadowed["fullyShadowed"][0]
+
+    conflicts = analysis.find_conflicts()
+    assert list(conflicts["ruleId"]) == [rules[2].id,rules[2].id]
+    assert list(conflicts["conflictsWith"]) == [rules[0].id,rules[1].id]
+    assert list(conflicts["accessMask"]) == [dc.WindowsEntryType.DiskReadMask,dc.WindowsEntryType.DiskReadMask]
@@ -0,0 +1,106 @@
+import mdedevicecontrol as dc
+import mdedevicecontrol.dcdoc as doc
+from mdedevicecontrol.dcengine import Engine, Device
+from mdedevicecontrol.dcbatch import DeviceInventory, BatchEvaluator, Coverage
+
+import os
+import pytest
+import pandas as pd
+
+from tests import root_dir
+from tests.test_dcengine import create_policy
+
+
+def create_devices():
+    return pd.DataFrame({
+        "DeviceName": ["allowed","other","printer","hardware"],
+        dc.GroupProperty.WindowsDeviceFamily: ["RemovableMediaDevices","removablemediadevices","PrinterDevices","RemovableMediaDevices"],
+        dc.GroupProperty.WindowsDeviceVendorProduct: ["0951-1666","abcd_1234","",""],
+        dc.GroupProperty.WindowsDeviceHardwareId: ["","","","USBSTOR\\DiskGeneric;USBSTOR\\GenericDisk"],
+        dc.GroupProperty.WindowsDeviceInstancePath: ["","USBSTOR\\DISK&VEN_GENERIC&PROD_1\\1","",""],
+        "SerialNumber": ["","","","111111111"]
+    })
+
+
+def test_batch_evaluate():
+
+    groups, rules = create_policy()
+    engine = Engine(groups,rules)
+
+    frame = create_devices()
+    devices = DeviceInventory(frame)
+    decisions = BatchEvaluator(engine,devices).evaluate()
+
+    assert len(decisions.index) == len(frame.index) * len(BatchEvaluator.default_access_masks)
+
+    #the batch decisions are the same as evaluating each device
+    for row in frame.to_dict("records"):
+        name = row.pop("DeviceName")
+        row[dc.GroupProperty.WindowsDeviceSerialNumber] = row.pop("SerialNumber")
+        row[dc.GroupProperty.WindowsDeviceHardwareId] = row[dc.GroupProperty.WindowsDeviceHardwareId].split(";")
+        device = Device(row)
+
+        for access_mask in BatchEvaluator.default_access_masks:
+            decision = engine.evaluate(device,access_mask)
+            batch = decisions[(decisions["device"] == name) & (decisions["access_mask"] == access_mask)].iloc[0]
+
+            assert batch["enforcement"] == str(decision.enforcement)
+            assert batch["default"] == decision.is_default()
+            if not decision.is_default():
+                assert batch["rule_id"] == decision.rule.id
+                assert batch["entry_id"] == decision.entry.id
+
+
+def test_batch_evaluate_inventory(tmp_path):
+
+    inventory = doc.Inventory([str(os.path.join(root_dir,"windows","device"))])
+
+    devices_file = os.path.join(tmp_path,"devices.csv")
+    create_devices().to_csv(devices_file,index=False)
+    out_file = os.path.join(tmp_path,"dc_decisions.csv")
+
+    from mdedevicecontrol.dcbatch import evaluate_devices
+    evaluate_devices(inventory,devices_file,out_file,doc.Default_Settings)
+
+    decisions = pd.read_csv(out_file)
+    assert len(decisions.index) == 4 * len(BatchEvaluator.default_access_masks)
+
+
+def test_coverage(tmp_path):
+
+    groups, rules = create_policy()
+    engine = Engine(groups,rules)
+
+    evaluator = BatchEvaluator(engine,DeviceInventory(create_devices()))
+    coverage = Coverage(evaluator)
+
+    group_coverage = coverage.get_group_coverage().set_index("groupId")
+    assert group_coverage["matchedDevices"][groups[0].id] == 3
+
+    rule_coverage = coverage.get_rule_coverage().set_index("ruleId")
+    assert rule_coverage["matchedDevices"][rules[0].id] == 2
+    assert rule_coverage["decisions"].sum() == 4 * len(BatchEvaluator.default_access_masks)
+
+    entry_coverage = coverage.get_entry_coverage()
+    assert len(entry_coverage.index) == sum([len(rule.entries) for rule in rules])
+    assert entry_coverage["auditDecisions"].sum() > 0
+    assert not entry_coverage["reached"].all()
+
+    coverage.generate_csv(str(tmp_path))
+    for name in ["dc_group_coverage.csv","dc_rule_coverage.csv","dc_entry_coverage.csv"]:
+        assert os.path.isfile(os.path.join(tmp_path,name))
+
+
+def test_parquet_required(tmp_path, monkeypatch):
+
+    def missing(*args, **kwargs):
+        raise ImportError("Missing optional dependency 'pyarrow'")
+
+    monkeypatch.setattr(pd,"read_parquet",missing)
+    monkeypatch.setattr(pd.DataFrame,"to_parquet",missing)
+
+    with pytest.raises(ImportError, match="mdedevicecontrol\\[parquet\\]"):
+        DeviceInventory.load(str(tmp_path / "devices.parquet"))
+
+    with pytest.raises(ImportError, match="mdedevicecontrol\\[parquet\\]"):
+        BatchEvaluator.write(create_devices(),str(tmp_path / "decisions.parquet"))
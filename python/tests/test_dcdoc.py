@@ -1,5 +1,7 @@
 import mdedevicecontrol.dcdoc as doc
 import os
+import pickle
+import shutil
 import xml.etree.ElementTree as ET
 
 import pathlib as pl
@@ -63,3 +65,239 @@ def test_generate_mac_docs():
     
     
     
+
+
+def test_frame_buffer():
+
+    buffer = doc.FrameBuffer({"id":[],"name":[]})
+    assert len(buffer.get_frame().index) == 0
+
+    buffer.append({"id":"1","name":"first"})
+    buffer.append({"id":"2","value":3})
+
+    frame = buffer.get_frame()
+    assert list(frame.columns) == ["id","name","value"]
+    assert list(frame["id"]) == ["1","2"]
+    assert frame["value"].isna()[0]
+    assert frame["name"].isna()[1]
+    assert buffer.get_frame() is frame
+
+
+def test_inventory_frames():
+
+    inventory = doc.Inventory([str(mac_samples_dir)])
+
+    assert len(inventory.policy_rules.index) > 0
+    assert len(inventory.rule_entries.index) >= len(inventory.policy_rules.index)
+    assert set(inventory.rule_entries["ruleId"]) <= set(inventory.policy_rules["id"])
+    assert "Apple Removable Media" in inventory.entry_type_data_frames
+
+
+def test_parallel_inventory():
+
+    source_path = [str(mac_samples_dir),os.path.join(root_dir,"windows","device")]
+
+    inventory = doc.Inventory(source_path)
+    parallel_inventory = doc.Inventory(source_path,jobs=2)
+
+    assert list(parallel_inventory.policy_rules["id"]) == list(inventory.policy_rules["id"])
+    assert list(parallel_inventory.policy_rules["rule_index"]) == list(inventory.policy_rules["rule_index"])
+    assert list(parallel_inventory.groups["name"]) == list(inventory.groups["name"])
+
+    #shared objects are still shared after being parsed in another process
+    rule = parallel_inventory.policy_rules["object"][0]
+    assert rule.entry_type is inventory.policy_rules["object"][0].entry_type
+    assert rule.entries[0].enforcement is inventory.policy_rules["object"][0].entries[0].enforcement
+
+
+def test_compact_inventory():
+
+    source_path = [str(mac_samples_dir),os.path.join(root_dir,"windows","device")]
+
+    inventory = doc.Inventory(source_path)
+    compact_inventory = doc.Inventory(source_path,keep_source=False)
+
+    assert list(compact_inventory.groups["name"]) == list(inventory.groups["name"])
+
+    for group, compact_group in zip(inventory.groups["object"],compact_inventory.groups["object"]):
+        assert compact_group.get_conditions() == group.get_conditions()
+        if compact_group.format == "mac":
+            assert compact_group.root is not None
+        else:
+            assert compact_group.root is None
+
+    #the properties share the name and label of the group property
+    group = compact_inventory.groups["object"][0]
+    property = group._properties[0] if len(group._properties) > 0 else group.clauses[0]._properties[0]
+    assert not hasattr(property,"__dict__")
+    assert property.name is property.group_property.name
+    assert property.label is property.group_property.label
+
+    rule = pickle.loads(pickle.dumps(compact_inventory.policy_rules["object"][0]))
+    assert str(rule) == str(inventory.policy_rules["object"][0])
+
+
+def test_parse_cache(tmp_path):
+
+    source_dir = tmp_path / "src"
+    source_dir.mkdir()
+    for file in ["allow_all_removable_media_except_smi_instaview.json","deny_mobile_devices.json"]:
+        (source_dir / file).write_text(pl.Path(mac_samples_dir,file).read_text())
+
+    cache_dir = str(tmp_path / "cache")
+
+    cache = doc.ParseCache(cache_dir)
+    inventory = doc.Inventory([str(source_dir)],cache=cache)
+    assert cache.hits == 0 and cache.misses == 2
+
+    cache = doc.ParseCache(cache_dir)
+    cached_inventory = doc.Inventory([str(source_dir)],cache=cache)
+    assert cache.hits == 2 and cache.misses == 0
+    assert list(cached_inventory.policy_rules["id"]) == list(inventory.policy_rules["id"])
+
+    #touched files are checked with the hash
+    changed_file = source_dir / "deny_mobile_devices.json"
+    os.utime(changed_file,ns=(0,0))
+    cache = doc.ParseCache(cache_dir)
+    doc.Inventory([str(source_dir)],cache=cache)
+    assert cache.hits == 2
+
+    changed_file.write_text(changed_file.read_text()+" ")
+    cache = doc.ParseCache(cache_dir)
+    doc.Inventory([str(source_dir)],cache=cache)
+    assert cache.hits == 1 and cache.misses == 1
+
+    #a new version doesn't use the old entries
+    version = doc.ParseCache.Version
+    try:
+        doc.ParseCache.Version = version + 1
+        cache = doc.ParseCache(cache_dir)
+        doc.Inventory([str(source_dir)],cache=cache)
+        assert cache.hits == 0
+        assert os.listdir(cache.root) == [os.path.basename(cache.cache_dir)]
+    finally:
+        doc.ParseCache.Version = version
+
+
+def test_parse_cache_keeps_other_files(tmp_path):
+
+    #only the directories created by the cache are removed
+    for other in ["venv","videos","v1_notacache"]:
+        (tmp_path / other).mkdir()
+    (tmp_path / doc.ParseCache.Directory / "v0_0123456789abcdef").mkdir(parents=True)
+    (tmp_path / doc.ParseCache.Directory / "notes").mkdir()
+
+    cache = doc.ParseCache(str(tmp_path))
+    assert sorted(os.listdir(cache.root)) == sorted([os.path.basename(cache.cache_dir),"notes"])
+
+    doc.ParseCache.clear(str(tmp_path))
+    assert sorted(os.listdir(tmp_path)) == ["v1_notacache","venv","videos"]
+
+
+def test_get_group_by_id():
+
+    inventory = doc.Inventory([str(mac_samples_dir)])
+
+    group = inventory.groups["object"][0]
+    groups = inventory.get_group_by_id(group.id)
+
+    assert groups["mac"] == [group]
+    assert len(groups["oma-uri"]) == 1
+    assert inventory.get_path_for_group(group.id) == group.path
+    assert inventory.get_group_by_id("{00000000-0000-0000-0000-000000000000}") is None
+
+
+def test_rule_query():
+
+    assert doc.RuleQuery.parse("path == 'C:\\\\policies\\\\rule.xml'") == [("path","==","C:\\policies\\rule.xml",None)]
+    assert doc.RuleQuery.parse("rule_index > 1") is None
+
+    inventory = doc.Inventory([str(mac_samples_dir),os.path.join(root_dir,"windows","device")])
+
+    queries = [
+        "path.str.contains('(.*)')",
+        "format == 'mac'",
+        "format == 'gpo' and entry_type == 'Windows Removable Device'",
+        "path.str.contains('deny',regex=False) & format == 'mac'",
+        "path == '"+inventory.policy_rules["path"][0]+"'"
+    ]
+
+    for query in queries:
+        expected = list(inventory.policy_rules.query(query, engine='python').index)
+        assert inventory.get_rule_query().query(query) == expected
+
+    #rules can be found by the groups they reference
+    rule = inventory.policy_rules["object"][0]
+    group_id = rule.included_groups[0]
+    assert rule in inventory.get_rules("group == '"+group_id+"'")
+
+    #queries that aren't indexed use pandas
+    assert len(inventory.get_rules("rule_index > 0")) > 0
+
+
+def test_watch(tmp_path):
+
+    source_dir = tmp_path / "printer"
+    shutil.copytree(os.path.join(root_dir,"windows","printer"),source_dir,ignore=shutil.ignore_patterns("*.md"))
+    dest_dir = tmp_path / "docs"
+    dest_dir.mkdir()
+
+    args = DcDocArgs()
+    args.set_source_path(str(source_dir))
+    args.set_dest(str(dest_dir))
+    args.scenarios = str(source_dir / "scenarios.json")
+
+    templateEnv = doc.get_template_environment(args)
+    inventory = doc.Inventory(args.source_path)
+    scenarios = doc.load_scenarios(args.scenarios)
+    results = doc.generate_scenarios(inventory,scenarios,args,templateEnv)
+    group_count = len(inventory.groups)
+
+    watch = doc.Watch(inventory,args,templateEnv,results,scenarios)
+    assert watch.update() == []
+
+    #only the scenarios that use the changed group are generated again
+    group_file = source_dir / "Intune OMA-URI" / "Authorized USB Printer.xml"
+    group_file.write_text(group_file.read_text().replace("035E_0872","035E_0873"))
+    stat = os.stat(group_file)
+    os.utime(group_file,ns=(stat.st_atime_ns,stat.st_mtime_ns+10**9))
+
+    updated = watch.update()
+    assert os.path.join(str(source_dir),"Intune OMA-URI","Allow Authorized USB Printer.xml") in updated
+    assert os.path.join(str(source_dir),"Intune OMA-URI","Allow PDF_XPS Printer.xml") not in updated
+    assert len(updated) < len(results)
+
+    #the oma-uri row of the group is the changed group
+    result = watch.results[os.path.join(str(source_dir),"Intune OMA-URI","Allow Authorized USB Printer.xml")]["result"]
+    rows = [row for row in result["oma_uri"].values() if row.value == str(group_file)]
+    assert "035E_0873" in rows[0].object.toXML()
+    assert len(inventory.groups) == group_count
+
+
+def test_parallel_scenarios(tmp_path):
+
+    source_path = os.path.join(root_dir,"windows","printer")
+    inventory = doc.Inventory([source_path])
+    scenarios = doc.load_scenarios(os.path.join(source_path,"scenarios.json"))
+
+    docs = {}
+    for jobs in [1,2]:
+        dest_dir = tmp_path / ("jobs"+str(jobs))
+        dest_dir.mkdir()
+
+        args = DcDocArgs()
+        args.set_source_path(source_path)
+        args.set_dest(str(dest_dir))
+        args.scenarios = os.path.join(source_path,"scenarios.json")
+        args.jobs = jobs
+
+        templateEnv = doc.get_template_environment(args)
+        results = doc.generate_scenarios(inventory,scenarios,args,templateEnv)
+
+        docs[jobs] = {}
+        for file in sorted(os.listdir(dest_dir)):
+            docs[jobs][file] = (dest_dir / file).read_text()
+        docs[jobs]["results"] = list(results.keys())
+
+    #the same documentation and readme, in the same order
+    assert docs[2] == docs[1]
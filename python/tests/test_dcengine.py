@@ -0,0 +1,318 @@
+import mdedevicecontrol as dc
+import mdedevicecontrol.dcdoc as doc
+from mdedevicecontrol.dcengine import Engine, Device, DescriptorIndex, WildcardMatcher, DecisionCache, Context
+
+import os
+
+from tests import root_dir
+
+
+def create_policy():
+
+    api = dc.api()
+
+    removable_media = api.createGroup(name="Removable Media",
+            properties=[api.createProperty(dc.Group.WindowsDeviceFamilyProperty,dc.GroupProperty.WindowsRemovableMediaDevices)])
+
+    allowed_usbs = api.createGroup(name="Allowed USBs",
+            properties=[api.createProperty(dc.Group.WindowsDeviceVendorProductProperty,"0951_16*"),
+                        api.createProperty(dc.Group.WindowsDeviceSerialNumberProperty,"111111111")])
+
+    read_only = api.createEntry(permissions={
+        dc.WindowsEntryType.DiskReadMask: True,
+        dc.WindowsEntryType.FileReadMask: True
+    })
+
+    full_access = api.createEntry(permissions={
+        dc.WindowsEntryType.DiskReadMask: True,
+        dc.WindowsEntryType.DiskWriteMask: True,
+        dc.WindowsEntryType.DiskExecuteMask: True
+    })
+
+    deny_all = api.createEntry(enforcement=dc.PolicyRule.Deny,permissions={
+        dc.WindowsEntryType.DiskReadMask: True,
+        dc.WindowsEntryType.DiskWriteMask: True,
+        dc.WindowsEntryType.DiskExecuteMask: True
+    })
+
+    audit_denied = api.createEntry(enforcement=dc.PolicyRule.AuditDenied,
+            permissions={dc.WindowsEntryType.DiskWriteMask: True},
+            notifications=dc.Notifications(3,dc.Format.OMA_URI))
+
+    generic_disks = api.createGroup(name="Generic Disks",
+            properties=[api.createProperty(dc.Group.WindowsDeviceHardwareIdProperty,"USBSTOR\\DiskGeneric*"),
+                        api.createProperty(dc.Group.WindowsDeviceInstancePathProperty,"USBSTOR\\*&VEN_GENERIC&*")])
+
+    printers = api.createGroup(name="Not Removable Media",
+            match_type=dc.MatchType.ExcludeAny,
+            properties=[api.createProperty(dc.Group.WindowsDeviceFamilyProperty,dc.GroupProperty.WindowsRemovableMediaDevices)])
+
+    allow_usbs = api.createRule("Allow USBs",included_groups=[allowed_usbs],entries=[full_access])
+    read_only_rule = api.createRule("Read only removable media",included_groups=[removable_media],
+                                    excluded_groups=[allowed_usbs],entries=[read_only,deny_all,audit_denied])
+    deny_generic_disks = api.createRule("Deny generic disks",included_groups=[generic_disks],entries=[deny_all])
+    audit_other_devices = api.createRule("Audit other devices",included_groups=[printers],entries=[full_access])
+
+    groups = [removable_media,allowed_usbs,generic_disks,printers]
+    rules = [allow_usbs,read_only_rule,deny_generic_disks,audit_other_devices]
+
+    return groups, rules
+
+
+def test_evaluate():
+
+    groups, rules = create_policy()
+    engine = Engine(groups,rules)
+
+    allowed_usb = Device({
+        dc.GroupProperty.WindowsDeviceFamily: "RemovableMediaDevices",
+        dc.GroupProperty.WindowsDeviceVendorProduct: "0951-1666"
+    })
+
+    decision = engine.evaluate(allowed_usb,dc.WindowsEntryType.DiskWriteMask)
+    assert decision.enforcement == dc.PolicyRule.Allow
+    assert decision.rule.name == "Allow USBs"
+
+    other_usb = Device({
+        dc.GroupProperty.WindowsDeviceFamily: "removablemediadevices",
+        dc.GroupProperty.WindowsDeviceVendorProduct: "abcd_1234"
+    })
+
+    decision = engine.evaluate(other_usb,dc.WindowsEntryType.DiskReadMask)
+    assert decision.enforcement == dc.PolicyRule.Allow
+    assert decision.rule.name == "Read only removable media"
+
+    decision = engine.evaluate(other_usb,dc.WindowsEntryType.DiskWriteMask)
+    assert decision.enforcement == dc.PolicyRule.Deny
+    assert len(decision.audit_entries) == 1
+    assert dc.Notifications.ShowNotification in decision.get_notifications()
+
+    printer = Device({dc.GroupProperty.WindowsDeviceFamily: "PrinterDevices"})
+    decision = engine.evaluate(printer,dc.WindowsEntryType.PrintMask)
+    assert decision.is_default()
+    assert decision.enforcement == dc.PolicyRule.Allow
+
+    decision = engine.evaluate(printer,dc.WindowsEntryType.DiskReadMask)
+    assert decision.rule.name == "Audit other devices"
+
+
+def test_default_enforcement():
+
+    groups, rules = create_policy()
+    settings = dc.Settings({dc.Setting.DefaultEnforcement:"Deny"})
+    engine = Engine(groups,rules,settings)
+
+    decision = engine.evaluate({dc.GroupProperty.WindowsDeviceFamily: "WpdDevices"},dc.WindowsEntryType.PrintMask)
+    assert decision.is_default()
+    assert decision.enforcement == dc.PolicyRule.Deny
+
+
+def test_evaluate_inventory():
+
+    inventory = doc.Inventory([str(os.path.join(root_dir,"windows","device"))])
+    engine = Engine.fromInventory(inventory)
+
+    device = Device({
+        dc.GroupProperty.WindowsDeviceFamily: "RemovableMediaDevices",
+        dc.GroupProperty.WindowsDeviceInstancePath: "USBSTOR\\DISK&VEN_GENERIC&PROD_FLASH_DISK&REV_8.07\\8&2D6CBD4&0"
+    })
+
+    decision = engine.evaluate(device,dc.WindowsEntryType.DiskReadMask)
+    assert decision.enforcement is not None
+
+
+def test_descriptor_index():
+
+    groups, rules = create_policy()
+    index = DescriptorIndex(groups[:2])
+
+    assert groups[0].id in index.get_groups(dc.GroupProperty.WindowsDeviceFamily,"removablemediadevices")
+    assert groups[1].id in index.get_groups(dc.GroupProperty.WindowsDeviceSerialNumber," 111111111 ")
+    assert len(index.get_groups(dc.GroupProperty.WindowsDeviceVendorProduct,"0951_1666")) == 0
+
+    device = Device({
+        dc.GroupProperty.WindowsDeviceFamily: "RemovableMediaDevices",
+        dc.GroupProperty.WindowsDeviceSerialNumber: "111111111"
+    })
+    assert index.lookup(device) == set([groups[0].id,groups[1].id])
+
+    engine = Engine(groups,rules)
+    decision = engine.evaluate(device,dc.WindowsEntryType.DiskWriteMask)
+    assert decision.rule.name == "Allow USBs"
+
+
+def test_wildcard_matcher():
+
+    matcher = WildcardMatcher()
+    matcher.add("USBSTOR\\DISK&VEN_*","a")
+    matcher.add("USBSTOR\\DISK&VEN_GENERIC&PROD_?","b")
+    matcher.add("*.PDF","c")
+    matcher.add("C:\\USERS\\*\\DESKTOP\\*","d")
+
+    assert matcher.match("USBSTOR\\DISK&VEN_GENERIC&PROD_1") == set(["a","b"])
+    assert matcher.match("USBSTOR\\DISK&VEN_GENERIC&PROD_12") == set(["a"])
+    assert matcher.match("C:\\USERS\\BOB\\DESKTOP\\REPORT.PDF") == set(["c","d"])
+    assert matcher.match("USBSTOR\\CDROM") == set()
+
+
+def test_evaluate_wildcards():
+
+    groups, rules = create_policy()
+    engine = Engine(groups,rules)
+
+    device = Device({
+        dc.GroupProperty.WindowsDeviceFamily: "CdRomDevices",
+        dc.GroupProperty.WindowsDeviceHardwareId: ["USBSTOR\\CdRomGeneric","USBSTOR\\DiskGeneric_Flash"]
+    })
+    decision = engine.evaluate(device,dc.WindowsEntryType.DiskReadMask)
+    assert decision.rule.name == "Deny generic disks"
+
+    device = Device({
+        dc.GroupProperty.WindowsDeviceFamily: "CdRomDevices",
+        dc.GroupProperty.WindowsDeviceInstancePath: "usbstor\\disk&ven_generic&prod_flash\\1234"
+    })
+    assert groups[2].id in engine.match_groups(device)
+
+
+def test_groups_for_file():
+
+    api = dc.api()
+    documents = api.createGroup(name="Documents",group_type=dc.Group.FileGroupType,
+            properties=[api.createProperty(dc.Group.FilePathProperty,"*.docx"),
+                        api.createProperty(dc.Group.FilePathProperty,"*.pdf")])
+    desktop = api.createGroup(name="Desktop",group_type=dc.Group.FileGroupType,match_type=dc.MatchType.All,
+            properties=[api.createProperty(dc.Group.FilePathProperty,"c:\\users\\*\\desktop\\*")])
+
+    engine = Engine([documents,desktop],[])
+
+    assert engine.groups_for_file("C:\\Users\\bob\\Desktop\\report.pdf") == [documents.id,desktop.id]
+    assert engine.groups_for_file("C:\\Users\\bob\\Documents\\report.docx") == [documents.id]
+    assert engine.groups_for_file("C:\\Users\\bob\\Documents\\report.txt") == []
+
+
+def create_mac_group(id, query):
+    return dc.Group({"$type":"device","id":id,"name":id,"query":query},dc.Format.Mac)
+
+
+def test_mac_clauses():
+
+    removable = {"$type":"primaryId","value":"removable_media_devices"}
+    kingston = {"$type":"or","clauses":[
+        {"$type":"vendorId","value":"0951"},
+        {"$type":"and","clauses":[{"$type":"vendorId","value":"abcd"},{"$type":"productId","value":"1234"}]}
+    ]}
+
+    g1 = create_mac_group("g1",{"$type":"all","clauses":[removable,kingston]})
+    g2 = create_mac_group("g2",{"$type":"any","clauses":[kingston,{"$type":"serialNumber","value":"SN1"}]})
+    g3 = create_mac_group("g3",{"$type":"all","clauses":[{"$type":"and","clauses":[removable,{"$type":"groupId","value":"g2"}]}]})
+
+    engine = Engine([g1,g2,g3],[],os=Engine.MAC)
+
+    #the kingston clause is compiled once for both groups
+    keys = [key for key in engine.clause_compiler.compiled if key[0] == "or"]
+    assert len(keys) == 2
+
+    devices = [
+        ({"primaryId":"removable_media_devices","vendorId":"0951"}, ["g1","g2","g3"]),
+        ({"primaryId":"removable_media_devices","vendorId":"ABCD","productId":"1234"}, ["g1","g2","g3"]),
+        ({"primaryId":"removable_media_devices","vendorId":"abcd","productId":"9999"}, []),
+        ({"primaryId":"portable_devices","serialNumber":"sn1"}, ["g2"])
+    ]
+
+    for descriptors, group_ids in devices:
+        assert engine.match_groups(descriptors) == group_ids
+
+
+def test_evaluate_mac_inventory():
+
+    inventory = doc.Inventory([str(os.path.join(root_dir,"macOS","policy","samples"))])
+    engine = Engine.fromInventory(inventory,os=Engine.MAC)
+
+    device = Device({"primaryId":"removable_media_devices","vendorId":"0951"})
+    decision = engine.evaluate(device,dc.WindowsEntryType.DiskReadMask)
+    assert decision.rule is not None
+
+
+def test_decision_cache():
+
+    groups, rules = create_policy()
+    cache = DecisionCache(2)
+    engine = Engine(groups,rules,cache=cache)
+
+    usb = {dc.GroupProperty.WindowsDeviceFamily: "RemovableMediaDevices"}
+    same_usb = {dc.GroupProperty.WindowsDeviceFamily: " removablemediadevices"}
+    printer = {dc.GroupProperty.WindowsDeviceFamily: "PrinterDevices"}
+
+    first = engine.evaluate(usb,dc.WindowsEntryType.DiskReadMask)
+    assert engine.evaluate(same_usb,dc.WindowsEntryType.DiskReadMask) is first
+    engine.evaluate(usb,dc.WindowsEntryType.DiskWriteMask)
+    engine.evaluate(printer,dc.WindowsEntryType.DiskReadMask)
+
+    statistics = cache.get_statistics()
+    assert statistics["hits"] == 1
+    assert statistics["misses"] == 3
+    assert statistics["evictions"] == 1
+    assert len(cache) == 2
+
+    #changing the policy clears the cache
+    engine.load(groups,rules[1:])
+    decision = engine.evaluate(usb,dc.WindowsEntryType.DiskReadMask)
+    assert decision is not first
+    assert cache.get_statistics()["invalidations"] == 1
+    assert len(cache) == 1
+
+
+def test_evaluate_context():
+
+    import xml.etree.ElementTree as ET
+
+    api = dc.api()
+    printers = api.createGroup(name="Printers",
+            properties=[api.createProperty(dc.Group.WindowsDeviceFamilyProperty,dc.GroupProperty.WindowsPrinterDevices)])
+    corporate = api.createGroup(name="Corporate Network",group_type=dc.Group.NetworkGroupType,
+            properties=[api.createProperty(dc.Group.NetworkDomainProperty,dc.GroupProperty.DomainAuthenticated)])
+    documents = api.createGroup(name="Documents",group_type=dc.Group.PrintJobGroupType,
+            properties=[api.createProperty(dc.Group.PrintDocumentNameProperty,"*.docx")])
+
+    rule_xml = """<PolicyRule Id="{b4bf3ecb-cea9-450d-a3fa-fec9a73edc08}">
+        <Name>Print documents on the corporate network</Name>
+        <IncludedIdList><GroupId>"""+printers.id+"""</GroupId></IncludedIdList>
+        <ExcludedIdList></ExcludedIdList>
+        <Entry Id="{93cdb2fb-9fcd-428e-a2e1-b4b0fab19782}">
+            <Type>Allow</Type><AccessMask>64</AccessMask><Options>0</Options>
+            <Parameters MatchType="MatchAll">
+                <Network MatchType="MatchAny"><GroupId>"""+corporate.id+"""</GroupId></Network>
+                <PrintJob MatchType="MatchAny"><GroupId>"""+documents.id+"""</GroupId></PrintJob>
+            </Parameters>
+        </Entry>
+        <Entry Id="{d4a4b0a9-7f3c-4d1b-9b6b-0f2c7f1b7d11}">
+            <Type>Allow</Type><AccessMask>64</AccessMask><Options>0</Options>
+            <Sid>S-1-5-21-1</Sid>
+        </Entry>
+        <Entry Id="{3b6e0c51-5d8a-4a5e-8d2a-9b1d2a3f4c55}">
+            <Type>Deny</Type><AccessMask>64</AccessMask><Options>0</Options>
+        </Entry>
+    </PolicyRule>"""
+    rule = dc.PolicyRule(ET.fromstring(rule_xml),dc.Format.OMA_URI)
+
+    engine = Engine([printers,corporate,documents],[rule])
+    printer = Device({dc.GroupProperty.WindowsDeviceFamily: "PrinterDevices"})
+
+    #without a context the conditional entries don't apply
+    assert engine.evaluate(printer,dc.WindowsEntryType.PrintMask).enforcement == dc.PolicyRule.Deny
+
+    context = Context(network={dc.GroupProperty.NetworkDomain: "DomainAuthenticated"},
+                      print_job={dc.GroupProperty.PrintDocumentName: "report.docx"})
+    decision = engine.evaluate(printer,dc.WindowsEntryType.PrintMask,context)
+    assert decision.enforcement == dc.PolicyRule.Allow
+    assert decision.entry.id == "{93cdb2fb-9fcd-428e-a2e1-b4b0fab19782}"
+
+    #only the print job is evaluated again
+    network_memo = context.memos[Context.Network]
+    context.set_print_job({dc.GroupProperty.PrintDocumentName: "report.txt"})
+    assert engine.evaluate(printer,dc.WindowsEntryType.PrintMask,context).enforcement == dc.PolicyRule.Deny
+    assert context.memos[Context.Network] is network_memo
+
+    context.set_user_sids(["s-1-5-21-1"])
+    decision = engine.evaluate(printer,dc.WindowsEntryType.PrintMask,context)
+    assert decision.entry.id == "{d4a4b0a9-7f3c-4d1b-9b6b-0f2c7f1b7d11}"
@@ -5,6 +5,12 @@ import mdedevicecontrol as dc
 import mdedevicecontrol.dcintune as intune
 import asyncio
 import pytest
+import http.server
+import json
+import threading
+import contextlib
+import httpx
+from types import SimpleNamespace
 
 
 from msgraph_beta.generated.device_management.configuration_settings.configuration_settings_request_builder import ConfigurationSettingsRequestBuilder
@@ -25,6 +31,9 @@ from msgraph_beta.generated.models.device_management_configuration_choice_settin
 from msgraph_beta.generated.models.device_management_configuration_setting_instance_template_reference import DeviceManagementConfigurationSettingInstanceTemplateReference
 from msgraph_beta.generated.models.device_management_configuration_simple_setting_instance import DeviceManagementConfigurationSimpleSettingInstance
 
+from msgraph_beta import GraphServiceClient, GraphRequestAdapter
+from kiota_abstractions.authentication import AnonymousAuthenticationProvider
+
 pytest_plugins = ('pytest_asyncio',)
 
 def get_graph():
@@ -233,4 +242,215 @@ DeviceRegistryEvents
               
        
        result = await graph.query_ah(query)
-       logger.debug("ah2 result=result")
\ No newline at end of file
+       logger.debug("ah2 result=result")
+
+class BatchHandler(http.server.BaseHTTPRequestHandler):
+
+    #A stand-in for the Graph $batch endpoint, with reusable policy settings as the only resources
+
+    batches = []
+
+    #ids that are throttled once before they succeed
+    throttled = set()
+
+    def do_POST(self):
+        if self.path != "/$batch":
+            self.send_error(404)
+            return
+
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        BatchHandler.batches.append(body["requests"])
+
+        responses = []
+        for request in body["requests"]:
+            responses.append(dict(BatchHandler.respond(request),id=request["id"]))
+
+        content = json.dumps({"responses": responses}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type","application/json")
+        self.send_header("Content-Length",str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def respond(request):
+        path = request["url"].split("?")[0]
+        id = path.split("/")[-1]
+
+        if id.startswith("throttled") and id not in BatchHandler.throttled:
+            BatchHandler.throttled.add(id)
+            return {"status": 429, "headers": {"Retry-After": "0"}, "body": {"error": {"code": "TooManyRequests", "message": "Too many requests"}}}
+        if id == "missing":
+            return {"status": 404, "body": {"error": {"code": "NotFound", "message": "Not found"}}}
+        if request["method"] == "GET":
+            return {"status": 200, "body": {"id": id, "displayName": "group "+id}}
+        if request["method"] == "POST":
+            return {"status": 201, "body": dict(request["body"],id="new")}
+        if request["method"] == "DELETE":
+            return {"status": 204}
+        return {"status": 405}
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def local_graph():
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1",0),BatchHandler)
+    thread = threading.Thread(target=server.serve_forever,daemon=True)
+    thread.start()
+
+    BatchHandler.batches = []
+    BatchHandler.throttled = set()
+
+    #no credentials are needed for the stand-in server
+    request_adapter = GraphRequestAdapter(AnonymousAuthenticationProvider())
+    request_adapter.base_url = "http://127.0.0.1:"+str(server.server_address[1])
+
+    graph = dcgraph.Graph.__new__(dcgraph.Graph)
+    graph.graph_client = GraphServiceClient(request_adapter=request_adapter)
+    graph.scheduler = dcgraph.Scheduler(base_delay=0.01)
+    graph.batch = dcgraph.GraphBatch(graph.send_batch,graph.scheduler)
+
+    yield graph
+
+    server.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_batch(local_graph):
+
+    ids = [str(i) for i in range(25)]
+    groups = await asyncio.gather(*[local_graph.get_group_details(id) for id in ids])
+
+    assert [group.display_name for group in groups] == ["group "+id for id in ids]
+    assert [len(batch) for batch in BatchHandler.batches] == [20,5]
+    assert BatchHandler.batches[0][0]["url"].startswith("/deviceManagement/reusablePolicySettings/0")
+
+    BatchHandler.batches = []
+    created, deleted, missing = await asyncio.gather(
+        local_graph.create_group_v2(DeviceManagementConfigurationGroupSettingCollectionInstance(setting_definition_id="group"),"new group"),
+        local_graph.delete_group_v2("1"),
+        local_graph.delete_group_v2("missing"))
+
+    assert created.id == "new"
+    assert created.display_name == "new group"
+    assert deleted is None
+    assert missing.response_status_code == 404
+    assert [request["method"] for request in BatchHandler.batches[0]] == ["POST","DELETE","DELETE"]
+
+
+@pytest.mark.asyncio
+async def test_batch_throttled(local_graph):
+
+    ids = ["1","throttled1","2","throttled2"]
+    groups = await asyncio.gather(*[local_graph.get_group_details(id) for id in ids])
+
+    assert [group.display_name for group in groups] == ["group "+id for id in ids]
+    assert [len(batch) for batch in BatchHandler.batches] == [4,2]
+    assert local_graph.scheduler.throttled == 2
+
+
+@pytest.mark.asyncio
+async def test_throttle_handler():
+
+    responses = [
+        httpx.Response(429,headers={"Retry-After": "0"}),
+        httpx.Response(503),
+        httpx.Response(200,json={"id": "1"})
+    ]
+    requests = []
+
+    def respond(request):
+        requests.append(request)
+        return responses[len(requests)-1]
+
+    scheduler = dcgraph.Scheduler(base_delay=0.01)
+    handler = dcgraph.ThrottleHandler(scheduler)
+    request = httpx.Request("GET","https://graph.microsoft.com/beta/deviceManagement/configurationPolicies/1")
+
+    response = await handler.send(request,httpx.MockTransport(respond))
+
+    assert response.status_code == 200
+    assert len(requests) == 3
+    assert scheduler.requests == 3
+    assert scheduler.throttled == 2
+    assert scheduler.throttled_time > 0
+
+    #gives up after max_retries
+    scheduler = dcgraph.Scheduler(max_retries=1,base_delay=0.01)
+    handler = dcgraph.ThrottleHandler(scheduler)
+    response = await handler.send(request,httpx.MockTransport(lambda request: httpx.Response(429,headers={"Retry-After": "0"})))
+
+    assert response.status_code == 429
+    assert scheduler.requests == 2
+
+
+@pytest.mark.asyncio
+async def test_scheduler_pacing():
+
+    assert dcgraph.Scheduler.get_endpoint("https://graph.microsoft.com/beta/deviceManagement/configurationPolicies('1')/assignments") == "deviceManagement/configurationPolicies"
+    assert dcgraph.Scheduler.get_endpoint("/deviceManagement/reusablePolicySettings/7f3c4e1a-0000") == "deviceManagement/reusablePolicySettings"
+    assert dcgraph.Scheduler.get_retry_after({"retry-after": "3"}) == 3
+    assert dcgraph.Scheduler.get_retry_after({}) is None
+
+    #10 writes per second, in bursts of up to 5
+    scheduler = dcgraph.Scheduler(write_limit=5,period=0.5)
+    await asyncio.gather(*[scheduler.acquire("DELETE","/deviceManagement/reusablePolicySettings/"+str(i)) for i in range(10)])
+
+    assert scheduler.paced_time > 0.4
+
+    #reads have their own bucket
+    paced_time = scheduler.paced_time
+    await scheduler.acquire("GET","/deviceManagement/reusablePolicySettings/1")
+    assert scheduler.paced_time == paced_time
+
+
+class PagedRequestBuilder:
+
+    #A request builder for a collection of 3 pages
+
+    def __init__(self, requests, page = 0):
+        self.requests = requests
+        self.page = page
+
+    async def get(self, request_configuration = None):
+        self.requests.append(self.page)
+        await asyncio.sleep(0.01)
+        next_link = None
+        if self.page < 2:
+            next_link = "https://graph.microsoft.com/beta/items?$skiptoken="+str(self.page+1)
+        return SimpleNamespace(value=[self.page*10+i for i in range(3)],odata_next_link=next_link)
+
+    def with_url(self, raw_url):
+        return PagedRequestBuilder(self.requests,int(raw_url.split("=")[-1]))
+
+
+@pytest.mark.asyncio
+async def test_pages():
+
+    graph = dcgraph.Graph.__new__(dcgraph.Graph)
+
+    requests = []
+    items = []
+    async for item in graph.get_items(PagedRequestBuilder(requests)):
+        if item % 10 == 0:
+            #the next page is requested while this page is processed
+            await asyncio.sleep(0)
+            assert len(requests) == min(item//10+2,3)
+        items.append(item)
+
+    assert items == [0,1,2,10,11,12,20,21,22]
+
+    result = await graph.get_all_pages(PagedRequestBuilder([]))
+    assert result.value == items
+    assert result.odata_next_link is None
+
+    #stopping early cancels the next page, and doesn't request the rest of them
+    requests = []
+    async with contextlib.aclosing(graph.get_items(PagedRequestBuilder(requests))) as pages:
+        async for item in pages:
+            break
+    await asyncio.sleep(0.05)
+    assert requests[0] == 0
+    assert 2 not in requests
@@ -3,6 +3,7 @@ import mdedevicecontrol.dcintune as intune
 import os
 import asyncio
 import pytest
+from types import SimpleNamespace
 
 from tests import hash, root_dir
     
@@ -44,3 +45,87 @@ async def test_intune_export():
         print(str(e))
     
 
+
+
+class FakeDefinitionGraph:
+
+    def __init__(self, tenant_id):
+        self.tenant_id = tenant_id
+        self.requests = []
+
+    async def get_configuration_settings_for_definition(self, definition_id):
+        self.requests.append(definition_id)
+        await asyncio.sleep(0.01)
+        return {"id": definition_id, "tenant": self.tenant_id}
+
+
+@pytest.mark.asyncio
+async def test_setting_definition_cache(tmp_path):
+
+    graph = FakeDefinitionGraph("tenant-a")
+    cache = intune.SettingDefinitionCache(graph,str(tmp_path))
+
+    #concurrent requests for the same definition share one fetch
+    definitions = await asyncio.gather(*[cache.get(id) for id in ["a","b","a","a","b"]])
+    assert [definition["id"] for definition in definitions] == ["a","b","a","a","b"]
+    assert graph.requests == ["a","b"]
+
+    await cache.get("a")
+    assert graph.requests == ["a","b"]
+
+    #persisted per tenant
+    graph = FakeDefinitionGraph("tenant-a")
+    cache = intune.SettingDefinitionCache(graph,str(tmp_path))
+    assert (await cache.get("a"))["tenant"] == "tenant-a"
+    assert graph.requests == []
+
+    graph = FakeDefinitionGraph("tenant-b")
+    cache = intune.SettingDefinitionCache(graph,str(tmp_path))
+    assert (await cache.get("a"))["tenant"] == "tenant-b"
+    assert graph.requests == ["a"]
+
+    #expired
+    graph = FakeDefinitionGraph("tenant-a")
+    cache = intune.SettingDefinitionCache(graph,str(tmp_path),ttl=0)
+    await cache.get("a")
+    assert graph.requests == ["a"]
+
+
+class FakePolicyGraph(FakeDefinitionGraph):
+
+    def __init__(self, count):
+        super().__init__("tenant-a")
+        self.count = count
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def iterate_device_control_policies(self):
+        for i in range(self.count):
+            yield SimpleNamespace(id=str(i),name="policy "+str(i),description="")
+
+    async def iterate_device_control_policy_settings(self, id):
+        self.in_flight = self.in_flight + 1
+        self.max_in_flight = max(self.max_in_flight,self.in_flight)
+        #later policies finish first
+        await asyncio.sleep(0.001*(self.count-int(id)))
+        self.in_flight = self.in_flight - 1
+        return
+        yield
+
+    async def get_assignments_for_policy(self, id):
+        return SimpleNamespace(value=[])
+
+
+@pytest.mark.asyncio
+async def test_concurrent_policies():
+
+    graph = FakePolicyGraph(20)
+    template = intune.DeviceControlPolicyTemplate(graph)
+
+    policies = await template.getPolicies(None,concurrency=4)
+    assert [policy.name for policy in policies] == ["policy "+str(i) for i in range(20)]
+    assert graph.max_in_flight == 4
+
+    policy_filter = intune.PolicyFilter(included_policies=["policy 3","policy 1"])
+    policies = await template.getPolicies(policy_filter)
+    assert [policy.name for policy in policies] == ["policy 1","policy 3"]
@@ -0,0 +1,75 @@
+import mdedevicecontrol as dc
+from mdedevicecontrol.dcengine import Engine
+from mdedevicecontrol.dcreplay import Event, EventReader, Replay
+
+import os
+import json
+import pandas as pd
+
+from tests.test_dcengine import create_policy
+
+
+def create_event(vendor_id, product_id, access, verdict):
+    return {
+        "Timestamp": "2024-01-01T00:00:00Z",
+        "DeviceName": "laptop-"+vendor_id,
+        "ActionType": Event.RemovableStoragePolicyTriggered,
+        "AdditionalFields": json.dumps({
+            "MediaVendorId": vendor_id,
+            "MediaProductId": product_id,
+            "MediaClassName": "DiskDrive",
+            "RemovableStorageAccess": access,
+            "RemovableStoragePolicyVerdict": verdict
+        })
+    }
+
+
+def create_events():
+    return [
+        create_event("0951","1666","Write","Allow"),
+        create_event("abcd","1234","Read","Allow"),
+        create_event("abcd","1234","Write","Deny"),
+        create_event("abcd","1234","Write","Allow"),
+        {"ActionType": "PnpDeviceConnected", "AdditionalFields": "{}"}
+    ]
+
+
+def check_report(report, rules):
+    assert report.events == 5
+    assert report.skipped == 1
+    assert report.mismatch_count == 1
+    assert report.get_mismatches()["ExpectedEnforcement"][0] == "deny"
+
+    hits = report.get_rule_hits().set_index("rule_id")["hits"]
+    assert hits[rules[0].id] == 1
+    assert hits[rules[1].id] == 3
+
+
+def test_replay_jsonl(tmp_path):
+
+    groups, rules = create_policy()
+    engine = Engine(groups,rules)
+
+    events_file = os.path.join(tmp_path,"events.jsonl")
+    with open(events_file,"w") as out:
+        for event in create_events():
+            out.write(json.dumps(event)+"\n")
+
+    mismatch_file = os.path.join(tmp_path,"mismatches.csv")
+    report = Replay(engine).run(EventReader(events_file,chunk_size=2),mismatch_file)
+
+    check_report(report,rules)
+    assert len(pd.read_csv(mismatch_file).index) == 1
+    assert engine.cache.get_statistics()["hits"] == 1
+
+
+def test_replay_csv(tmp_path):
+
+    groups, rules = create_policy()
+    engine = Engine(groups,rules)
+
+    events_file = os.path.join(tmp_path,"events.csv")
+    pd.DataFrame(create_events()).to_csv(events_file,index=False)
+
+    report = Replay(engine).run(EventReader(events_file,chunk_size=3))
+    check_report(report,rules)
@@ -0,0 +1,49 @@
+from mdedevicecontrol.dctemplates import Templates, PrecompiledLoader
+import os
+
+
+def get_environment(compiled_path, templates_path, cache_dir):
+    Templates.environments = {}
+    packaged_path = Templates.packaged_path
+    default_compiled_path = Templates.compiled_path
+    try:
+        Templates.packaged_path = str(templates_path)
+        Templates.compiled_path = str(compiled_path)
+        return Templates.get_environment(templates_path,str(cache_dir))
+    finally:
+        Templates.packaged_path = packaged_path
+        Templates.compiled_path = default_compiled_path
+        Templates.environments = {}
+
+
+def test_shared_environment(tmp_path):
+
+    env = Templates.get_environment(None,str(tmp_path))
+    assert Templates.get_environment(Templates.packaged_path,str(tmp_path)) is env
+
+    env.get_template("readme.j2")
+    assert len(os.listdir(tmp_path)) > 0
+
+
+def test_precompiled_templates(tmp_path):
+
+    templates_path = tmp_path / "templates"
+    templates_path.mkdir()
+    (templates_path / "hello.j2").write_text("Hello {{ name }}")
+
+    compiled_path = tmp_path / "compiled"
+    assert Templates.precompile(str(templates_path),str(compiled_path)) == ["hello.j2"]
+
+    env = get_environment(compiled_path,templates_path,tmp_path / "cache")
+    assert isinstance(env.loader.loaders[0],PrecompiledLoader)
+
+    template = env.get_template("hello.j2")
+    assert template.filename.startswith(str(compiled_path))
+    assert template.render(name="world") == "Hello world"
+
+    #a changed template is loaded from the source
+    (templates_path / "hello.j2").write_text("Goodbye {{ name }}")
+    assert not template.is_up_to_date
+    template = env.get_template("hello.j2")
+    assert template.filename == str(templates_path / "hello.j2")
+    assert template.render(name="world") == "Goodbye world"
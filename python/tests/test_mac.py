@@ -1,6 +1,7 @@
 import mdedevicecontrol as dc
 import mdedevicecontrol.convert_dc_policy as convert
 import os
+import pytest
 
 from tests import root_dir
 
@@ -43,3 +44,39 @@ def test_mac_convert():
 
 
 
+
+
+def test_convert_files():
+
+    groups_file = os.path.join(str(root_dir),"windows","device","Group Policy","Demo_Groups.xml")
+    rules_file = os.path.join(str(root_dir),"windows","device","Group Policy","Demo_2_Policies.xml")
+
+    import xml.etree.ElementTree as ET
+
+    with open(groups_file) as file:
+        groups = convert.convert_groups(ET.fromstring(file.read()),False)
+
+    with open(groups_file) as file:
+        streamed_groups = convert.convert_groups_file(file,False)
+
+    assert len(groups) > 0
+    assert streamed_groups == groups
+
+    with open(rules_file) as file:
+        rules = convert.convert_rules(ET.fromstring(file.read()),False)
+
+    with open(rules_file) as file:
+        streamed_rules = convert.convert_rules_file(file,False)
+
+    assert streamed_rules == rules
+
+
+def test_convert_files_invalid_root():
+
+    import io
+
+    with pytest.raises(Exception, match="Invalid Groups XML"):
+        convert.convert_groups_file(io.StringIO("<PolicyRules/>"),False)
+
+    with pytest.raises(Exception, match="Invalid PolicyRules XML"):
+        convert.convert_rules_file(io.StringIO("<Groups></Groups>"),False)